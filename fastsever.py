@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -10,11 +10,9 @@ import socket
 from contextlib import asynccontextmanager, closing
 from typing import Dict, Optional, List, Union
 from maindouble import LearningAssistantSystem
+from severwarmup import ready_router, start_warmup, until_disconnected
 import uvicorn
-import asyncio
-from concurrent.futures import ProcessPoolExecutor
 import os
-from concurrent.futures import ThreadPoolExecutor
 
 # 配置日志
 logging.basicConfig(
@@ -24,9 +22,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 全局进程池
-process_pool = ThreadPoolExecutor() 
-
 # 应用程序生命周期管理
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -35,6 +30,7 @@ async def lifespan(app: FastAPI):
     try:
         # 初始化系统
         app.state.system = LearningAssistantSystem()
+        start_warmup(app)
         logger.info("✅ 学习助手系统初始化成功")
         yield
     except Exception as e:
@@ -42,7 +38,6 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         logger.info("🛑 学习助手API服务关闭")
-        process_pool.shutdown(wait=True)
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -54,6 +49,8 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+app.include_router(ready_router)
+
 # CORS设置
 app.add_middleware(
     CORSMiddleware,
@@ -97,16 +94,12 @@ def find_available_port(base_port: int = 54055, max_tries: int = 5) -> int:
             return port
     raise OSError(f"没有可用的端口 (尝试范围: {base_port}-{base_port + max_tries - 1})")
 
-def run_analysis_pipeline(system: LearningAssistantSystem, error_description: str):
-    """包装同步的pipeline函数，用于进程池执行"""
-    return list(system.full_analysis_pipeline(error_description))
-
 # 核心API
 @app.post("/v1/analyze", response_class=StreamingResponse)
-async def full_analysis_stream(request: AnalysisRequest):
+async def full_analysis_stream(request: AnalysisRequest, http_request: Request):
     """
     完整分析流程接口 (流式+完整返回)
-    使用进程池并行处理CPU密集型任务
+    检索与LLM调用走异步路径，不阻塞事件循环
     """
     # 请求标识处理
     request_id = request.request_id or generate_id("req_")
@@ -140,17 +133,10 @@ async def full_analysis_stream(request: AnalysisRequest):
                 }
             }) + "\n"
             
-            # 将CPU密集型任务放入进程池执行
-            loop = asyncio.get_event_loop()
-            chunks = await loop.run_in_executor(
-                process_pool,
-                run_analysis_pipeline,
-                app.state.system,
-                request.error_description
-            )
-            
-            # 流式返回结果
-            for chunk in chunks:
+            # 检索与LLM调用在线程池中执行，不阻塞事件循环；客户端断开时停止并取消进行中的检索
+            async for chunk in until_disconnected(
+                http_request, app.state.system.afull_analysis_pipeline(request.error_description)
+            ):
                 full_response += chunk
                 yield json.dumps({
                     "data": chunk,
@@ -204,7 +190,7 @@ async def full_analysis_stream(request: AnalysisRequest):
 async def full_analysis_sync(request: AnalysisRequest):
     """
     完整分析流程接口 (仅返回最终结果)
-    使用进程池并行处理CPU密集型任务
+    检索与LLM调用走异步路径，不阻塞事件循环
     """
     # 请求标识处理
     request_id = request.request_id or generate_id("req_")
@@ -229,15 +215,9 @@ async def full_analysis_sync(request: AnalysisRequest):
         import time
         start_time = time.time()
         
-        loop = asyncio.get_event_loop()
-        chunks = await loop.run_in_executor(
-            process_pool,
-            run_analysis_pipeline,
-            app.state.system,
-            request.error_description
-        )
-        
-        full_response = "".join(chunks)
+        full_response = "".join([
+            chunk async for chunk in app.state.system.afull_analysis_pipeline(request.error_description)
+        ])
         processing_time = int((time.time() - start_time) * 1000)  # 转换为毫秒
         
         logger.info(f"✅ 同步分析完成 [user={user_id}, req={request_id}, bytes={len(full_response)}, time={processing_time}ms]")
@@ -273,7 +253,7 @@ async def health_check():
         "status": "healthy",
         "version": app.version,
         "system": "available" if hasattr(app.state, "system") else "unavailable",
-        "process_pool": "running" if not process_pool._shutdown else "shutdown"
+        "ready": getattr(app.state, "ready", False)
     }
 
 @app.get("/users/{user_id}/status")
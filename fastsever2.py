@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -10,6 +10,7 @@ import socket
 from contextlib import asynccontextmanager, closing
 from typing import Dict, Optional, List, Union
 from maindouble import LearningAssistantSystem
+from severwarmup import ready_router, start_warmup, until_disconnected
 import uvicorn  # 确保导入uvicorn
 
 # 配置日志
@@ -28,6 +29,7 @@ async def lifespan(app: FastAPI):
     try:
         # 初始化系统
         app.state.system = LearningAssistantSystem()
+        start_warmup(app)
         logger.info("✅ 学习助手系统初始化成功")
         yield
     except Exception as e:
@@ -46,6 +48,8 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+app.include_router(ready_router)
+
 # CORS设置
 app.add_middleware(
     CORSMiddleware,
@@ -91,7 +95,7 @@ def find_available_port(base_port: int = 8000, max_tries: int = 10) -> int:
 
 # 核心API
 @app.post("/v1/analyze", response_class=StreamingResponse)
-async def full_analysis_stream(request: AnalysisRequest):
+async def full_analysis_stream(request: AnalysisRequest, http_request: Request):
     """
     完整分析流程接口 (流式+完整返回)
     """
@@ -128,7 +132,9 @@ async def full_analysis_stream(request: AnalysisRequest):
             }) + "\n"
             
             # 执行分析流程
-            for chunk in app.state.system.full_analysis_pipeline(request.error_description):
+            async for chunk in until_disconnected(
+                http_request, app.state.system.afull_analysis_pipeline(request.error_description)
+            ):
                 full_response += chunk
                 yield json.dumps({
                     "data": chunk,
@@ -207,7 +213,7 @@ async def full_analysis_sync(request: AnalysisRequest):
         start_time = time.time()
         
         full_response = ""
-        for chunk in app.state.system.full_analysis_pipeline(request.error_description):
+        async for chunk in app.state.system.afull_analysis_pipeline(request.error_description):
             full_response += chunk
             
         processing_time = int((time.time() - start_time) * 1000)  # 转换为毫秒
@@ -244,7 +250,8 @@ async def health_check():
     return {
         "status": "healthy",
         "version": app.version,
-        "system": "available" if hasattr(app.state, "system") else "unavailable"
+        "system": "available" if hasattr(app.state, "system") else "unavailable",
+        "ready": getattr(app.state, "ready", False)
     }
 
 @app.get("/users/{user_id}/status")
@@ -1,6 +1,6 @@
 # maindouble.py 全过程主程序
 import logging
-from typing import Generator, Optional
+from typing import AsyncGenerator, Generator, Optional
 from src.llm.dynamic import DynamicPromptEngine, get_knowledge_configs, get_exercise_configs
 class ErrorAnalysisAssistant:
     """错题分析助手"""
@@ -43,22 +43,10 @@ class ErrorAnalysisAssistant:
         返回:
             生成器，流式输出分析结果
         """
-        # 1. 设置预设的系统提示
-        self.engine.current_enhanced_prompt = self.system_prompt
-        self.engine.is_first_query = False  # 跳过提示生成阶段
-        
-        # 2. 构建完整的用户输入
-        user_input = f"""请分析以下错题：
-        
-【错题描述】
-{error_description}
-
-请按照要求进行专业分析："""
-        
-        # 3. 开始对话并流式返回结果
+        # 开始对话并流式返回结果
         try:
             response_generator = self.engine.start_conversation(
-                original_query=user_input,
+                original_query=self._prepare(error_description),
                 verbose=True
             )
             
@@ -72,6 +60,34 @@ class ErrorAnalysisAssistant:
             logging.error(f"错题分析失败: {str(e)}")
             yield "抱歉，分析过程中出现错误，请稍后再试。"
 
+    async def aanalyze_error(self, error_description: str) -> AsyncGenerator[str, None]:
+        """analyze_error 的异步版本（服务端请求路径，检索与LLM调用不阻塞事件循环）"""
+        try:
+            yield "\n【错题分析开始】\n"
+            async for chunk in self.engine.astart_conversation(
+                original_query=self._prepare(error_description),
+                verbose=True
+            ):
+                yield chunk
+            yield "\n【分析完成】\n"
+        except Exception as e:
+            logging.error(f"错题分析失败: {str(e)}")
+            yield "抱歉，分析过程中出现错误，请稍后再试。"
+
+    def _prepare(self, error_description: str) -> str:
+        """设置预设的系统提示并构建用户输入"""
+        # 1. 设置预设的系统提示
+        self.engine.current_enhanced_prompt = self.system_prompt
+        self.engine.is_first_query = False  # 跳过提示生成阶段
+        
+        # 2. 构建完整的用户输入
+        return f"""请分析以下错题：
+        
+【错题描述】
+{error_description}
+
+请按照要求进行专业分析："""
+
 
 class ExerciseRecommendationAssistant:
     """题目推荐助手"""
@@ -115,6 +131,40 @@ class ExerciseRecommendationAssistant:
         返回:
             生成器，流式输出推荐结果
         """
+        # 开始对话并流式返回结果
+        try:
+            response_generator = self.engine.start_conversation(
+                original_query=self._prepare(error_analysis, knowledge_points),
+                verbose=True
+            )
+            
+            yield "\n【题目推荐开始】\n"
+            for chunk in response_generator:
+                yield chunk
+            yield "\n【推荐完成】\n"
+            
+        except Exception as e:
+            logging.error(f"题目推荐失败: {str(e)}")
+            yield "抱歉，推荐过程中出现错误，请稍后再试。"
+
+    async def arecommend_exercises(self,
+                                   error_analysis: Optional[str] = None,
+                                   knowledge_points: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """recommend_exercises 的异步版本（服务端请求路径，检索与LLM调用不阻塞事件循环）"""
+        try:
+            yield "\n【题目推荐开始】\n"
+            async for chunk in self.engine.astart_conversation(
+                original_query=self._prepare(error_analysis, knowledge_points),
+                verbose=True
+            ):
+                yield chunk
+            yield "\n【推荐完成】\n"
+        except Exception as e:
+            logging.error(f"题目推荐失败: {str(e)}")
+            yield "抱歉，推荐过程中出现错误，请稍后再试。"
+
+    def _prepare(self, error_analysis: Optional[str], knowledge_points: Optional[str]) -> str:
+        """设置预设的系统提示并构建用户输入"""
         # 设置预设的系统提示
         self.engine.current_enhanced_prompt = self.system_prompt
         self.engine.is_first_query = False
@@ -141,22 +191,7 @@ class ExerciseRecommendationAssistant:
             user_input = """请推荐一些适合高中学生的综合练习题：
             
 请按照要求推荐题目："""
-        
-        # 开始对话并流式返回结果
-        try:
-            response_generator = self.engine.start_conversation(
-                original_query=user_input,
-                verbose=True
-            )
-            
-            yield "\n【题目推荐开始】\n"
-            for chunk in response_generator:
-                yield chunk
-            yield "\n【推荐完成】\n"
-            
-        except Exception as e:
-            logging.error(f"题目推荐失败: {str(e)}")
-            yield "抱歉，推荐过程中出现错误，请稍后再试。"
+        return user_input
 
 
 class LearningAssistantSystem:
@@ -166,6 +201,15 @@ class LearningAssistantSystem:
         self.error_analyzer = ErrorAnalysisAssistant()
         self.exercise_recommender = ExerciseRecommendationAssistant()
     
+    def warmup(self) -> None:
+        """预热两个助手的检索器（首个真实请求不再承担冷启动开销）"""
+        self.error_analyzer.engine.warmup()
+        self.exercise_recommender.engine.warmup()
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.error_analyzer.engine.is_ready and self.exercise_recommender.engine.is_ready
+    
     def full_analysis_pipeline(self, error_description: str) -> Generator[str, None, None]:
         """
         完整的分析流程：错题分析 -> 题目推荐
@@ -194,6 +238,28 @@ class LearningAssistantSystem:
         ):
             yield chunk
     
+    async def afull_analysis_pipeline(self, error_description: str) -> AsyncGenerator[str, None]:
+        """
+        full_analysis_pipeline 的异步版本（API服务使用）
+        知识检索与LLM流式调用均不阻塞事件循环；客户端断开时关闭该生成器即取消进行中的检索
+        """
+        # 第一阶段：错题分析
+        analysis_result = []
+        yield "\n=== 第一阶段：错题分析 ===\n"
+        async for chunk in self.error_analyzer.aanalyze_error(error_description):
+            analysis_result.append(chunk)
+            yield chunk
+
+        knowledge_points = self._extract_knowledge_points("".join(analysis_result))
+
+        # 第二阶段：题目推荐
+        yield "\n=== 第二阶段：题目推荐 ===\n"
+        async for chunk in self.exercise_recommender.arecommend_exercises(
+            error_analysis="".join(analysis_result),
+            knowledge_points=knowledge_points
+        ):
+            yield chunk
+    
     def _extract_knowledge_points(self, analysis_text: str) -> str:
         """从分析文本中提取知识点（简化版）"""
         # 这里可以添加更复杂的文本处理逻辑
@@ -0,0 +1,51 @@
+# severwarmup.py - 各API服务共用的后台模型预热、就绪检查与流式响应的断开处理
+import asyncio
+import logging
+from typing import AsyncGenerator
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# 就绪检查路由（各服务 app.include_router(ready_router)）
+ready_router = APIRouter()
+
+
+async def warmup_system(app: FastAPI):
+    """后台预热检索模型，完成后服务才报告就绪"""
+    try:
+        await asyncio.to_thread(app.state.system.warmup)
+        app.state.ready = True
+        logger.info("✅ 模型预热完成，服务就绪")
+    except Exception as e:
+        logger.error(f"❌ 模型预热失败: {str(e)}")
+
+
+def start_warmup(app: FastAPI):
+    """在lifespan中初始化系统后调用：预热在后台进行，/health 立即可用，/ready 在预热完成后才返回就绪"""
+    app.state.ready = False
+    app.state.warmup_task = asyncio.create_task(warmup_system(app))
+
+
+@ready_router.get("/ready")
+async def readiness_check(request: Request):
+    """就绪检查（模型预热完成前返回503，供负载均衡/编排系统判断是否转发流量）"""
+    if getattr(request.app.state, "ready", False):
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content={"status": "warming_up"})
+
+
+async def until_disconnected(request: Request, chunks: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    转发流式分析结果，客户端断开后停止
+    断开时（或响应任务被取消时）关闭上游异步生成器，进行中的检索随之取消，不再继续调用LLM
+    """
+    try:
+        async for chunk in chunks:
+            if await request.is_disconnected():
+                logger.info("🔌 客户端已断开，停止分析")
+                return
+            yield chunk
+    finally:
+        await chunks.aclose()
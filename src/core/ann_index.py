@@ -0,0 +1,311 @@
+# ann_index.py - FAISS索引类型（Flat / HNSW / IVF / 量化压缩）的构建、查询参数与召回率基准
+import argparse
+import json
+import logging
+import math
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from src.core.bm25_index import _replace_file
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "sq8", "fp16", "ivfpq")
+INDEX_META_FILENAME = "index_meta.json"
+VECTORS_FILENAME = "vectors.npy"
+
+# 构建参数与查询参数的默认值（查询参数可在检索器中按查询调整）
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "ivf": {"nlist": None, "nprobe": 16},
+    # 标量量化：每维8bit / 16bit
+    "sq8": {},
+    "fp16": {},
+    # 乘积量化：m个子空间、每个子空间nbits位编码
+    "ivfpq": {"nlist": None, "m": None, "nbits": 8, "nprobe": 16}
+}
+SEARCH_PARAM_KEYS = {
+    "flat": (), "hnsw": ("efSearch",), "ivf": ("nprobe",), "sq8": (), "fp16": (), "ivfpq": ("nprobe",)
+}
+_IVF_TYPES = ("ivf", "ivfpq")
+
+
+def resolve_index_params(index_type: str, num_vectors: int, dim: int, params: Optional[Dict] = None) -> Dict:
+    """
+    合并默认参数
+    - IVF未指定nlist时取 4*sqrt(N)（并保证每个簇至少约39个训练样本）
+    - PQ未指定m时取不超过 dim/8 的最大约数；nbits按训练样本数下调（每个码本中心至少约39个样本）
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+    resolved = {**DEFAULT_INDEX_PARAMS[index_type], **(params or {})}
+    if index_type in _IVF_TYPES and not resolved.get("nlist"):
+        resolved["nlist"] = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+    if index_type == "ivfpq":
+        if not resolved.get("m"):
+            resolved["m"] = max(m for m in range(1, max(dim // 8, 1) + 1) if dim % m == 0)
+        resolved["nbits"] = int(max(1, min(resolved["nbits"], math.floor(math.log2(max(num_vectors // 39, 2))))))
+    return resolved
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat", params: Optional[Dict] = None) -> Tuple[faiss.Index, Dict]:
+    """
+    构建空索引（IVF/量化索引会先在向量上训练），向量由调用方按顺序添加
+    :param vectors: 全部向量（float32，用于确定维度与训练）
+    :param index_type: flat / hnsw / ivf / sq8 / fp16 / ivfpq
+    :param params: 构建与查询参数
+    :return: (索引, 实际使用的参数)
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    params = resolve_index_params(index_type, len(vectors), dim, params)
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(params["M"]))
+        index.hnsw.efConstruction = int(params["efConstruction"])
+    elif index_type in ("sq8", "fp16"):
+        qtype = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+        index.train(vectors)
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, int(params["nlist"]))
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, int(params["nlist"]), int(params["m"]), int(params["nbits"]))
+        index.train(vectors)
+        # 支持按ID重建向量（余弦级联、基准测试需要）
+        index.make_direct_map()
+    apply_search_params(index, index_type, params)
+    return index, params
+
+
+def make_id_mapped(index: faiss.Index, index_type: str) -> faiss.Index:
+    """
+    包装为按自定义ID（文本块行号）增删的索引
+    IVF自带ID，改用哈希直接映射以同时支持按ID重建与删除；其余类型外套 IndexIDMap2
+    """
+    if index_type in _IVF_TYPES:
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def supports_remove(index_type: str) -> bool:
+    """索引是否支持按ID删除（HNSW图不支持，删除后需重建）"""
+    return index_type != "hnsw"
+
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def apply_search_params(index: faiss.Index, index_type: str, params: Dict) -> None:
+    """把查询参数设为索引默认值"""
+    if index_type == "hnsw" and "efSearch" in params:
+        _base_index(index).hnsw.efSearch = int(params["efSearch"])
+    elif index_type in _IVF_TYPES and "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = int(params["nprobe"])
+
+
+def make_search_parameters(index_type: str, params: Optional[Dict]):
+    """按查询传入的搜索参数对象（线程安全，不修改共享索引）；无参数时返回None"""
+    params = {key: params[key] for key in SEARCH_PARAM_KEYS[index_type] if params and key in params}
+    if not params:
+        return None
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=int(params["efSearch"]))
+    return faiss.SearchParametersIVF(nprobe=int(params["nprobe"]))
+
+
+def read_index_mmap(path) -> faiss.Index:
+    """
+    以mmap方式只读打开索引文件（向量/编码数据不复制进进程私有内存，多进程共享页缓存）
+    当前faiss版本不支持时退回普通读取
+    """
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(str(path), flags)
+    except RuntimeError as e:
+        logging.warning(f"⚠️ 索引不支持mmap加载，改为完整读入内存: {str(e)}")
+        return faiss.read_index(str(path))
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """索引占用内存（以序列化大小近似）"""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def refine_exact(vectors: np.ndarray, queries: np.ndarray, candidate_ids: np.ndarray,
+                 k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    用原始float32向量对压缩索引的候选做精确L2重排
+    :param vectors: 原始向量（可为mmap数组，只读取候选所在行）
+    :param queries: 查询向量 (Q, d)
+    :param candidate_ids: 压缩索引返回的候选ID (Q, k')，-1表示空位
+    :param k: 返回数量
+    :return: (距离 (Q, k), ID (Q, k))，不足k个时以 inf / -1 填充
+    """
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(queries, candidate_ids)):
+        # 升序读取候选行，mmap时顺序访问页
+        candidates = np.sort(candidates[candidates >= 0])
+        if len(candidates) == 0:
+            continue
+        diff = np.asarray(vectors[candidates], dtype=np.float32) - query
+        exact = np.einsum("ij,ij->i", diff, diff)
+        order = np.argsort(exact, kind="stable")[:k]
+        distances[row, :len(order)] = exact[order]
+        ids[row, :len(order)] = candidates[order]
+    return distances, ids
+
+
+def save_index_meta(db_path, index_type: str, params: Dict, dim: int, ntotal: int,
+                    memory_bytes: Optional[int] = None, num_rows: Optional[int] = None,
+                    embedding_backend: Optional[str] = None) -> None:
+    """
+    保存索引类型与参数（与index.faiss同目录）
+    :param num_rows: 文本块行数（含已删除的空行，增量更新后可大于ntotal）
+    :param embedding_backend: 生成向量的嵌入后端（torch/onnx/onnx-int8）
+    """
+    meta = {"index_type": index_type, "params": params, "dim": dim, "ntotal": ntotal, "metric": "l2",
+            "memory_bytes": memory_bytes, "num_rows": ntotal if num_rows is None else num_rows,
+            "embedding_backend": embedding_backend}
+    # 原子替换：检索进程在保存过程中加载时不会读到截断的JSON
+    _replace_file(
+        Path(db_path) / INDEX_META_FILENAME,
+        lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+    )
+
+
+def load_index_meta(db_path) -> Dict:
+    """读取索引类型与参数（旧版向量库无该文件，视为flat）"""
+    meta_path = Path(db_path) / INDEX_META_FILENAME
+    if not meta_path.exists():
+        return {"index_type": "flat", "params": {}}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    return exact.search(queries, k)[1]
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    """近似结果与精确结果的平均top-k重合率"""
+    k = truth.shape[1]
+    hits = [len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found)]
+    return float(np.mean(hits)) / k
+
+
+def benchmark_index(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    index_type: str,
+    build_params: Optional[Dict] = None,
+    search_grid: Iterable[Dict] = ({},),
+    k: int = 10,
+    refine_factor: Optional[int] = None
+) -> List[Dict]:
+    """
+    召回率-延迟基准：以精确检索为基准，测量不同查询参数下的recall@k与单查询延迟
+    :param vectors: 库向量
+    :param queries: 查询向量
+    :param index_type: 待测索引类型
+    :param build_params: 构建参数
+    :param search_grid: 查询参数组合（如 [{"efSearch": 16}, {"efSearch": 64}]）
+    :param k: top-k
+    :param refine_factor: 设置时先取 k*refine_factor 个候选，再用原始向量精确重排
+    :return: 每组参数的 recall@k、召回损失、索引内存（MB）、平均/p99延迟（毫秒）、构建耗时
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    truth = _exact_neighbors(vectors, queries, k)
+
+    started = time.perf_counter()
+    index, params = build_index(vectors, index_type, build_params)
+    index.add(vectors)
+    build_ms = (time.perf_counter() - started) * 1000
+    memory_mb = index_memory_bytes(index) / 2 ** 20
+    fetch_k = k * refine_factor if refine_factor else k
+
+    rows = []
+    for search_params in search_grid:
+        search_obj = make_search_parameters(index_type, search_params)
+        latencies, found = [], []
+        for query in queries:
+            begin = time.perf_counter()
+            _, ids = index.search(query[None, :], fetch_k, params=search_obj)
+            if refine_factor:
+                _, ids = refine_exact(vectors, query[None, :], ids, k)
+            latencies.append((time.perf_counter() - begin) * 1000)
+            found.append(ids[0])
+        recall = recall_at_k(truth, np.vstack(found))
+        rows.append({
+            "index_type": index_type,
+            "build_params": params,
+            "search_params": dict(search_params),
+            "refine_factor": refine_factor,
+            f"recall@{k}": recall,
+            "recall_loss": 1.0 - recall,
+            "memory_mb": memory_mb,
+            "raw_memory_mb": vectors.nbytes / 2 ** 20,
+            "mean_ms": float(np.mean(latencies)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "build_ms": build_ms
+        })
+    return rows
+
+
+DEFAULT_SEARCH_GRIDS = {
+    "flat": [{}],
+    "hnsw": [{"efSearch": ef} for ef in (16, 32, 64, 128, 256)],
+    "ivf": [{"nprobe": n} for n in (1, 4, 8, 16, 32, 64)],
+    "sq8": [{}],
+    "fp16": [{}],
+    "ivfpq": [{"nprobe": n} for n in (4, 16, 64)]
+}
+
+
+# ---------------------------- 基准测试 ----------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS索引召回率-延迟基准（以精确检索为基准）")
+    parser.add_argument("--db", default="./data/vector_db", help=f"向量库目录（需包含 {VECTORS_FILENAME}）")
+    parser.add_argument("--types", default="flat,hnsw,ivf,sq8,fp16,ivfpq", help="待测索引类型，逗号分隔")
+    parser.add_argument("--refine", type=int, default=0, help="压缩索引的精确重排倍数（0表示不重排）")
+    parser.add_argument("--queries", type=int, default=200, help="从库中抽样作为查询的向量数")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(module)s - %(message)s")
+    vectors = np.load(Path(args.db) / VECTORS_FILENAME, mmap_mode="r")
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    # 抽样向量加微小扰动作为查询，避免与库向量完全重合
+    queries = np.asarray(vectors[np.sort(sample)]) + rng.normal(0, 1e-3, (len(sample), vectors.shape[1])).astype(np.float32)
+
+    print(f"\n=== {args.db}: {len(vectors)} 条向量, {len(queries)} 条查询, k={args.k} ===")
+    for index_type in args.types.split(","):
+        refine_options = [None, args.refine] if args.refine and index_type in ("sq8", "fp16", "ivfpq") else [None]
+        for refine in refine_options:
+            rows = benchmark_index(
+                np.asarray(vectors), queries, index_type,
+                search_grid=DEFAULT_SEARCH_GRIDS[index_type], k=args.k, refine_factor=refine
+            )
+            for row in rows:
+                name = index_type + (f"+refine{refine}" if refine else "")
+                print(f"{name:14s} {json.dumps(row['search_params']):18s} "
+                      f"recall@{args.k}={row[f'recall@{args.k}']:.4f}  loss={row['recall_loss']:.4f}  "
+                      f"mem={row['memory_mb']:.1f}MB/{row['raw_memory_mb']:.1f}MB  mean={row['mean_ms']:.3f}ms  "
+                      f"p99={row['p99_ms']:.3f}ms  build={row['build_ms']:.0f}ms")
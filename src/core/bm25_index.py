@@ -0,0 +1,446 @@
+# bm25_index.py - 基于jieba分词与倒排索引的BM25检索引擎
+import hashlib
+import json
+import logging
+import os
+import re
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import jieba
+import numpy as np
+from scipy import sparse
+
+# 持久化格式版本（数据布局或分词规则变化时递增）
+BM25_FORMAT_VERSION = 1
+BM25_DIRNAME = "bm25"
+_ARRAY_FIELDS = ("indptr", "postings_docs", "postings_tf", "doc_len", "idf", "term_max")
+
+# BM25使用的中文停用词
+BM25_STOPWORDS = {
+    '的', '了', '是', '在', '和', '有', '就', '这', '为', '与',
+    '也', '要', '对', '都', '而', '及', '等', '可以', '我', '我们',
+    '他们', '那', '你', '您', '吧', '啊', '哦', '呀', '啦',
+    '吗', '嗯', '唉', '之', '者', '或', '个', '很', '太',
+    '更', '非常', '会', '并', '但', '已', '由', '被', '让', '把',
+    '向', '又', '再', '呢', '其', '如', '则', '于', '以', '所',
+    '什么', '怎么', '如何', '哪些', '一个', '一种', '这个', '那个'
+}
+
+_PUNCT_PATTERN = re.compile(r"^[\W_]+$")
+
+
+def tokenize(text: str, stopwords: Optional[Set[str]] = None) -> List[str]:
+    """
+    中文分词（jieba搜索引擎模式），去除停用词、空白与标点
+    :param text: 输入文本
+    :param stopwords: 停用词集合（默认BM25_STOPWORDS）
+    :return: 词项列表
+    """
+    stopwords = BM25_STOPWORDS if stopwords is None else stopwords
+    tokens = []
+    for token in jieba.lcut_for_search(text):
+        token = token.strip().lower()
+        if not token or token in stopwords or _PUNCT_PATTERN.match(token):
+            continue
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25倒排索引（CSR布局）
+    - vocab: 词项 -> 词项ID
+    - indptr: 词项ID对应的倒排表区间 [indptr[t], indptr[t+1])
+    - postings_docs / postings_tf: 按文档ID升序排列的倒排文档与词频
+    - doc_len / idf / term_max: 文档长度、逆文档频率、词项得分上界（用于MaxScore剪枝）
+    """
+
+    def __init__(
+        self,
+        vocab: Dict[str, int],
+        indptr: np.ndarray,
+        postings_docs: np.ndarray,
+        postings_tf: np.ndarray,
+        doc_len: np.ndarray,
+        idf: np.ndarray,
+        term_max: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        stopwords: Optional[Set[str]] = None
+    ):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.idf = idf
+        self.term_max = term_max
+        self.k1 = k1
+        self.b = b
+        self.stopwords = stopwords
+        self.num_docs = len(doc_len)
+        self.avgdl = float(doc_len.mean()) if self.num_docs else 0.0
+        self._impact_matrix: Optional[sparse.csr_matrix] = None
+
+    @classmethod
+    def build(
+        cls,
+        texts: Iterable[str],
+        k1: float = 1.5,
+        b: float = 0.75,
+        stopwords: Optional[Set[str]] = None
+    ) -> "BM25Index":
+        """
+        由文本集合构建索引
+        :param texts: 文档文本（文档ID即其位置）
+        :param k1: 词频饱和参数
+        :param b: 文档长度归一化参数
+        :param stopwords: 停用词集合
+        :return: BM25Index
+        """
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doc_len: List[int] = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text, stopwords)
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        return cls.from_triples(
+            vocab,
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32),
+            np.asarray(doc_len, dtype=np.float32),
+            k1=k1, b=b, stopwords=stopwords
+        )
+
+    @classmethod
+    def from_triples(
+        cls,
+        vocab: Dict[str, int],
+        term_ids: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        stopwords: Optional[Set[str]] = None
+    ) -> "BM25Index":
+        """由 (词项, 文档, 词频) 三元组构建CSR倒排表"""
+        num_terms = len(vocab)
+        num_docs = len(doc_len)
+
+        # 按 (词项, 文档) 排序，保证每个倒排表内文档ID升序
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids = term_ids[order]
+        postings_docs = np.ascontiguousarray(doc_ids[order], dtype=np.int32)
+        postings_tf = np.ascontiguousarray(tfs[order], dtype=np.float32)
+
+        df = np.bincount(term_ids, minlength=num_terms)
+        indptr = np.zeros(num_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        # 非负IDF（Lucene形式），避免小语料中常见词得到负分
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        index = cls(
+            vocab, indptr, postings_docs, postings_tf,
+            np.asarray(doc_len, dtype=np.float32), idf,
+            np.zeros(num_terms, dtype=np.float32),
+            k1=k1, b=b, stopwords=stopwords
+        )
+        if len(postings_docs):
+            impacts = index._impacts(term_ids, postings_docs, postings_tf)
+            term_max = np.zeros(num_terms, dtype=np.float32)
+            np.maximum.at(term_max, term_ids, impacts)
+            index.term_max = term_max
+        return index
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def _impacts(self, term_ids: np.ndarray, docs: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        """计算倒排项的BM25得分贡献"""
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / max(self.avgdl, 1e-9))
+        return (self.idf[term_ids] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def query_terms(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """查询分词并映射为 (词项ID, 查询词频)，忽略未登录词"""
+        counts = Counter(t for t in tokenize(query, self.stopwords) if t in self.vocab)
+        terms = np.fromiter((self.vocab[t] for t in counts), dtype=np.int64, count=len(counts))
+        qtf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return terms, qtf
+
+    def _postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[term], self.indptr[term + 1]
+        docs = self.postings_docs[start:end]
+        tf = self.postings_tf[start:end]
+        return docs, self._impacts(np.full(len(docs), term), docs, tf)
+
+    def _score_exhaustive(self, terms: np.ndarray, qtf: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """只对包含查询词的文档计分"""
+        parts = [self._postings(t) for t in terms]
+        docs = np.concatenate([d for d, _ in parts])
+        weights = np.concatenate([w.astype(np.float64) * q for (_, w), q in zip(parts, qtf)])
+        cand, inverse = np.unique(docs, return_inverse=True)
+        return cand, np.bincount(inverse, weights=weights).astype(np.float32)
+
+    def _score_maxscore(
+        self, terms: np.ndarray, qtf: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        MaxScore安全剪枝（按词项逐个累加）：
+        当剩余词项得分上界之和不超过当前第k名得分时，不再接纳新文档，
+        只为已有候选累加分数；结果与穷举计分的top-k一致。
+        """
+        upper = self.term_max[terms] * qtf
+        order = np.argsort(-upper)
+        # rest[j]: 第j个及之后词项的得分上界之和
+        rest = np.zeros(len(order) + 1, dtype=np.float64)
+        rest[:-1] = np.cumsum(upper[order][::-1])[::-1]
+
+        # 分数以float64累加，保证与穷举计分、批量计分结果一致
+        cand = np.empty(0, dtype=np.int32)
+        scores = np.empty(0, dtype=np.float64)
+        for j, i in enumerate(order):
+            docs, weights = self._postings(terms[i])
+            weights = weights.astype(np.float64) * qtf[i]
+            theta = _kth_largest(scores, top_k)
+
+            if theta is not None and rest[j] + 1e-5 < theta:
+                # 新文档不可能进入top-k，只更新已有候选
+                pos = np.minimum(np.searchsorted(docs, cand), len(docs) - 1)
+                hit = docs[pos] == cand
+                scores[hit] += weights[pos[hit]]
+            else:
+                merged = np.concatenate([cand, docs])
+                merged_w = np.concatenate([scores, weights])
+                cand, inverse = np.unique(merged, return_inverse=True)
+                scores = np.bincount(inverse, weights=merged_w)
+
+            theta = _kth_largest(scores, top_k)
+            if theta is not None:
+                # 候选即使获得全部剩余上界也无法进入top-k时剔除（留出浮点误差余量）
+                keep = scores + rest[j + 1] + 1e-5 >= theta
+                cand, scores = cand[keep], scores[keep]
+        return cand, scores.astype(np.float32)
+
+    def search(self, query: str, top_k: int = 10, prune: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索
+        :param query: 查询文本
+        :param top_k: 返回数量
+        :param prune: 是否启用MaxScore剪枝
+        :return: (文档ID数组, BM25得分数组)，按得分降序
+        """
+        terms, qtf = self.query_terms(query)
+        if len(terms) == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if prune and len(terms) > 1:
+            cand, scores = self._score_maxscore(terms, qtf, top_k)
+        else:
+            cand, scores = self._score_exhaustive(terms, qtf)
+        return top_k_select(cand, scores, top_k)
+
+
+    def impact_matrix(self) -> sparse.csr_matrix:
+        """词项-文档得分贡献矩阵（词项数 × 文档数，CSR），首次调用时计算并缓存"""
+        if self._impact_matrix is None:
+            term_ids = np.repeat(np.arange(len(self.vocab)), np.diff(self.indptr))
+            impacts = self._impacts(term_ids, self.postings_docs, self.postings_tf)
+            self._impact_matrix = sparse.csr_matrix(
+                (impacts, np.asarray(self.postings_docs), np.asarray(self.indptr)),
+                shape=(len(self.vocab), self.num_docs)
+            )
+        return self._impact_matrix
+
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        批量检索：查询词频矩阵与词项-文档得分矩阵做一次稀疏矩阵乘
+        :param queries: 查询文本列表
+        :param top_k: 每个查询返回数量
+        :return: 每个查询的 (文档ID数组, BM25得分数组)
+        """
+        rows, cols, vals = [], [], []
+        for row, query in enumerate(queries):
+            terms, qtf = self.query_terms(query)
+            rows.extend([row] * len(terms))
+            cols.extend(terms.tolist())
+            vals.extend(qtf.tolist())
+
+        query_matrix = sparse.csr_matrix(
+            (np.asarray(vals, dtype=np.float64), (rows, cols)),
+            shape=(len(queries), len(self.vocab))
+        )
+        scores = (query_matrix @ self.impact_matrix()).tocsr()
+
+        results = []
+        for row in range(len(queries)):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            if top_k <= 0 or start == end:
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            results.append(top_k_select(
+                scores.indices[start:end], scores.data[start:end].astype(np.float32), top_k
+            ))
+        return results
+
+    def save(self, index_dir, fingerprint: str) -> None:
+        """
+        持久化索引（各数组单独存为.npy以便mmap加载，meta.json最后写入并记录校验和）
+        每个文件先写临时文件再替换，正在mmap旧文件的检索进程不受影响
+        :param index_dir: 保存目录
+        :param fingerprint: 语料指纹（用于判断索引是否过期）
+        """
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+
+        checksums = {}
+        for name in _ARRAY_FIELDS:
+            path = index_dir / f"{name}.npy"
+            array = np.ascontiguousarray(getattr(self, name))
+            _replace_file(path, lambda f: np.save(f, array))
+            checksums[path.name] = _file_checksum(path)
+
+        vocab_path = index_dir / "vocab.json"
+        _replace_file(vocab_path, lambda f: f.write(json.dumps(self.vocab, ensure_ascii=False).encode("utf-8")))
+        checksums[vocab_path.name] = _file_checksum(vocab_path)
+
+        meta = {
+            "version": BM25_FORMAT_VERSION,
+            "tokenizer": tokenizer_signature(self.stopwords),
+            "fingerprint": fingerprint,
+            "num_docs": self.num_docs,
+            "num_terms": len(self.vocab),
+            "k1": self.k1,
+            "b": self.b,
+            "checksums": checksums
+        }
+        _replace_file(
+            index_dir / "meta.json", lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+        )
+
+    @classmethod
+    def load(
+        cls,
+        index_dir,
+        fingerprint: Optional[str] = None,
+        mmap: bool = True,
+        verify: bool = True,
+        stopwords: Optional[Set[str]] = None
+    ) -> Optional["BM25Index"]:
+        """
+        加载持久化索引
+        :param index_dir: 索引目录
+        :param fingerprint: 期望的语料指纹（None表示不校验）
+        :param mmap: 是否以内存映射方式加载数组
+        :param verify: 是否校验文件校验和
+        :param stopwords: 停用词集合（需与构建时一致）
+        :return: BM25Index；索引缺失、过期或损坏时返回None
+        """
+        index_dir = Path(index_dir)
+        meta_path = index_dir / "meta.json"
+        if not meta_path.exists():
+            logging.info(f"ℹ️ 未找到持久化BM25索引: {index_dir}")
+            return None
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            if meta.get("version") != BM25_FORMAT_VERSION:
+                logging.warning(f"⚠️ BM25索引版本不匹配（{meta.get('version')} != {BM25_FORMAT_VERSION}）")
+                return None
+            if meta.get("tokenizer") != tokenizer_signature(stopwords):
+                logging.warning("⚠️ BM25索引的分词配置已变化")
+                return None
+            if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+                logging.warning("⚠️ BM25索引与向量库语料不一致（已过期）")
+                return None
+            if verify:
+                for name, expected in meta["checksums"].items():
+                    if _file_checksum(index_dir / name) != expected:
+                        logging.warning(f"⚠️ BM25索引文件校验失败: {name}")
+                        return None
+
+            arrays = {
+                name: np.load(index_dir / f"{name}.npy", mmap_mode="r" if mmap else None)
+                for name in _ARRAY_FIELDS
+            }
+            with open(index_dir / "vocab.json", "r", encoding="utf-8") as f:
+                vocab = json.load(f)
+        except Exception as e:
+            logging.warning(f"⚠️ BM25索引读取失败: {str(e)}")
+            return None
+
+        return cls(vocab, k1=meta["k1"], b=meta["b"], stopwords=stopwords, **arrays)
+
+
+def tokenizer_signature(stopwords: Optional[Set[str]] = None) -> str:
+    """分词配置签名（分词模式+停用词），停用词变化时持久化索引失效"""
+    stopwords = BM25_STOPWORDS if stopwords is None else stopwords
+    payload = "jieba-search|" + "|".join(sorted(stopwords))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def corpus_fingerprint(doc_ids: Iterable[str]) -> str:
+    """语料指纹：按顺序对文档ID求哈希"""
+    digest = hashlib.sha1()
+    count = 0
+    for doc_id in doc_ids:
+        digest.update(str(doc_id).encode("utf-8"))
+        digest.update(b"\0")
+        count += 1
+    return f"{count}-{digest.hexdigest()}"
+
+
+def _file_checksum(path: Path) -> str:
+    """文件CRC32校验和"""
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(block, crc)
+    return f"{crc:08x}"
+
+
+def _replace_file(path: Path, write: Callable) -> None:
+    """
+    先写同目录临时文件再原子替换
+    就地改写被其他进程mmap的文件会使其读到截断的数据（SIGBUS）；替换文件名后旧映射仍指向旧文件
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _kth_largest(scores: np.ndarray, k: int) -> Optional[float]:
+    """第k大的分数（候选不足k个时返回None）"""
+    if len(scores) < k:
+        return None
+    return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+
+def top_k_select(ids: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """argpartition选取top-k，再按 (得分降序, ID升序) 排序（同分时结果确定）"""
+    if len(scores) > top_k:
+        kth = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        keep = scores >= kth
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((ids, -scores))[:top_k]
+    return ids[order].astype(np.int64), scores[order]
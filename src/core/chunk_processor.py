@@ -65,7 +65,9 @@ class OptimizedHybridSplitter:
                         return_tensors="pt", 
                         max_length=512, 
                         truncation=True)
-        outputs = model(**inputs)
+        # 梯度开关是线程级的，模块顶部的 set_grad_enabled 对流水线的分块线程不生效
+        with torch.no_grad():
+            outputs = model(**inputs)
         return outputs.last_hidden_state.mean(dim=1).numpy()
 
     def _text_similarity(self, text1, text2):
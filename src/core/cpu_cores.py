@@ -0,0 +1,26 @@
+# cpu_cores.py - 当前进程可用的CPU核（入库预处理与多进程嵌入共用，不依赖其他模块）
+import os
+from typing import List
+
+
+def available_core_ids() -> List[int]:
+    """当前进程可用的CPU核编号（考虑taskset/容器绑核，编号不一定从0开始或连续）"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_cores() -> int:
+    """当前进程可用的CPU核数（考虑taskset/容器绑核）"""
+    return len(available_core_ids())
+
+
+def limit_compute_threads(threads: int) -> None:
+    """
+    固定当前（工作）进程的计算线程数
+    spawn启动的工作进程导入模块时numpy已加载BLAS线程池，环境变量只对之后加载的库生效，已加载的需在运行时限制
+    """
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(threads)
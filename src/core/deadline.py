@@ -0,0 +1,56 @@
+# deadline.py - 检索延迟预算与分级降级
+import threading
+import time
+from typing import Dict, Optional
+
+# 降级级别（由轻到重）：缩小重排序集合 → 融合结果不重排序 → 仅BM25结果
+DEGRADATION_LEVELS = ("none", "reduced_rerank", "fused_only", "bm25_only")
+
+
+def worse(level: str, other: str) -> str:
+    """返回两个降级级别中更重的一个"""
+    return max(level, other, key=DEGRADATION_LEVELS.index)
+
+
+class Deadline:
+    """单次检索的延迟预算"""
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self._started = time.perf_counter()
+        self._deadline = self._started + budget_ms / 1000
+
+    def remaining(self) -> float:
+        """剩余时间（秒，不小于0）"""
+        return max(self._deadline - time.perf_counter(), 0.0)
+
+    def remaining_ms(self) -> float:
+        return self.remaining() * 1000
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class LatencyEstimator:
+    """各阶段耗时的指数滑动平均（用于判断剩余预算是否足够执行某阶段）"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._estimates: Dict[str, float] = {}
+
+    def update(self, name: str, ms: float) -> None:
+        with self._lock:
+            previous = self._estimates.get(name)
+            self._estimates[name] = ms if previous is None else (1 - self.alpha) * previous + self.alpha * ms
+
+    def get(self, name: str, default: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            return self._estimates.get(name, default)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._estimates)
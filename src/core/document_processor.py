@@ -1,5 +1,6 @@
 import logging
 import os
+from pathlib import Path
 from llama_index.core import SimpleDirectoryReader
 from cleantext import clean
 
@@ -29,6 +30,43 @@ def load_documents(directory: str, verbose: bool = False):
         logging.error(f"文档加载失败: {e}")
         raise
 
+# 随文本块保存的源文件元数据字段（来自SimpleDirectoryReader的文件元数据）
+SOURCE_METADATA_FIELDS = ("file_name", "file_type", "file_size")
+
+def _merge_file_documents(docs, directory: str):
+    """把同一源文件的各页合并为一个文档：(文档ID, 文本, 源文件元数据)，文档ID为相对directory的路径"""
+    metadata = docs[0].metadata
+    doc_id = Path(os.path.relpath(metadata["file_path"], directory)).as_posix()
+    source = {field: metadata[field] for field in SOURCE_METADATA_FIELDS if field in metadata}
+    source["pages"] = len(docs)
+    return doc_id, "\n\n".join(doc.text for doc in docs), source
+
+def list_document_files(directory: str):
+    """目录中可加载的源文件（按路径排序，与 iter_documents 的顺序一致）"""
+    return [str(path) for path in SimpleDirectoryReader(directory).input_files]
+
+def load_document(file_path: str, directory: str):
+    """加载单个源文件，返回 (文档ID, 文本, 源文件元数据)；多页文件（如PDF）各页按顺序合并"""
+    docs = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    if not docs:
+        return Path(os.path.relpath(file_path, directory)).as_posix(), "", {"pages": 0}
+    return _merge_file_documents(docs, directory)
+
+def iter_documents(directory: str):
+    """
+    逐个源文件加载文档（不一次性读入整个目录）
+    :return: 依次产出 (文档ID, 文本, 源文件元数据)；文档ID为相对directory的文件路径
+    """
+    count = 0
+    for docs in SimpleDirectoryReader(directory).iter_data():
+        if not docs:
+            continue
+        count += 1
+        yield _merge_file_documents(docs, directory)
+    if not count:
+        raise ValueError("未找到任何文档")
+    logging.info(f"成功加载 {count} 个文档")
+
 def clean_paragraphs(paragraphs):
     cleaned = []
     for text in paragraphs:
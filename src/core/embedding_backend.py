@@ -0,0 +1,339 @@
+# embedding_backend.py - 嵌入模型推理后端（PyTorch / ONNX Runtime fp32 / int8），入库与查询共用
+import hashlib
+import json
+import logging
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from langchain_core.embeddings import Embeddings
+from transformers import AutoModel, AutoTokenizer
+
+from src.core.model_registry import SharedModel, model_registry, pretrained_kwargs
+from src.core.onnx_utils import (
+    ONNX_DIRNAME, ONNX_FP32_FILENAME, ONNX_INT8_FILENAME, create_session, export_onnx_model, quantize_int8
+)
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+TORCH_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16
+}
+
+# 导出int8模型后用于向量一致性检查的样例
+PARITY_TEXTS = [
+    "大数定律说明样本均值依概率收敛于期望",
+    "古典概型要求样本点有限且等可能",
+    "中心极限定理描述独立随机变量和的极限分布",
+    "贝叶斯公式用于由先验概率求后验概率"
+]
+
+
+class TorchEmbeddingBackend:
+    """PyTorch句向量模型（sentence-transformers）"""
+
+    def __init__(self, model_path: str, device: str = "cpu", dtype: str = "float32",
+                 max_seq_length: Optional[int] = None):
+        from sentence_transformers import SentenceTransformer
+
+        model_kwargs = pretrained_kwargs(model_path)
+        if dtype != "float32":
+            model_kwargs['torch_dtype'] = TORCH_DTYPES[dtype]
+        self.model = SentenceTransformer(model_path, device=device, model_kwargs=model_kwargs)
+        self.model.eval()
+        if max_seq_length:
+            self.model.max_seq_length = max_seq_length
+        self.max_seq_length = self.model.max_seq_length
+
+    def encode(self, texts: List[str], batch_size: int = 32, lock=None) -> np.ndarray:
+        """
+        批量编码（与 SentenceTransformer.encode 相同的按长度分批；只有tokenizer调用持有lock，前向计算可并发）
+        :param lock: 共享模型的tokenizer锁（None表示不加锁）
+        """
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        outputs = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch_ids = order[start:start + batch_size]
+            with lock if lock is not None else nullcontext():
+                features = self.model.tokenize([texts[i] for i in batch_ids])
+            features = {name: value.to(self.model.device) for name, value in features.items()}
+            with torch.no_grad():
+                vectors = self.model(features)["sentence_embedding"]
+            outputs[batch_ids] = vectors.float().cpu().numpy()
+        return outputs
+
+
+class OnnxEmbeddingBackend:
+    """
+    ONNX Runtime句向量模型（CPU）
+    池化方式与是否归一化读取自sentence-transformers的模块配置，与PyTorch路径输出一致。
+    """
+
+    def __init__(self, model_path: str, onnx_path, max_seq_length: Optional[int] = None,
+                 intra_op_threads: int = 0):
+        """
+        :param model_path: 本地嵌入模型路径（读取tokenizer与池化配置）
+        :param onnx_path: ONNX模型路径
+        :param max_seq_length: 最大序列长度（默认取模型配置）
+        :param intra_op_threads: 算子内并行线程数（0表示由onnxruntime决定）
+        """
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.pooling, self.normalize, default_length = _read_st_config(model_path)
+        self.max_seq_length = max_seq_length or default_length or min(self.tokenizer.model_max_length, 512)
+        self.onnx_path = Path(onnx_path)
+        self.session = create_session(onnx_path, intra_op_threads)
+        self.input_names = [item.name for item in self.session.get_inputs()]
+
+    def encode(self, texts: List[str], batch_size: int = 32, lock=None) -> np.ndarray:
+        """批量编码（只有tokenizer调用持有lock，session.run 可并发）"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # 按长度排序分批以减少填充，输出时恢复原顺序
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        outputs = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            batch_ids = order[start:start + batch_size]
+            with lock if lock is not None else nullcontext():
+                inputs = self.tokenizer(
+                    [texts[i].strip() for i in batch_ids], padding=True, truncation=True,
+                    max_length=self.max_seq_length, return_tensors="np"
+                )
+            feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            vectors = _pool(hidden, np.asarray(inputs["attention_mask"]), self.pooling)
+            if self.normalize:
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            for i, vector in zip(batch_ids, vectors):
+                outputs[i] = vector
+        return np.vstack(outputs).astype(np.float32, copy=False)
+
+
+def _read_st_config(model_path: str):
+    """读取sentence-transformers模块配置：(池化方式, 是否归一化, 最大序列长度)"""
+    model_dir = Path(model_path)
+    pooling, normalize, max_seq_length = "mean", False, None
+
+    modules_file = model_dir / "modules.json"
+    if modules_file.exists():
+        modules = json.loads(modules_file.read_text(encoding="utf-8"))
+        for module in modules:
+            if module["type"].endswith("Pooling"):
+                config = json.loads((model_dir / module["path"] / "config.json").read_text(encoding="utf-8"))
+                if config.get("pooling_mode_cls_token"):
+                    pooling = "cls"
+                elif config.get("pooling_mode_mean_tokens"):
+                    pooling = "mean"
+                else:
+                    raise ValueError(f"ONNX后端不支持的池化方式: {config}")
+            elif module["type"].endswith("Normalize"):
+                normalize = True
+
+    st_config = model_dir / "sentence_bert_config.json"
+    if st_config.exists():
+        max_seq_length = json.loads(st_config.read_text(encoding="utf-8")).get("max_seq_length")
+    return pooling, normalize, max_seq_length
+
+
+def _pool(hidden: np.ndarray, attention_mask: np.ndarray, mode: str) -> np.ndarray:
+    """token向量池化为句向量"""
+    if mode == "cls":
+        return hidden[:, 0].astype(np.float32)
+    mask = attention_mask[..., None].astype(np.float32)
+    return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def export_onnx_embedding(model_path: str, quantize: bool = True, output_dir=None) -> Path:
+    """
+    导出嵌入模型（transformer部分）为ONNX，并可选做动态int8量化
+    :param model_path: 本地嵌入模型路径
+    :param quantize: 是否生成int8量化模型
+    :param output_dir: 输出目录（默认 <model_path>/onnx）
+    :return: 输出目录
+    """
+    output_dir = Path(output_dir) if output_dir else Path(model_path) / ONNX_DIRNAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_dir / ONNX_FP32_FILENAME
+
+    if not fp32_path.exists():
+        logging.info(f"开始导出ONNX嵌入模型: {model_path}")
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModel.from_pretrained(model_path, **pretrained_kwargs(model_path)).eval()
+        dummy = tokenizer(["示例文本"], return_tensors="pt", truncation=True, max_length=512)
+        export_onnx_model(model, dummy, fp32_path, "last_hidden_state", {0: "batch", 1: "sequence"})
+
+    int8_path = output_dir / ONNX_INT8_FILENAME
+    if quantize and not int8_path.exists():
+        quantize_int8(fp32_path, int8_path)
+
+        # 与fp32 PyTorch模型比较向量一致性并记录
+        parity = check_embedding_parity(
+            TorchEmbeddingBackend(model_path), OnnxEmbeddingBackend(model_path, int8_path), PARITY_TEXTS
+        )
+        with open(output_dir / "parity.json", "w", encoding="utf-8") as f:
+            json.dump(parity, f, ensure_ascii=False, indent=2)
+        logging.info(f"📏 int8与fp32向量一致性: {parity}")
+    return output_dir
+
+
+def backend_label(backend) -> str:
+    """实际加载的后端名称（torch / onnx / onnx-int8），记录在索引元数据中供加载时校验"""
+    if isinstance(backend, TorchEmbeddingBackend):
+        return "torch"
+    return "onnx-int8" if backend.onnx_path.name == ONNX_INT8_FILENAME else "onnx"
+
+
+def load_embedding_backend(
+    model_path: str,
+    backend: str = "torch",
+    device: str = "cpu",
+    dtype: str = "float32",
+    max_seq_length: Optional[int] = None,
+    intra_op_threads: int = 0,
+    fallback: bool = True
+):
+    """
+    加载嵌入推理后端；ONNX路径不可用时回退到PyTorch
+    :param model_path: 本地嵌入模型路径
+    :param backend: torch / onnx（fp32）/ onnx-int8
+    :param device: PyTorch计算设备
+    :param dtype: PyTorch权重精度
+    :param max_seq_length: 最大序列长度（默认取模型配置）
+    :param intra_op_threads: onnxruntime算子内线程数
+    :param fallback: ONNX不可用时是否回退到PyTorch（否则抛出异常）
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支持的嵌入后端: {backend}")
+
+    if backend != "torch":
+        try:
+            onnx_dir = export_onnx_embedding(model_path, quantize=(backend == "onnx-int8"))
+            filename = ONNX_INT8_FILENAME if backend == "onnx-int8" else ONNX_FP32_FILENAME
+            return OnnxEmbeddingBackend(model_path, onnx_dir / filename, max_seq_length, intra_op_threads)
+        except Exception as e:
+            if not fallback:
+                raise
+            logging.warning(f"⚠️ ONNX嵌入后端不可用，回退到PyTorch: {str(e)}")
+
+    return TorchEmbeddingBackend(model_path, device=device, dtype=dtype, max_seq_length=max_seq_length)
+
+
+def embedding_fingerprint(model_path: str, backend) -> str:
+    """
+    嵌入模型指纹：模型目录的配置与权重文件（名称+大小）、实际加载的后端类型、精度与最大序列长度
+    任何一项变化都会得到新的指纹（入库向量缓存随之失效）
+    """
+    digest = hashlib.sha1()
+    digest.update(f"{type(backend).__name__}|{getattr(backend, 'max_seq_length', None)}".encode("utf-8"))
+    if isinstance(backend, TorchEmbeddingBackend):
+        digest.update(str(next(backend.model.parameters()).dtype).encode("utf-8"))
+    else:
+        digest.update(f"{backend.onnx_path.name}|{backend.onnx_path.stat().st_size}".encode("utf-8"))
+    model_dir = Path(model_path)
+    for path in sorted(model_dir.rglob("*")):
+        if path.is_file() and ONNX_DIRNAME not in path.relative_to(model_dir).parts:
+            digest.update(f"{path.relative_to(model_dir)}|{path.stat().st_size}".encode("utf-8"))
+            if path.suffix == ".json":
+                digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def acquire_embedding_backend(
+    model_path: str,
+    backend: str = "torch",
+    device: str = "cpu",
+    dtype: str = "float32",
+    max_seq_length: Optional[int] = None,
+    intra_op_threads: int = 0
+) -> SharedModel:
+    """
+    经模型注册表获取共享的嵌入后端（后端、精度、最大长度相同的调用方共享同一份权重）
+    ONNX不可用时以PyTorch的键重新获取：注册表键始终对应实际加载的后端，回退得到的PyTorch模型不会登记在ONNX键下
+    """
+    def acquire(name: str) -> SharedModel:
+        precision = dtype if name == "torch" else name
+        if max_seq_length:
+            precision = f"{precision}@{max_seq_length}"
+        return model_registry.acquire(
+            "embedding", model_path,
+            lambda: load_embedding_backend(
+                model_path, name, device, dtype, max_seq_length, intra_op_threads, fallback=False
+            ),
+            device=device, dtype=precision
+        )
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支持的嵌入后端: {backend}")
+    if backend != "torch":
+        try:
+            return acquire(backend)
+        except Exception as e:
+            logging.warning(f"⚠️ ONNX嵌入后端不可用，回退到PyTorch: {str(e)}")
+    return acquire("torch")
+
+
+class SharedEmbeddings(Embeddings):
+    """
+    共享嵌入后端的LangChain接口包装
+    只有tokenizer调用串行（非线程安全），前向计算在各调用线程中并发，批大小按调用方配置。
+    """
+
+    def __init__(self, entry: SharedModel, batch_size: int = 32):
+        self._entry = entry
+        self.batch_size = batch_size
+
+    @property
+    def backend(self):
+        return self._entry.model
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """批量编码为float32矩阵（换行替换为空格，与HuggingFaceEmbeddings一致）"""
+        texts = [text.replace("\n", " ") for text in texts]
+        return self._entry.model.encode(texts, batch_size=self.batch_size, lock=self._entry.lock)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def check_embedding_parity(reference, candidate, texts: Sequence[str]) -> Dict[str, float]:
+    """
+    比较两个嵌入后端的向量一致性
+    :param reference: 基准后端（通常为fp32 PyTorch）
+    :param candidate: 待评估后端（如ONNX int8）
+    :param texts: 样例文本
+    :return: 平均/最小余弦相似度、相似度矩阵最近邻一致率
+    """
+    ref = reference.encode(list(texts))
+    cand = candidate.encode(list(texts))
+    ref_unit = ref / np.linalg.norm(ref, axis=1, keepdims=True)
+    cand_unit = cand / np.linalg.norm(cand, axis=1, keepdims=True)
+    cosine = (ref_unit * cand_unit).sum(axis=1)
+
+    # 样例两两之间的最近邻是否一致
+    ref_sim, cand_sim = ref_unit @ ref_unit.T, cand_unit @ cand_unit.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    return {
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "neighbor_agreement": float(np.mean(ref_sim.argmax(axis=1) == cand_sim.argmax(axis=1)))
+    }
+
+
+# ---------------------------- 测试代码 ----------------------------
+if __name__ == "__main__":
+    model_path = "./model/embeddingmodel"
+
+    reference = load_embedding_backend(model_path, backend="torch")
+    candidate = load_embedding_backend(model_path, backend="onnx-int8")
+    print("\n=== ONNX int8 与 fp32 向量一致性 ===")
+    for name, value in check_embedding_parity(reference, candidate, PARITY_TEXTS).items():
+        print(f"{name}: {value}")
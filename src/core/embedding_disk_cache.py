@@ -0,0 +1,178 @@
+# embedding_disk_cache.py - 入库时的持久化文本块向量缓存（按嵌入模型指纹+文本哈希，mmap读取）
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_CACHE_VERSION = 1
+EMBEDDING_CACHE_DIRNAME = "embedding_cache"
+_VECTORS_FILENAME = "vectors.f32"
+_KEYS_FILENAME = "keys.u64"
+
+
+def text_key(text: str) -> int:
+    """文本块内容哈希（64位）"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class EmbeddingDiskCache:
+    """
+    文本块向量的磁盘缓存
+    - 每个嵌入模型指纹一个子目录：vectors.f32 为按写入顺序排列的float32向量（mmap读取），
+      keys.u64 为对应的文本哈希（索引文件），meta.json 记录维度
+    - 只追加写入：先写向量再写哈希，进程中断时多出的向量行会被忽略
+    - 同一目录只应有一个写入进程
+    """
+
+    def __init__(self, cache_dir, fingerprint: str):
+        """
+        :param cache_dir: 缓存根目录
+        :param fingerprint: 嵌入模型指纹（模型、后端、精度或最大长度变化时使用新的子目录）
+        """
+        self.dir = Path(cache_dir) / fingerprint
+        self.fingerprint = fingerprint
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._open()
+
+    def _open(self):
+        """映射已有缓存文件并建立有序哈希索引"""
+        meta_path = self.dir / "meta.json"
+        if not meta_path.exists():
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != EMBEDDING_CACHE_VERSION:
+                logging.warning(f"⚠️ 向量缓存版本不匹配，忽略已有缓存: {self.dir}")
+                return
+            self.dim = int(meta["dim"])
+            keys = np.fromfile(self.dir / _KEYS_FILENAME, dtype=np.uint64)
+            vectors_path = self.dir / _VECTORS_FILENAME
+            rows = min(len(keys), vectors_path.stat().st_size // (4 * self.dim))
+            # 上次写入中断时截掉未配对的尾部，保证向量行与哈希一一对应
+            for path, size in ((vectors_path, rows * 4 * self.dim), (self.dir / _KEYS_FILENAME, rows * 8)):
+                if path.stat().st_size > size:
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+            self._vectors = (
+                np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+            )
+            self._index(keys[:rows])
+        except Exception as e:
+            logging.warning(f"⚠️ 向量缓存读取失败，忽略已有缓存: {str(e)}")
+            self.dim, self._vectors = None, None
+            self._index(np.empty(0, dtype=np.uint64))
+
+    def _index(self, keys: np.ndarray):
+        order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[order]
+        self._sorted_rows = order.astype(np.int64)
+
+    def _merge(self, keys: np.ndarray):
+        """把新追加的哈希（行号接在已有行之后）并入有序索引：只排序新哈希，按位置插入，不重排已有哈希"""
+        order = np.argsort(keys, kind="stable")
+        rows = len(self) + order.astype(np.int64)
+        positions = np.searchsorted(self._sorted_keys, keys[order], side="right")
+        self._sorted_keys = np.insert(self._sorted_keys, positions, keys[order])
+        self._sorted_rows = np.insert(self._sorted_rows, positions, rows)
+
+    def __len__(self) -> int:
+        return len(self._sorted_keys)
+
+    def _lookup(self, keys: np.ndarray) -> np.ndarray:
+        """哈希 -> 缓存行号（未命中为-1）"""
+        if len(self._sorted_keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.searchsorted(self._sorted_keys, keys)
+        positions = np.minimum(positions, len(self._sorted_keys) - 1)
+        found = self._sorted_keys[positions] == keys
+        return np.where(found, self._sorted_rows[positions], -1)
+
+    def _append(self, keys: np.ndarray, vectors: np.ndarray):
+        """追加新向量并重新映射"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.dir.mkdir(parents=True, exist_ok=True)
+            with open(self.dir / "meta.json", "w", encoding="utf-8") as f:
+                json.dump({"version": EMBEDDING_CACHE_VERSION, "fingerprint": self.fingerprint, "dim": self.dim}, f)
+        with open(self.dir / _VECTORS_FILENAME, "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.dir / _KEYS_FILENAME, "ab") as f:
+            f.write(np.ascontiguousarray(keys, dtype=np.uint64).tobytes())
+
+        self._merge(keys.astype(np.uint64))
+        self._vectors = np.memmap(
+            self.dir / _VECTORS_FILENAME, dtype=np.float32, mode="r", shape=(len(self), self.dim)
+        )
+
+    def lookup(self, texts: List[str]) -> np.ndarray:
+        """文本 -> 缓存行号（未命中为-1），计入命中统计"""
+        keys = np.fromiter((text_key(text) for text in texts), dtype=np.uint64, count=len(texts))
+        with self._lock:
+            rows = self._lookup(keys)
+            self.hits += int((rows >= 0).sum())
+            self.misses += int((rows < 0).sum())
+        return rows
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        """按缓存行号读取向量"""
+        with self._lock:
+            return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def put(self, texts: List[str], vectors: np.ndarray) -> None:
+        """写入新计算的向量（已存在或批内重复的文本只保留一份）"""
+        keys = np.fromiter((text_key(text) for text in texts), dtype=np.uint64, count=len(texts))
+        with self._lock:
+            unique_keys, first = np.unique(keys, return_index=True)
+            new = self._lookup(unique_keys) < 0
+            if new.any():
+                self._append(unique_keys[new], np.asarray(vectors, dtype=np.float32)[first[new]])
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        取文本块向量：命中缓存的直接读取，未命中的调用 encode_fn 计算后写入缓存
+        :param texts: 文本块
+        :param encode_fn: 批量编码函数
+        :return: 与texts顺序一致的float32矩阵
+        """
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        rows = self.lookup(texts)
+        missing = np.flatnonzero(rows < 0)
+        # 同一批内重复的文本只计算一次
+        unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+        computed: Dict[str, np.ndarray] = {}
+        if unique_texts:
+            vectors = np.asarray(encode_fn(unique_texts), dtype=np.float32)
+            self.put(unique_texts, vectors)
+            computed = dict(zip(unique_texts, vectors))
+
+        output = np.empty((len(texts), self.dim), dtype=np.float32)
+        hit = np.flatnonzero(rows >= 0)
+        if len(hit):
+            output[hit] = self.read(rows[hit])
+        for i in missing:
+            output[i] = computed[texts[i]]
+        return output
+
+    def stats(self) -> Dict:
+        """命中统计与缓存大小"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+            "size_mb": len(self) * (self.dim or 0) * 4 / 2 ** 20
+        }
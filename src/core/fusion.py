@@ -0,0 +1,75 @@
+# fusion.py - 多路召回结果的向量化分数融合
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from src.core.bm25_index import top_k_select
+
+FUSION_MODES = ("minmax", "zscore", "rrf")
+DEFAULT_WEIGHTS = {"vector": 0.6, "bm25": 0.4}
+# 分数为距离（越小越相关）的召回路
+DISTANCE_LEGS = frozenset({"vector"})
+
+
+def normalize_scores(scores: np.ndarray, mode: str, rrf_k: int = 60) -> np.ndarray:
+    """
+    单路分数归一化（输入分数越大越相关）
+    :param scores: 原始分数
+    :param mode: minmax（缩放到[0,1]）/ zscore（标准化）/ rrf（倒数排名）
+    :param rrf_k: RRF平滑常数
+    :return: 归一化分数
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return scores
+    if mode == "minmax":
+        span = scores.max() - scores.min()
+        return (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+    if mode == "zscore":
+        std = scores.std()
+        return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+    if mode == "rrf":
+        ranks = np.empty(len(scores), dtype=np.float64)
+        ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+        return 1.0 / (rrf_k + ranks + 1)
+    raise ValueError(f"不支持的融合方式: {mode}")
+
+
+def fuse(
+    legs: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    weights: Optional[Dict[str, float]] = None,
+    mode: str = "minmax",
+    top_k: Optional[int] = None,
+    rrf_k: int = 60,
+    distance_legs: Iterable[str] = DISTANCE_LEGS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    基于文本块ID的加权融合
+    :param legs: 各路召回结果 {召回路: (文本块ID数组, 分数数组)}
+    :param weights: 各路权重（默认：向量0.6，BM25 0.4）
+    :param mode: 归一化方式（minmax/zscore/rrf）
+    :param top_k: 返回数量（None表示全部）
+    :param rrf_k: RRF平滑常数
+    :param distance_legs: 分数为距离的召回路（融合前取负）
+    :return: (文本块ID数组, 融合分数数组)，按融合分数降序
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    distance_legs = set(distance_legs)
+
+    all_ids, all_scores = [], []
+    for method, (ids, scores) in legs.items():
+        weight = weights.get(method, 0)
+        if weight == 0 or len(ids) == 0:
+            continue
+        scores = np.asarray(scores, dtype=np.float64)
+        if method in distance_legs:
+            scores = -scores
+        all_ids.append(np.asarray(ids, dtype=np.int64))
+        all_scores.append(weight * normalize_scores(scores, mode, rrf_k))
+
+    if not all_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    unique_ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+    fused = np.bincount(inverse, weights=np.concatenate(all_scores))
+    return top_k_select(unique_ids, fused, top_k if top_k is not None else len(unique_ids))
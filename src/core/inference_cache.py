@@ -0,0 +1,120 @@
+# inference_cache.py - 推理结果LRU缓存（查询向量、重排序得分）
+import hashlib
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """查询文本归一化：全半角统一、去首尾空白、合并连续空白、小写"""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def query_hash(text: str) -> str:
+    """归一化查询文本的哈希"""
+    return hashlib.blake2b(normalize_query(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _default_sizeof(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    按字节数限额的线程安全LRU缓存
+    - 写入时按 sizeof 估算条目大小，超过限额时淘汰最久未使用的条目
+    - 缓存绑定索引版本，版本变化时整体失效
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[Any], int] = _default_sizeof,
+        name: str = "cache"
+    ):
+        """
+        :param max_bytes: 缓存容量上限（字节）
+        :param sizeof: 条目大小估算函数
+        :param name: 缓存名称
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.name = name
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存（命中时移到最近使用端），未命中返回None"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """写入缓存（超过容量时淘汰最久未使用的条目）"""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizes[key]
+                self._data.move_to_end(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._data.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def set_version(self, version: str) -> None:
+        """绑定索引版本，版本变化时清空缓存"""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+        self.clear()
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "version": self.version
+            }
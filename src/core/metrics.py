@@ -0,0 +1,181 @@
+# metrics.py - 检索各阶段耗时采集与可插拔指标汇聚（直方图）
+import bisect
+from abc import ABC, abstractmethod
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 延迟（毫秒）与数量两类直方图的默认分桶上界
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class StageTimings:
+    """单次检索的阶段耗时、候选数量与批大小"""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages_ms: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.batch_sizes: Dict[str, List[int]] = {}
+
+    def add_stage(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + ms
+
+    def add_count(self, name: str, value: int) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def add_batch(self, name: str, size: int) -> None:
+        with self._lock:
+            self.batch_sizes.setdefault(name, []).append(int(size))
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "total_ms": (time.perf_counter() - self._started) * 1000,
+                "stages_ms": dict(self.stages_ms),
+                "counts": dict(self.counts),
+                "batch_sizes": {name: list(sizes) for name, sizes in self.batch_sizes.items()}
+            }
+
+
+# 当前检索请求的计时对象（随contextvars传递到召回线程池与异步执行器）
+current_timings: ContextVar[Optional[StageTimings]] = ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def track_timings():
+    """在当前上下文中开启一次检索计时"""
+    timings = StageTimings()
+    token = current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        current_timings.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """记录一个阶段的耗时（当前上下文未开启计时时不做任何事）"""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_stage(name, (time.perf_counter() - started) * 1000)
+
+
+def record_count(name: str, value: int) -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add_count(name, value)
+
+
+def record_batch(name: str, size: int) -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add_batch(name, size)
+
+
+class MetricsSink(ABC):
+    """指标汇聚接口：接入Prometheus、StatsD等监控系统时继承并实现 observe"""
+
+    @abstractmethod
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """记录一个观测值"""
+
+    def observe_timings(self, timings: Dict, labels: Optional[Dict[str, str]] = None) -> None:
+        """把一次检索的 timings 拆分为各阶段耗时、候选数量与批大小指标"""
+        labels = labels or {}
+        self.observe("rag_request_ms", timings["total_ms"], labels)
+        for name, ms in timings["stages_ms"].items():
+            self.observe("rag_stage_ms", ms, {**labels, "stage": name})
+        for name, value in timings["counts"].items():
+            self.observe("rag_candidates", value, {**labels, "kind": name})
+        for name, sizes in timings["batch_sizes"].items():
+            for size in sizes:
+                self.observe("rag_batch_size", size, {**labels, "kind": name})
+
+
+class NullMetricsSink(MetricsSink):
+    """丢弃所有指标"""
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        pass
+
+
+class HistogramMetricsSink(MetricsSink):
+    """进程内直方图汇聚（累计分桶计数、总和与次数，可估计分位数）"""
+
+    def __init__(self, buckets: Optional[Dict[str, Sequence[float]]] = None):
+        """
+        :param buckets: 各指标的分桶上界（未指定的指标：名称以 _ms 结尾用延迟分桶，否则用数量分桶）
+        """
+        self.buckets = dict(buckets or {})
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict] = {}
+
+    def _bounds(self, name: str) -> Sequence[float]:
+        if name in self.buckets:
+            return self.buckets[name]
+        return LATENCY_BUCKETS_MS if name.endswith("_ms") else COUNT_BUCKETS
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                bounds = self._bounds(name)
+                series = {"bounds": bounds, "counts": [0] * (len(bounds) + 1), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            series["counts"][bisect.bisect_left(series["bounds"], value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @staticmethod
+    def _quantile(series: Dict, q: float) -> float:
+        """按分桶线性插值估计分位数"""
+        target = q * series["count"]
+        cumulative = 0
+        bounds = series["bounds"]
+        for i, count in enumerate(series["counts"]):
+            if count and cumulative + count >= target:
+                lower = bounds[i - 1] if i > 0 else 0.0
+                upper = bounds[i] if i < len(bounds) else bounds[-1]
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return float(bounds[-1])
+
+    def snapshot(self) -> List[Dict]:
+        """各指标序列的次数、均值、p50/p90/p99与分桶计数"""
+        with self._lock:
+            items = [(key, {**series, "counts": list(series["counts"])}) for key, series in self._series.items()]
+        return [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": series["count"],
+                "mean": series["sum"] / series["count"],
+                "p50": self._quantile(series, 0.5),
+                "p90": self._quantile(series, 0.9),
+                "p99": self._quantile(series, 0.99),
+                "buckets": dict(zip([*map(str, series["bounds"]), "+Inf"], series["counts"]))
+            }
+            for (name, labels), series in sorted(items)
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+# 进程内默认指标汇聚（各检索器以 collection 标签区分）
+default_metrics_sink = HistogramMetricsSink()
@@ -0,0 +1,126 @@
+# model_registry.py - 进程级共享模型注册表
+import gc
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+ModelKey = Tuple[str, str, str, str]
+
+
+@dataclass
+class SharedModel:
+    """注册表中的共享模型条目"""
+    key: ModelKey
+    model: Any = None
+    refcount: int = 0
+    # 同一模型的非线程安全操作（如tokenizer调用）需持有该锁
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    # 加载锁：保证同一模型只加载一次，不同模型可并行加载
+    load_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ModelRegistry:
+    """
+    进程级模型注册表
+    按 (模型类型, 模型路径, 设备, 精度) 共享同一份模型权重，
+    通过引用计数管理生命周期，引用归零时释放模型。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[ModelKey, SharedModel] = {}
+
+    @staticmethod
+    def make_key(kind: str, model_path: str, device: str = "cpu", dtype: str = "float32") -> ModelKey:
+        """生成注册表键（本地路径统一解析为绝对路径）"""
+        path = Path(model_path)
+        normalized = str(path.resolve()) if path.exists() else str(model_path)
+        return (kind, normalized, device, dtype)
+
+    def acquire(
+        self,
+        kind: str,
+        model_path: str,
+        loader: Callable[[], Any],
+        device: str = "cpu",
+        dtype: str = "float32"
+    ) -> SharedModel:
+        """
+        获取共享模型（不存在时调用loader加载），引用计数+1
+        :param kind: 模型类型（embedding/reranker等）
+        :param model_path: 模型路径
+        :param loader: 模型加载函数
+        :param device: 计算设备
+        :param dtype: 权重精度
+        :return: 共享模型条目
+        """
+        key = self.make_key(kind, model_path, device, dtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = SharedModel(key=key)
+                self._entries[key] = entry
+            entry.refcount += 1
+
+        try:
+            with entry.load_lock:
+                if entry.model is None:
+                    entry.model = loader()
+                    logging.info(f"📦 模型已加载并注册: {kind} | {key[1]} | {device} | {dtype}")
+                else:
+                    logging.info(f"♻️ 复用已加载模型: {kind} | {key[1]}（引用数 {entry.refcount}）")
+        except Exception:
+            self._decref(key)
+            raise
+        return entry
+
+    def release(self, entry: SharedModel) -> None:
+        """释放一次模型引用，引用归零时卸载模型"""
+        self._decref(entry.key)
+
+    def _decref(self, key: ModelKey) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refcount -= 1
+            if entry.refcount > 0:
+                return
+            del self._entries[key]
+
+        entry.model = None
+        gc.collect()
+        if key[2].startswith("cuda"):
+            try:
+                import torch
+                torch.cuda.empty_cache()
+            except Exception:
+                pass
+        logging.info(f"🗑️ 模型已释放: {key[0]} | {key[1]}")
+
+    def stats(self) -> Dict[str, int]:
+        """返回各模型当前引用数"""
+        with self._lock:
+            return {" | ".join(key): entry.refcount for key, entry in self._entries.items()}
+
+
+def pretrained_kwargs(model_path: str) -> Dict[str, Any]:
+    """
+    from_pretrained 的快速加载参数：
+    存在safetensors权重时强制使用（按mmap读取，不经过pickle反序列化），
+    low_cpu_mem_usage 跳过随机初始化、直接把权重装入模型，避免加载期间内存翻倍
+    """
+    kwargs: Dict[str, Any] = {"low_cpu_mem_usage": True}
+    model_dir = Path(model_path)
+    if model_dir.is_dir():
+        if any(model_dir.glob("*.safetensors")):
+            kwargs["use_safetensors"] = True
+        else:
+            logging.info(f"ℹ️ {model_path} 未提供safetensors权重，将从pickle格式加载（较慢）")
+    return kwargs
+
+
+# 全局单例：同一进程内的所有检索器共享
+model_registry = ModelRegistry()
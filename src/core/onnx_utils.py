@@ -0,0 +1,80 @@
+# onnx_utils.py - ONNX导出、int8动态量化与推理会话的公共函数
+import logging
+import os
+from pathlib import Path
+from typing import Dict
+
+import torch
+
+ONNX_DIRNAME = "onnx"
+ONNX_FP32_FILENAME = "model.onnx"
+ONNX_INT8_FILENAME = "model.int8.onnx"
+
+
+def _tmp_path(path: Path) -> Path:
+    """同目录的进程私有临时文件（多个worker同时导出时互不覆盖，完成后原子替换）"""
+    return path.with_name(f"{path.stem}.{os.getpid()}.tmp{path.suffix}")
+
+
+def export_onnx_model(model, dummy_inputs: Dict[str, torch.Tensor], onnx_path,
+                      output_name: str, output_axes: Dict[int, str]) -> Path:
+    """
+    导出transformers模型为ONNX（批大小与序列长度为动态维度）
+    :param model: eval模式的PyTorch模型
+    :param dummy_inputs: tokenizer生成的示例输入
+    :param onnx_path: 输出路径
+    :param output_name: 输出张量名称
+    :param output_axes: 输出张量的动态维度
+    :return: 输出路径
+    """
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(onnx_path)
+    input_names = list(dummy_inputs.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = output_axes
+    try:
+        torch.onnx.export(
+            model,
+            (dict(dummy_inputs),),
+            str(tmp_path),
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=17
+        )
+        os.replace(tmp_path, onnx_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    logging.info(f"✅ ONNX模型导出完成: {onnx_path}")
+    return onnx_path
+
+
+def quantize_int8(fp32_path, int8_path) -> Path:
+    """动态int8量化（权重int8，激活运行时量化）"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = Path(int8_path)
+    tmp_path = _tmp_path(int8_path)
+    try:
+        quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    logging.info(f"✅ int8动态量化完成: {int8_path}")
+    return int8_path
+
+
+def create_session(onnx_path, intra_op_threads: int = 0):
+    """
+    创建CPU推理会话
+    :param onnx_path: ONNX模型路径
+    :param intra_op_threads: 算子内并行线程数（0表示由onnxruntime决定）
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+    return ort.InferenceSession(str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"])
@@ -0,0 +1,202 @@
+# parallel_embedding.py - 建库时的多进程流式文本块嵌入（每个进程固定线程数，按批回传）
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.cpu_cores import available_core_ids, limit_compute_threads
+
+
+class ThroughputMeter:
+    """嵌入进度与吞吐统计（按时间间隔输出日志）"""
+
+    def __init__(self, total: int, name: str = "嵌入", interval_s: float = 5.0):
+        self.total = total
+        self.name = name
+        self.interval_s = interval_s
+        self.done = 0
+        self._started = time.perf_counter()
+        self._last_report = self._started
+
+    def update(self, count: int) -> None:
+        self.done += count
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval_s or self.done >= self.total:
+            self._last_report = now
+            elapsed = now - self._started
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+            logging.info(
+                f"📈 {self.name}进度 {self.done}/{self.total}（{self.done / max(self.total, 1):.0%}），"
+                f"{rate:.1f} 条/秒，预计剩余 {eta:.0f} 秒"
+            )
+
+    def summary(self) -> Dict[str, float]:
+        elapsed = time.perf_counter() - self._started
+        return {
+            "chunks": self.done,
+            "seconds": elapsed,
+            "chunks_per_s": self.done / elapsed if elapsed > 0 else 0.0
+        }
+
+
+def _embedding_worker(worker_id: int, config: Dict, tasks, results) -> None:
+    """
+    嵌入工作进程：固定计算线程数（可选绑定CPU核）后加载模型，循环处理 (批ID, 文本) 任务
+    结果以 ("ok", 批ID, 向量) 回传，异常以 ("error", 批ID, 堆栈) 回传
+    """
+    threads = config["threads"]
+    limit_compute_threads(threads)
+    cores = config.get("cores")
+    if cores and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+    batch_id = None
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        from src.core.embedding_backend import load_embedding_backend
+
+        backend = load_embedding_backend(
+            config["model_path"], config["backend"], config["device"], config["dtype"],
+            config["max_seq_length"], intra_op_threads=threads
+        )
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            batch_id, texts = task
+            vectors = backend.encode([text.replace("\n", " ") for text in texts], batch_size=config["batch_size"])
+            results.put(("ok", batch_id, np.ascontiguousarray(vectors, dtype=np.float32)))
+    except Exception:
+        results.put(("error", batch_id, f"worker {worker_id}: {traceback.format_exc()}"))
+
+
+class ParallelEmbedder:
+    """
+    多进程流式嵌入
+    - 文本按批分发给N个工作进程（spawn启动，各自加载模型，线程数固定为 threads_per_worker）
+    - 在途批数有上限，结果按完成顺序逐批返回，调用方边收边写索引，内存占用与语料规模无关
+    - 工作进程在首次 stream 时启动（全部命中缓存时不加载模型），close 时退出
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        num_workers: int,
+        threads_per_worker: Optional[int] = None,
+        backend: str = "torch",
+        device: str = "cpu",
+        dtype: str = "float32",
+        max_seq_length: Optional[int] = None,
+        batch_size: int = 32,
+        max_inflight: Optional[int] = None,
+        pin_cores: bool = True
+    ):
+        """
+        :param model_path: 本地嵌入模型路径
+        :param num_workers: 工作进程数
+        :param threads_per_worker: 每个进程的计算线程数（默认 可用CPU核数 // 进程数）
+        :param backend: 嵌入推理后端（需与查询时一致）
+        :param device: 计算设备
+        :param dtype: PyTorch权重精度
+        :param max_seq_length: 最大序列长度
+        :param batch_size: 每批文本数
+        :param max_inflight: 最多在途批数（默认 进程数×2）
+        :param pin_cores: 是否把各进程绑定到互不重叠的CPU核（从当前进程可用的核中分配）
+        """
+        self._core_ids = available_core_ids()
+        self.num_workers = max(1, num_workers)
+        self.threads_per_worker = threads_per_worker or max(1, len(self._core_ids) // self.num_workers)
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight or self.num_workers * 2
+        self.pin_cores = pin_cores and self.num_workers * self.threads_per_worker <= len(self._core_ids)
+        self._config = {
+            "model_path": model_path, "backend": backend, "device": device, "dtype": dtype,
+            "max_seq_length": max_seq_length, "batch_size": batch_size, "threads": self.threads_per_worker
+        }
+        self._context = mp.get_context("spawn")
+        self._workers: List = []
+        self._tasks = None
+        self._results = None
+
+    def __enter__(self) -> "ParallelEmbedder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def worker_cores(self, worker_id: int) -> Optional[set]:
+        """工作进程绑定的CPU核编号（不绑核时为None）"""
+        if not self.pin_cores:
+            return None
+        start = worker_id * self.threads_per_worker
+        return set(self._core_ids[start:start + self.threads_per_worker])
+
+    def start(self) -> None:
+        self._tasks = self._context.Queue(maxsize=self.max_inflight)
+        self._results = self._context.Queue()
+        for worker_id in range(self.num_workers):
+            config = dict(self._config, cores=self.worker_cores(worker_id))
+            process = self._context.Process(
+                target=_embedding_worker, args=(worker_id, config, self._tasks, self._results),
+                name=f"rag-embed-{worker_id}", daemon=True
+            )
+            process.start()
+            self._workers.append(process)
+        logging.info(f"🚀 已启动 {self.num_workers} 个嵌入进程（每个 {self.threads_per_worker} 线程）")
+
+    def close(self) -> None:
+        if not self._workers:
+            return
+        for _ in self._workers:
+            try:
+                self._tasks.put(None, timeout=1)
+            except queue.Full:
+                break
+        for process in self._workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+    def _next_result(self) -> Tuple[int, np.ndarray]:
+        """等待一个结果（工作进程异常退出时报错而不是无限等待）"""
+        while True:
+            try:
+                status, batch_id, payload = self._results.get(timeout=1)
+            except queue.Empty:
+                dead = [process.name for process in self._workers if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"嵌入进程意外退出: {dead}")
+                continue
+            if status == "error":
+                raise RuntimeError(f"嵌入进程出错:\n{payload}")
+            return batch_id, payload
+
+    def stream(self, texts: Sequence[str]) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        流式嵌入
+        :param texts: 文本块
+        :return: 按完成顺序产出 (该批在texts中的起始位置, 向量)
+        """
+        if not self._workers:
+            self.start()
+        inflight = 0
+        for start in range(0, len(texts), self.batch_size):
+            self._tasks.put((start, list(texts[start:start + self.batch_size])))
+            inflight += 1
+            if inflight >= self.max_inflight:
+                yield self._next_result()
+                inflight -= 1
+        while inflight:
+            yield self._next_result()
+            inflight -= 1
@@ -0,0 +1,87 @@
+# parallel_ingest.py - 入库预处理的多进程并行（逐个源文件加载、清洗、分块，结果按文件顺序合并）
+import logging
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.core import document_processor as dp
+from src.core.cpu_cores import available_cores, limit_compute_threads
+
+# 工作进程内的分块器（每个进程加载一次）
+_splitter = None
+
+
+def prepare_document(file_path: str, directory: str, splitter,
+                     keep_text: bool = False) -> Tuple[str, Optional[str], List[str], Dict]:
+    """
+    加载、清洗并分块一个源文件（文本块不会跨越文件）
+    :return: (文档ID, 清洗后文本（仅keep_text时返回）, 文本块列表, 源文件元数据)
+    """
+    doc_id, text, metadata = dp.load_document(file_path, directory)
+    cleaned = dp.clean_paragraphs([text])[0]
+    chunks = splitter.split_text(cleaned) if cleaned.strip() else []
+    return doc_id, cleaned if keep_text else None, chunks, metadata
+
+
+def _init_worker(threads: int) -> None:
+    """工作进程初始化：固定计算线程数后加载分块器（含BERT模型）"""
+    global _splitter
+    limit_compute_threads(threads)
+    import torch
+    torch.set_num_threads(threads)
+    from src.core import chunk_processor as cp
+    _splitter = cp.OptimizedHybridSplitter()
+
+
+def _prepare_in_worker(file_path: str, directory: str, keep_text: bool):
+    return prepare_document(file_path, directory, _splitter, keep_text)
+
+
+def prepare_documents(
+    directory: str,
+    num_workers: Optional[int] = None,
+    keep_text: bool = False,
+    max_pending: Optional[int] = None
+) -> Iterator[Tuple[str, Optional[str], List[str], Dict]]:
+    """
+    多进程逐个源文件加载、清洗、分块
+    - 进程数默认取可用CPU核数（不超过文件数），每个进程单独加载分块模型，计算线程数为 核数 // 进程数
+    - 结果严格按文件路径顺序产出（与进程完成顺序无关），同一语料多次运行结果一致
+    - 最多 max_pending 个文件在处理中或等待消费（默认 进程数×2），内存占用与语料规模无关
+    :param directory: 源文件目录
+    :param num_workers: 进程数
+    :param keep_text: 是否同时返回清洗后的全文（调试输出用）
+    :param max_pending: 最多在途文件数
+    :return: 依次产出 (文档ID, 清洗后文本或None, 文本块列表, 源文件元数据)
+    """
+    files = dp.list_document_files(directory)
+    if not files:
+        raise ValueError("未找到任何文档")
+    cores = available_cores()
+    num_workers = max(1, min(num_workers or cores, len(files)))
+    threads = max(1, cores // num_workers)
+    max_pending = max_pending or num_workers * 2
+    logging.info(f"🚀 启动 {num_workers} 个预处理进程（每个 {threads} 线程），共 {len(files)} 个文档")
+
+    executor = ProcessPoolExecutor(
+        max_workers=num_workers, mp_context=mp.get_context("spawn"),
+        initializer=_init_worker, initargs=(threads,)
+    )
+    pending = deque()
+    next_file = 0
+    try:
+        while next_file < len(files) or pending:
+            while next_file < len(files) and len(pending) < max_pending:
+                path = files[next_file]
+                pending.append((path, executor.submit(_prepare_in_worker, path, directory, keep_text)))
+                next_file += 1
+            path, future = pending.popleft()
+            try:
+                yield future.result()
+            except Exception as e:
+                logging.error(f"❌ 文档预处理失败: {path}: {str(e)}")
+                raise
+        logging.info(f"成功预处理 {len(files)} 个文档")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -1,94 +1,213 @@
 import logging
 import os
+import queue
+import threading
 from . import document_processor as dp
-from . import chunk_processor as cp
+from . import parallel_ingest as pi
 from . import vector_db as vp
 
 logger = logging.getLogger(__name__)
 
+# 相邻阶段之间的队列长度（以文档为单位：上游最多领先下游这么多个文档，内存占用与语料规模无关）
+STAGE_QUEUE_SIZE = 4
+_STAGE_DONE = object()
+
+
+class _StageFailure:
+    """上游阶段抛出的异常（经队列传给消费端重新抛出）"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def run_stage(items, maxsize=STAGE_QUEUE_SIZE, name="stage"):
+    """
+    在后台线程中驱动上游生成器，经有界队列逐个产出结果
+    - 队列满时上游阻塞，阶段之间并行但不会无限预读
+    - 上游异常在消费端重新抛出；消费端提前退出时上游线程随之停止
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except BaseException as e:
+            put(_StageFailure(e))
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+
+    thread = threading.Thread(target=produce, name=f"pipeline-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageFailure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
 class DocumentPipeline:
-    """文档处理全流程封装"""
+    """文档处理全流程封装（加载 → 清洗 → 分块 → 嵌入 → 索引，逐个文档流式处理）"""
     
-    def __init__(self, embedding_model_path="./model/embeddingmodel", device="cpu"):
+    def __init__(self, embedding_model_path="./model/embeddingmodel", device="cpu", embedding_backend="torch",
+                 index_type="flat", index_params=None, embedding_workers=0, preprocess_workers=None):
         self.embedding_model_path = embedding_model_path
         self.device = device
+        self.embedding_backend = embedding_backend
+        self.index_type = index_type
+        self.index_params = index_params
+        # >0 时建库使用多进程流式嵌入
+        self.embedding_workers = embedding_workers
+        # 加载/清洗/分块的进程数（None 取可用CPU核数；<=1 时在当前进程的后台线程中处理）
+        self.preprocess_workers = preprocess_workers
     
-    def save_chunks(self, chunks, output_dir):
-        """保存分块结果到指定目录"""
+    def save_chunks(self, chunks, output_dir, start=1):
+        """保存分块结果到指定目录（文件编号从start开始）"""
         try:
             if not os.path.exists(output_dir):
                 os.makedirs(output_dir)
                 logger.info(f"创建目录: {output_dir}")
             
-            for idx, chunk in enumerate(chunks, start=1):
+            for idx, chunk in enumerate(chunks, start=start):
                 chunk_file = os.path.join(output_dir, f"chunk_{idx}.txt")
                 with open(chunk_file, "w", encoding="utf-8") as f:
                     f.write(chunk)
                 logger.debug(f"分块 {idx} 已保存到 {chunk_file}")
             
-            logger.info(f"成功保存 {len(chunks)} 个分块到目录: {output_dir}")
+            logger.debug(f"成功保存 {len(chunks)} 个分块到目录: {output_dir}")
             return True
         except Exception as e:
             logger.error(f"保存分块失败: {e}")
             raise
+
+    def _clean_stage(self, documents):
+        """清洗阶段：逐个文档清洗"""
+        count = 0
+        for doc_id, text, metadata in documents:
+            count += 1
+            yield doc_id, dp.clean_paragraphs([text])[0], metadata
+        logger.info(f"成功清洗 {count} 个文档")
+
+    def _chunk_stage(self, documents, splitter):
+        """分块阶段：每个文档单独分块（文本块不跨越文件）"""
+        for doc_id, text, metadata in documents:
+            chunks = splitter.split_text(text) if text.strip() else []
+            yield doc_id, text, chunks, metadata
+
+    def _prepare_stage(self, input_dir, keep_text):
+        """
+        加载 → 清洗 → 分块，逐个文档产出 (文档ID, 清洗后文本, 文本块, 源文件元数据)，顺序与文件路径顺序一致
+        多核时由进程池并行处理各文件；单核时各阶段在后台线程中流式衔接
+        """
+        workers = self.preprocess_workers if self.preprocess_workers is not None else pi.available_cores()
+        if workers > 1:
+            return pi.prepare_documents(input_dir, workers, keep_text=keep_text)
+        # 分块模块导入时即加载BERT模型，只在当前进程内分块时导入
+        from . import chunk_processor as cp
+        splitter = cp.OptimizedHybridSplitter()
+        documents = run_stage(dp.iter_documents(input_dir), name="load")
+        cleaned = run_stage(self._clean_stage(documents), name="clean")
+        return self._chunk_stage(cleaned, splitter)
+
+    def _debug_stage(self, documents, cleaned_output_dir=None, chunks_output_dir=None):
+        """调试输出：清洗后文本追加写入 cleaned_output.txt，文本块写出 chunk_N.txt"""
+        debug_file = None
+        if cleaned_output_dir:
+            os.makedirs(cleaned_output_dir, exist_ok=True)
+            debug_file = open(os.path.join(cleaned_output_dir, "cleaned_output.txt"), "w", encoding="utf-8")
+        try:
+            total = 0
+            for index, (doc_id, text, chunks, metadata) in enumerate(documents):
+                if debug_file:
+                    debug_file.write(("\n\n" if index else "") + text)
+                if chunks_output_dir and chunks:
+                    self.save_chunks(chunks, chunks_output_dir, start=total + 1)
+                total += len(chunks)
+                yield doc_id, text, chunks, metadata
+        finally:
+            if debug_file:
+                debug_file.close()
+
+    def _document_stream(self, input_dir, cleaned_output_dir=None, chunks_output_dir=None, debug_output=False):
+        """产出 (文档ID, 文本块, 源文件元数据) 供向量库流式同步"""
+        documents = self._prepare_stage(input_dir, keep_text=debug_output)
+        if debug_output:
+            documents = self._debug_stage(documents, cleaned_output_dir, chunks_output_dir)
+        total = 0
+        for doc_id, _, chunks, metadata in documents:
+            logger.debug(f"{doc_id}: {len(chunks)} 个分块")
+            total += len(chunks)
+            yield doc_id, chunks, metadata
+        logger.info(f"生成 {total} 个分块")
     
-    def process(self, input_dir, cleaned_output_dir, chunks_output_dir, vector_db_output_dir):
-        """执行完整文档处理流程"""
+    def process(self, input_dir, cleaned_output_dir=None, chunks_output_dir=None,
+                vector_db_output_dir="./vector_db", debug_output=False):
+        """
+        执行完整文档处理流程
+        加载、清洗、分块逐个源文件进行（多核时由进程池并行），与嵌入、写索引之间用有界队列衔接，嵌入按批进行；
+        峰值内存由队列长度与嵌入批大小决定。cleaned_output_dir / chunks_output_dir 仅在 debug_output=True 时写出。
+        """
         try:
-            # 1. 加载文档
-            logger.info("开始加载文档...")
-            documents = dp.load_documents(input_dir)
-            
-            # 2. 清洗文档
-            logger.info("开始清洗文档...")
-            cleaned_docs = dp.clean_documents(documents)
-            
-            # 3. 保存清洗后的文档
-            logger.info("保存清洗后的文档...")
-            dp.save_cleaned_documents(cleaned_docs, cleaned_output_dir)
-            
-            # 4. 读取合并后的清洗文本
-            cleaned_file_path = os.path.join(cleaned_output_dir, "cleaned_output.txt")
-            with open(cleaned_file_path, "r", encoding="utf-8") as f:
-                combined_text = f.read()
-            
-            # 5. 分块处理
-            logger.info("开始分块处理...")
-            splitter = cp.OptimizedHybridSplitter()
-            chunks = splitter.split_text(combined_text)
-            logger.info(f"生成 {len(chunks)} 个分块")
-            
-            # 6. 保存分块结果
-            logger.info("保存分块结果...")
-            self.save_chunks(chunks, chunks_output_dir)
-            
-            # 7. 读取所有分块文件内容
-            chunks_list = []
-            for chunk_file in os.listdir(chunks_output_dir):
-                if chunk_file.endswith(".txt"):
-                    file_path = os.path.join(chunks_output_dir, chunk_file)
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        chunks_list.append(f.read())
-            
-            if not chunks_list:
-                logger.error("没有分块内容可用于构建向量数据库")
-                return False
-            
-            # 8. 构建向量数据库
             vdb = vp.VectorDB(
                 model_path=self.embedding_model_path,
                 device=self.device,
-                db_path=vector_db_output_dir
+                db_path=vector_db_output_dir,
+                backend=self.embedding_backend,
+                index_type=self.index_type,
+                index_params=self.index_params,
+                embedding_workers=self.embedding_workers
             )
             
-            if vdb.process_chunks(chunks_list):
-                vdb.save_index()
-                logger.info("✅ 向量数据库构建完成！")
-                return True
-            else:
+            try:
+                # 已有向量库时增量同步：只嵌入新增或内容变化的文本块
+                loaded = vdb.load_existing_index()
+                rebuilt = loaded and vdb.index_type != self.index_type
+                if rebuilt:
+                    vdb.rebuild_index(self.index_type, self.index_params)
+                doc_meta = dict(vdb.doc_meta)
+
+                logger.info("开始流式处理文档（加载 → 清洗 → 分块 → 嵌入 → 索引）...")
+                documents = run_stage(
+                    self._document_stream(input_dir, cleaned_output_dir, chunks_output_dir, debug_output),
+                    name="prepare"
+                )
+                stats = vdb.sync_stream(documents, remove_missing=True)
+
+                if not vdb.num_chunks:
+                    logger.error("没有分块内容可用于构建向量数据库")
+                    return False
+                unchanged = not stats["added"] and not stats["removed"] and vdb.doc_meta == doc_meta
+                if loaded and not rebuilt and unchanged:
+                    logger.info("✅ 文本块无变化，跳过索引写入")
+                    return True
+                # save_index 同时写入向量索引、清单、文本块存储与BM25索引
+                if vdb.save_index():
+                    logger.info("✅ 向量数据库与BM25索引构建完成！")
+                    return True
                 logger.error("❌ 向量数据库构建失败")
                 return False
+            finally:
+                vdb.close()
                 
         except Exception as e:
             logger.error(f"文档处理流程出错: {e}")
-            raise
\ No newline at end of file
+            raise
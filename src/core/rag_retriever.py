@@ -1,17 +1,53 @@
 import os
 os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'  # 设置镜像源
+import asyncio
+import contextvars
+import functools
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 from typing import List, Dict, Tuple, Optional
 import numpy as np
 from pathlib import Path
 from huggingface_hub import snapshot_download
 
 # 第三方库
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from rank_bm25 import BM25Okapi
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-import torch
+import faiss
+
+from src.core.ann_index import (
+    SEARCH_PARAM_KEYS, VECTORS_FILENAME, load_index_meta, make_search_parameters, read_index_mmap, refine_exact
+)
+from src.core.bm25_index import BM25Index, BM25_DIRNAME
+from src.core.deadline import Deadline, LatencyEstimator, worse
+from src.core.embedding_backend import (
+    EMBEDDING_BACKENDS, TORCH_DTYPES, SharedEmbeddings, acquire_embedding_backend, backend_label
+)
+from src.core.fusion import FUSION_MODES, fuse
+from src.core.metrics import MetricsSink, default_metrics_sink, record_batch, record_count, stage, track_timings
+from src.core.inference_cache import LRUCache, normalize_query, query_hash
+from src.core.model_registry import model_registry, SharedModel
+from src.core.recall import DEFAULT_RECALL_TIMEOUTS, RecallLeg, get_recall_pool, run_recall, run_recall_batch
+from src.core.rerank_backend import RERANK_BACKENDS, load_rerank_backend
+from src.core.rerank_policy import RerankPolicy
+from src.core.rerank_scheduler import RerankBatcher
+from src.core.result_cache import ResultCache, create_result_cache, make_result_key
+from src.core.text_store import TEXT_STORE_DIRNAME, TextStore
+from src.core.token_store import TOKEN_STORE_DIRNAME, TokenStore, tokenizer_fingerprint, truncate_pair
+from src.core.vector_db import docstore_texts, docstore_fingerprint, load_manifest
+
+# 预热查询：长短不同，覆盖不同序列长度的算子选择
+WARMUP_QUERIES = [
+    "什么是条件概率？",
+    "古典概型与几何概型的区别是什么",
+    "请解释中心极限定理的含义，并说明它在抽样分布和参数的区间估计中如何应用，举一个具体的例子。"
+]
+
+# 本次召回中向量路计算的查询向量 {查询: 向量}（供余弦级联复用，查询向量缓存关闭时也不重复前向计算）
+_recall_vectors: contextvars.ContextVar[Optional[Dict[str, np.ndarray]]] = contextvars.ContextVar(
+    "recall_vectors", default=None
+)
+
 
 class RAGRetriever:
     """RAG检索器（支持完整RAG流程：多路召回+混合检索+重排序）"""
@@ -22,7 +58,40 @@ class RAGRetriever:
         embedding_model_path: str = "./model/embeddingmodel",
         rerank_model_name: str = "./model/reranker",
         device: str = "cpu",
-        download_mirror: Optional[str] = None
+        download_mirror: Optional[str] = None,
+        dtype: str = "float32",
+        bm25_pruning: bool = True,
+        rerank_batch_size: int = 32,
+        rerank_batching: bool = False,
+        rerank_max_batch_size: int = 64,
+        rerank_max_wait_ms: float = 5.0,
+        embedding_cache_mb: float = 64.0,
+        rerank_cache_mb: float = 16.0,
+        result_cache: str = "memory",
+        result_cache_ttl: float = 600.0,
+        result_cache_path: Optional[str] = None,
+        fusion_mode: str = "minmax",
+        rrf_k: int = 60,
+        recall_timeouts: Optional[Dict[str, float]] = None,
+        async_workers: int = 4,
+        rerank_backend: str = "torch",
+        onnx_threads: int = 0,
+        embedding_backend: str = "torch",
+        embedding_batch_size: int = 32,
+        embedding_max_seq_length: Optional[int] = None,
+        rerank_max_length: int = 512,
+        rerank_max_batch_tokens: int = 8192,
+        rerank_pretokenize: bool = True,
+        rerank_mode: str = "always",
+        rerank_skip_margin: float = 0.5,
+        rerank_cosine_window: float = 0.15,
+        latency_budget_ms: Optional[float] = None,
+        parallel_load: bool = True,
+        collection: Optional[str] = None,
+        metrics_sink: Optional[MetricsSink] = None,
+        search_params: Optional[Dict] = None,
+        exact_refine: bool = False,
+        refine_factor: int = 4
     ):
         """
         初始化检索器
@@ -31,18 +100,137 @@ class RAGRetriever:
         :param rerank_model_name: 重排序模型名称或路径
         :param device: 计算设备
         :param download_mirror: 模型下载镜像地址
+        :param dtype: 模型权重精度（float32/float16/bfloat16）
+        :param bm25_pruning: BM25检索是否启用MaxScore剪枝
+        :param rerank_batch_size: 重排序每批最多处理的查询-文档对数
+        :param rerank_batching: 是否启用并发请求的重排序微批调度
+        :param rerank_max_batch_size: 微批调度每批最多合并的查询-文档对数
+        :param rerank_max_wait_ms: 微批调度最长等待时间（毫秒）
+        :param embedding_cache_mb: 查询向量LRU缓存容量（MB，0表示不缓存）
+        :param rerank_cache_mb: 重排序得分LRU缓存容量（MB，0表示不缓存）
+        :param result_cache: 检索结果缓存后端（none/memory/sqlite）
+        :param result_cache_ttl: 检索结果缓存有效期（秒）
+        :param result_cache_path: sqlite结果缓存文件路径（默认存放于向量库目录）
+        :param fusion_mode: 混合检索分数融合方式（minmax/zscore/rrf）
+        :param rrf_k: RRF融合平滑常数
+        :param recall_timeouts: 各召回路超时（秒，从该路开始执行时计起），默认向量2s、BM25 1s
+        :param async_workers: 异步接口专用线程池大小（限制同时执行的模型计算数）
+        :param rerank_backend: 重排序推理后端（torch/onnx/onnx-int8，ONNX不可用时回退torch）
+        :param onnx_threads: onnxruntime算子内线程数（0表示自动）
+        :param embedding_backend: 嵌入推理后端（torch/onnx/onnx-int8，需与建库时一致，加载时校验）
+        :param embedding_batch_size: 嵌入模型每批编码的文本数
+        :param embedding_max_seq_length: 嵌入模型最大序列长度（默认取模型配置）
+        :param rerank_max_length: 重排序查询-文档对的最大token数
+        :param rerank_max_batch_tokens: 重排序每批的最大token数（批大小×批内最长序列）
+        :param rerank_pretokenize: 是否预分词语料文本块（持久化于向量库目录，查询时只需对查询分词）
+        :param rerank_mode: 重排序模式（always：总是重排序；adaptive：按置信度跳过或级联剪枝）
+        :param rerank_skip_margin: adaptive模式下融合分数相对领先幅度超过该值时跳过重排序
+        :param rerank_cosine_window: adaptive模式下向量余弦级联的保留窗口
+        :param latency_budget_ms: full_retrieval 默认延迟预算（毫秒，None表示不限）
+        :param parallel_load: 是否并行加载嵌入模型、重排序模型与向量库（含BM25）
+        :param collection: 知识库名称（指标标签，默认取向量库上级目录名）
+        :param metrics_sink: 阶段耗时指标汇聚（默认进程内直方图 default_metrics_sink）
+        :param search_params: FAISS查询参数（hnsw: efSearch；ivf/ivfpq: nprobe），默认取建库时保存的值
+        :param exact_refine: 压缩索引（sq8/fp16/ivfpq）检索后是否用原始向量（vectors.npy，mmap）精确重排
+        :param refine_factor: 精确重排时从压缩索引多取的候选倍数
         """
+        if dtype not in TORCH_DTYPES:
+            raise ValueError(f"不支持的精度: {dtype}")
+        if rerank_backend not in RERANK_BACKENDS:
+            raise ValueError(f"不支持的重排序后端: {rerank_backend}")
+        if embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"不支持的嵌入后端: {embedding_backend}")
+        if fusion_mode not in FUSION_MODES:
+            raise ValueError(f"不支持的融合方式: {fusion_mode}")
         self.device = device
         self.download_mirror = download_mirror
+        self.dtype = dtype
+        self.rerank_backend = rerank_backend
+        self.onnx_threads = onnx_threads
+        self.embedding_backend = embedding_backend
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_max_seq_length = embedding_max_seq_length
+        self.bm25_pruning = bm25_pruning
+        self.rerank_batch_size = rerank_batch_size
+        self.rerank_max_length = rerank_max_length
+        self.rerank_max_batch_tokens = rerank_max_batch_tokens
+        self.rerank_pretokenize = rerank_pretokenize
+        self.rerank_policy = RerankPolicy(rerank_mode, rerank_skip_margin, rerank_cosine_window)
+        self.chunk_tokens: Optional[TokenStore] = None
+        self.fusion_mode = fusion_mode
+        self.rrf_k = rrf_k
+        self.recall_timeouts = {**DEFAULT_RECALL_TIMEOUTS, **(recall_timeouts or {})}
+        self.recall_legs: Dict[str, RecallLeg] = {}
+        self.async_workers = async_workers
+        self._async_executor: Optional[ThreadPoolExecutor] = None
+        self._rerank_executor: Optional[ThreadPoolExecutor] = None
+        self.latency_budget_ms = latency_budget_ms
+        self.latency_estimator = LatencyEstimator()
+        self.collection = collection or Path(vector_db_path).resolve().parent.name
+        self.metrics_sink = metrics_sink if metrics_sink is not None else default_metrics_sink
+        self.index_type = "flat"
+        self.search_params: Dict = dict(search_params or {})
+        self._faiss_search_params = None
+        self.exact_refine = exact_refine
+        self.refine_factor = max(int(refine_factor), 1)
+        # 原始float32向量（mmap，仅精确重排时加载）
+        self.raw_vectors: Optional[np.ndarray] = None
+        self.faiss_index: Optional[faiss.Index] = None
+        self.chunk_texts: Optional[TextStore] = None
+        self.rerank_batcher: Optional[RerankBatcher] = None
+        self.index_version: Optional[str] = None
+        # 向量库清单的构建ID（每次保存索引时更新，旧版向量库为None）
+        self.index_build: Optional[str] = None
+        self.index_meta: Dict = {}
+        self.result_cache: Optional[ResultCache] = None
+        self.embedding_cache = (
+            LRUCache(int(embedding_cache_mb * 1024 * 1024), name="embedding")
+            if embedding_cache_mb > 0 else None
+        )
+        self.rerank_cache = (
+            LRUCache(int(rerank_cache_mb * 1024 * 1024), sizeof=lambda _: 160, name="rerank")
+            if rerank_cache_mb > 0 else None
+        )
+        self._embedding_entry: Optional[SharedModel] = None
+        self._rerank_entry: Optional[SharedModel] = None
+        self.is_ready = False
         self._init_logging()
         
-        # 初始化基础组件
-        self._load_embedding_model(embedding_model_path)
-        self._load_vector_db(vector_db_path)
-        self._load_rerank_model(rerank_model_name)
-        
-        # 初始化BM25
-        self._init_bm25()
+        try:
+            # 初始化基础组件（嵌入模型、重排序模型、向量库+BM25 三者互不依赖，可并行加载）
+            self._load_components(embedding_model_path, rerank_model_name, vector_db_path, parallel_load)
+            self._check_embedding_backend()
+            if rerank_batching:
+                # 微批调度的元素为 (查询, 文档, 文本块ID)
+                self.rerank_batcher = RerankBatcher(
+                    lambda items: self._score_pairs([item[:2] for item in items], [item[2] for item in items]),
+                    max_batch_size=rerank_max_batch_size,
+                    max_wait_ms=rerank_max_wait_ms
+                )
+            if rerank_pretokenize:
+                self._init_chunk_tokens(vector_db_path)
+
+            # 注册召回路（可通过 register_recall_leg 扩展）
+            self.register_recall_leg(RecallLeg(
+                "vector",
+                lambda query, top_k: self._vector_search(self._recall_embed([query]), top_k)[0],
+                lambda queries, top_k: self._vector_search(self._recall_embed(queries), top_k)
+            ))
+            self.register_recall_leg(RecallLeg(
+                "bm25",
+                self._bm25_search,
+                lambda queries, top_k: self.bm25_index.search_batch(queries, top_k=top_k)
+            ))
+
+            # 初始化检索结果缓存（只清理本向量库其他索引版本遗留的条目，共用缓存文件的其他知识库不受影响）
+            self.result_cache = create_result_cache(
+                result_cache, vector_db_path, ttl=result_cache_ttl, path=result_cache_path
+            )
+            if self.result_cache is not None:
+                self.result_cache.invalidate(keep_fingerprint=self.result_version)
+        except Exception:
+            self.close()
+            raise
 
     def _init_logging(self):
         """配置日志记录"""
@@ -51,44 +239,143 @@ class RAGRetriever:
             format="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
         )
     
+    def _load_components(self, embedding_model_path: str, rerank_model_name: str, db_path: str,
+                         parallel: bool = True):
+        """加载嵌入模型、重排序模型、向量库与BM25索引"""
+        def load_index():
+            self._load_vector_db(db_path)
+            self._init_bm25(db_path)
+
+        tasks = [
+            lambda: self._load_embedding_model(embedding_model_path),
+            lambda: self._load_rerank_model(rerank_model_name),
+            load_index
+        ]
+        started = time.perf_counter()
+        if parallel:
+            with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="rag-load") as pool:
+                futures = [pool.submit(task) for task in tasks]
+                # 等待全部结束后再抛出异常，保证失败时 close() 能释放已加载的模型
+                wait(futures)
+                for future in futures:
+                    future.result()
+        else:
+            for task in tasks:
+                task()
+        logging.info(f"⏱️ 组件加载耗时 {(time.perf_counter() - started) * 1000:.0f}ms（并行={parallel}）")
+
     def _load_embedding_model(self, model_path: str):
-        """加载本地嵌入模型"""
+        """加载本地嵌入模型（经模型注册表在进程内共享）"""
         try:
-            self.embedding_model = HuggingFaceEmbeddings(
-                model_name=model_path,
-                model_kwargs={'device': self.device},
-                encode_kwargs={'normalize_embeddings': False}
+            self._embedding_entry = acquire_embedding_backend(
+                model_path,
+                backend=self.embedding_backend,
+                device=self.device,
+                dtype=self.dtype,
+                max_seq_length=self.embedding_max_seq_length,
+                intra_op_threads=self.onnx_threads
             )
-            logging.info("✅ 嵌入模型加载成功")
+            self.embedding_model = SharedEmbeddings(self._embedding_entry, batch_size=self.embedding_batch_size)
+            logging.info(f"✅ 嵌入模型加载成功（{type(self.embedding_model.backend).__name__}）")
         except Exception as e:
             logging.error(f"❌ 嵌入模型加载失败: {str(e)}")
             raise
     
     def _load_vector_db(self, db_path: str):
-        """加载向量数据库"""
+        """
+        加载向量数据库
+        FAISS索引以mmap方式打开，文本块正文从偏移索引的文本存储按需读取，
+        同一节点上的多个worker进程共享页缓存，不再各自反序列化LangChain docstore。
+        """
         try:
-            self.vector_db = FAISS.load_local(
-                folder_path=db_path,
-                embeddings=self.embedding_model,
-                allow_dangerous_deserialization=True
+            db_path = Path(db_path)
+            self.faiss_index = read_index_mmap(db_path / "index.faiss")
+            meta = self.index_meta = load_index_meta(db_path)
+            # FAISS返回的ID即文本块行号（增量删除后的空行不在索引中）
+            num_rows = meta.get("num_rows", self.faiss_index.ntotal)
+            # 文本块存储须与清单记录的语料一致（保存过程中启动的进程可能看到新旧混合的文件）
+            manifest = load_manifest(db_path)
+            self.index_build = manifest.get("build_id") if manifest is not None else None
+            self.chunk_texts = TextStore.load(
+                db_path / TEXT_STORE_DIRNAME, num_chunks=num_rows,
+                fingerprint=manifest["fingerprint"] if manifest is not None else None
+            )
+            if self.chunk_texts is None:
+                if manifest is not None:
+                    raise ValueError("文本块存储与向量库清单不一致，请重新保存索引")
+                self.chunk_texts = self._convert_docstore(db_path)
+
+            self.index_type = meta["index_type"]
+            self.set_search_params(**{
+                **{key: value for key, value in meta["params"].items() if key in SEARCH_PARAM_KEYS[self.index_type]},
+                **self.search_params
+            })
+            self.raw_vectors = None
+            if self.exact_refine:
+                vectors_path = db_path / VECTORS_FILENAME
+                if vectors_path.exists():
+                    self.raw_vectors = np.load(vectors_path, mmap_mode="r")
+                else:
+                    logging.warning(f"⚠️ 未找到 {VECTORS_FILENAME}，无法精确重排，直接使用压缩索引结果")
+            logging.info(
+                f"✅ 向量数据库加载成功（{self.faiss_index.ntotal}条数据，{self.index_type} {self.search_params}，"
+                f"文本 {self.chunk_texts.nbytes / 2 ** 20:.1f}MB）"
             )
-            logging.info(f"✅ 向量数据库加载成功（{self.vector_db.index.ntotal}条数据）")
         except Exception as e:
             logging.error(f"❌ 向量数据库加载失败: {str(e)}")
             raise
+
+    def _check_embedding_backend(self):
+        """查询向量须与建库向量由同一推理后端生成（含ONNX回退PyTorch的情况；旧版索引未记录时不校验）"""
+        built_with = self.index_meta.get("embedding_backend")
+        loaded = backend_label(self.embedding_model.backend)
+        if built_with is not None and built_with != loaded:
+            raise ValueError(f"嵌入后端与建库时不一致：建库 {built_with}，当前 {loaded}（请使用相同后端或重建索引）")
+
+    @staticmethod
+    def _convert_docstore(db_path: Path) -> TextStore:
+        """旧版向量库（只有pickle docstore）：读取一次并转换为文本存储，之后的进程直接mmap加载"""
+        store = FAISS.load_local(folder_path=db_path, embeddings=None, allow_dangerous_deserialization=True)
+        text_store = TextStore.build(docstore_texts(store), docstore_fingerprint(store))
+        del store
+        try:
+            text_store.save(db_path / TEXT_STORE_DIRNAME)
+            logging.info(f"✅ 已将docstore转换为文本块存储（{len(text_store)}条）")
+            return TextStore.load(db_path / TEXT_STORE_DIRNAME, num_chunks=len(text_store)) or text_store
+        except OSError as e:
+            logging.warning(f"⚠️ 文本块存储持久化失败（不影响检索）: {str(e)}")
+            return text_store
     
     def _load_rerank_model(self, model_name: str):
-        """加载重排序模型（自动下载如果不存在）"""
+        """
+        加载重排序模型（自动下载如果不存在，经模型注册表在进程内共享）
+        ONNX不可用时以PyTorch的键重新获取：注册表键始终对应实际加载的后端
+        """
+        def acquire(backend: str):
+            # ONNX后端以后端名区分精度，PyTorch后端以权重精度区分
+            precision = self.dtype if backend == "torch" else backend
+            return model_registry.acquire(
+                "reranker", model_name,
+                lambda: load_rerank_backend(
+                    model_name, backend=backend, device=self.device, torch_dtype=TORCH_DTYPES[self.dtype],
+                    intra_op_threads=self.onnx_threads, fallback=False
+                ),
+                device=self.device, dtype=precision
+            )
+
         try:
             # 检查是否为本地路径
-            model_path = Path(model_name)
-            if not model_path.exists():
+            if not Path(model_name).exists():
                 self._download_rerank_model(model_name)
-            
-            self.rerank_tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.rerank_model = AutoModelForSequenceClassification.from_pretrained(model_name)
-            self.rerank_model.to(self.device)
-            logging.info(f"✅ 重排序模型加载成功: {model_name}")
+            try:
+                self._rerank_entry = acquire(self.rerank_backend)
+            except Exception as e:
+                if self.rerank_backend == "torch":
+                    raise
+                logging.warning(f"⚠️ ONNX重排序后端不可用，回退到PyTorch: {str(e)}")
+                self._rerank_entry = acquire("torch")
+            self.rerank_tokenizer, self.rerank_model = self._rerank_entry.model
+            logging.info(f"✅ 重排序模型加载成功: {model_name}（{type(self.rerank_model).__name__}）")
         except Exception as e:
             logging.error(f"❌ 重排序模型加载失败: {str(e)}")
             raise
@@ -116,17 +403,280 @@ class RAGRetriever:
             logging.error(f"❌ 模型下载失败: {str(e)}")
             raise
     
-    def _init_bm25(self):
-        """初始化BM25索引"""
+    def _init_bm25(self, db_path: str):
+        """初始化BM25索引（优先mmap加载持久化索引，缺失或过期时重建）"""
         try:
-            all_texts = [doc.page_content for doc in self.vector_db.docstore._dict.values()]
-            self.bm25_index = BM25Okapi([doc.split() for doc in all_texts])
-            self.all_texts = all_texts
-            logging.info(f"✅ BM25索引构建成功（{len(all_texts)}条数据）")
+            bm25_dir = Path(db_path) / BM25_DIRNAME
+            fingerprint = self.chunk_texts.fingerprint
+
+            self.bm25_index = BM25Index.load(bm25_dir, fingerprint=fingerprint, mmap=True)
+            if self.bm25_index is not None:
+                logging.info(f"✅ BM25索引加载成功（{len(self.chunk_texts)}条数据）")
+            else:
+                self.bm25_index = BM25Index.build(list(self.chunk_texts))
+                logging.info(f"✅ BM25索引构建成功（{len(self.chunk_texts)}条数据）")
+                try:
+                    self.bm25_index.save(bm25_dir, fingerprint)
+                except OSError as e:
+                    logging.warning(f"⚠️ BM25索引持久化失败（不影响检索）: {str(e)}")
+            self._set_index_version(fingerprint)
         except Exception as e:
-            logging.error(f"❌ BM25索引构建失败: {str(e)}")
+            logging.error(f"❌ BM25索引初始化失败: {str(e)}")
             raise
 
+    def _init_chunk_tokens(self, db_path: str):
+        """加载或构建文本块的重排序token ID（失败时回退为查询时分词）"""
+        try:
+            store_dir = Path(db_path) / TOKEN_STORE_DIRNAME
+            with self._rerank_entry.lock:
+                signature = tokenizer_fingerprint(self.rerank_tokenizer, self.rerank_max_length)
+            self.chunk_tokens = TokenStore.load(store_dir, self.index_version, signature, mmap=True)
+            if self.chunk_tokens is not None:
+                logging.info(f"✅ 预分词结果加载成功（{int(self.chunk_tokens.indptr[-1])}个token）")
+                return
+
+            with self._rerank_entry.lock:
+                self.chunk_tokens = TokenStore.build(
+                    self.rerank_tokenizer, list(self.chunk_texts), max_length=self.rerank_max_length
+                )
+            logging.info(f"✅ 文本块预分词完成（{len(self.chunk_tokens)}条）")
+            try:
+                self.chunk_tokens.save(store_dir, self.index_version, signature)
+            except OSError as e:
+                logging.warning(f"⚠️ 预分词结果持久化失败（不影响检索）: {str(e)}")
+        except Exception as e:
+            self.chunk_tokens = None
+            logging.warning(f"⚠️ 文本块预分词失败，重排序时按需分词: {str(e)}")
+
+    def set_search_params(self, **params) -> None:
+        """
+        调整FAISS查询参数（如 efSearch=128、nprobe=32），按查询传入索引，不修改共享索引对象
+        与当前索引类型无关的参数被忽略
+        """
+        self.search_params = {key: value for key, value in params.items() if key in SEARCH_PARAM_KEYS[self.index_type]}
+        self._faiss_search_params = make_search_parameters(self.index_type, self.search_params)
+
+    def _set_index_version(self, version: str):
+        """记录索引版本，版本变化时推理缓存失效"""
+        self.index_version = version
+        for cache in (self.embedding_cache, self.rerank_cache):
+            if cache is not None:
+                cache.set_version(version)
+
+    def cache_stats(self) -> Dict[str, Dict]:
+        """推理缓存命中统计"""
+        return {
+            name: cache.stats()
+            for name, cache in (("embedding", self.embedding_cache), ("rerank", self.rerank_cache))
+            if cache is not None
+        }
+
+    @property
+    def result_version(self) -> Optional[str]:
+        """检索结果缓存的版本：语料指纹 + 构建ID（语料不变的重建同样使旧结果失效，与缓存文件位置无关）"""
+        if self.index_build is None:
+            return self.index_version
+        return f"{self.index_version}@{self.index_build}"
+
+    def invalidate_result_cache(self) -> int:
+        """清空本向量库的检索结果缓存（索引重建后调用）"""
+        return self.result_cache.invalidate() if self.result_cache is not None else 0
+
+    def _result_key(self, query: str, retrieval_top_k: int, rerank_top_k: int,
+                    weights: Optional[Dict[str, float]]) -> str:
+        """检索结果缓存键"""
+        return make_result_key(
+            query, self.result_version,
+            retrieval_top_k=retrieval_top_k, rerank_top_k=rerank_top_k, weights=weights,
+            fusion_mode=self.fusion_mode, rrf_k=self.rrf_k, rerank_mode=self.rerank_policy.mode,
+            rerank_skip_margin=self.rerank_policy.skip_margin, rerank_cosine_window=self.rerank_policy.cosine_window,
+            search_params=self.search_params,
+            exact_refine=self.raw_vectors is not None, refine_factor=self.refine_factor
+        )
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """查询向量（归一化查询文本命中缓存时跳过模型计算）"""
+        return self._embed_queries([query])[0]
+
+    def _recall_embed(self, queries: List[str]) -> np.ndarray:
+        """向量召回路的查询向量，同时记录到本次召回的查询向量表"""
+        vectors = self._embed_queries(queries)
+        recorded = _recall_vectors.get()
+        if recorded is not None:
+            recorded.update(zip(queries, vectors))
+        return vectors
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """批量查询向量：缓存未命中的查询合并为一次前向计算"""
+        keys = [normalize_query(query) for query in queries]
+        vectors: List[Optional[np.ndarray]] = [
+            self.embedding_cache.get(key) if self.embedding_cache is not None else None
+            for key in keys
+        ]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            record_batch("embedding", len(missing))
+            with stage("embedding"):
+                computed = self.embedding_model.encode([queries[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(keys[i], vectors[i])
+        return np.vstack(vectors)
+
+    def warmup(self, queries: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        预热：用样例查询跑通嵌入、FAISS、BM25、融合与重排序各阶段（绕过各级缓存），
+        触发首次内存分配与算子选择，并为延迟预算提供初始耗时估计
+        :param queries: 预热查询（默认 WARMUP_QUERIES）
+        :return: 各阶段累计耗时（毫秒）
+        """
+        queries = queries or WARMUP_QUERIES
+        timings = {"embedding": 0.0, "faiss": 0.0, "bm25": 0.0, "fusion": 0.0, "rerank": 0.0}
+        started = time.perf_counter()
+
+        def timed(stage, fn, *args, **kwargs):
+            begin = time.perf_counter()
+            value = fn(*args, **kwargs)
+            timings[stage] += (time.perf_counter() - begin) * 1000
+            return value
+
+        for query in queries:
+            begin = time.perf_counter()
+            vectors = timed("embedding", self.embedding_model.encode, [query])
+            vector_hits = timed("faiss", self._vector_search, vectors, 10)[0]
+            self.latency_estimator.update("recall.vector", (time.perf_counter() - begin) * 1000)
+            bm25_hits = timed("bm25", self.bm25_index.search, query, top_k=10, prune=self.bm25_pruning)
+            fused_ids, _ = timed("fusion", self._fuse, {"vector": vector_hits, "bm25": bm25_hits}, None, 10)
+
+            begin = time.perf_counter()
+            pairs = [(query, text) for text in self.chunk_texts.get_many(fused_ids)]
+            timed("rerank", self._score_pairs, pairs, fused_ids.tolist())
+            if pairs:
+                self.latency_estimator.update("rerank.pair", (time.perf_counter() - begin) * 1000 / len(pairs))
+
+        # 批量路径（多行嵌入与BM25矩阵乘）
+        timed("embedding", self.embedding_model.encode, list(queries))
+        timed("bm25", self.bm25_index.search_batch, list(queries), top_k=10)
+
+        self.is_ready = True
+        logging.info(f"🔥 预热完成，耗时 {(time.perf_counter() - started) * 1000:.0f}ms: "
+                     + ", ".join(f"{stage}={ms:.0f}ms" for stage, ms in timings.items()))
+        return timings
+
+    def close(self):
+        """释放对共享模型的引用（引用归零时由注册表卸载权重）"""
+        if self._async_executor is not None:
+            self._async_executor.shutdown(wait=False, cancel_futures=True)
+            self._async_executor = None
+        if self._rerank_executor is not None:
+            self._rerank_executor.shutdown(wait=False, cancel_futures=True)
+            self._rerank_executor = None
+        if self.rerank_batcher is not None:
+            self.rerank_batcher.close()
+            self.rerank_batcher = None
+        if self._embedding_entry is not None:
+            model_registry.release(self._embedding_entry)
+            self._embedding_entry = None
+        if self._rerank_entry is not None:
+            model_registry.release(self._rerank_entry)
+            self._rerank_entry = None
+        self.rerank_tokenizer = None
+        self.rerank_model = None
+        self.is_ready = False
+        logging.info("🔌 检索器已释放模型引用")
+
+    def _vector_search(self, query_vectors, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        FAISS向量检索（支持多行查询向量一次检索）
+        :param query_vectors: 查询向量（单个或多个）
+        :param top_k: 每个查询返回数量
+        :return: 每个查询的 (文本块ID数组, L2距离数组)
+        """
+        vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        refine = self.raw_vectors is not None
+        with stage("faiss"):
+            fetch_k = top_k * self.refine_factor if refine else top_k
+            distances, indices = self.faiss_index.search(vectors, fetch_k, params=self._faiss_search_params)
+        if refine:
+            with stage("exact_refine"):
+                distances, indices = refine_exact(self.raw_vectors, vectors, indices, top_k)
+
+        results = []
+        for dist_row, id_row in zip(distances, indices):
+            valid = id_row >= 0
+            results.append((id_row[valid].astype(np.int64), dist_row[valid]))
+        return results
+
+    def _bm25_search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25召回"""
+        with stage("bm25"):
+            return self.bm25_index.search(query, top_k=top_k, prune=self.bm25_pruning)
+
+    def _to_texts(self, ids: np.ndarray, scores: np.ndarray) -> List[Tuple[str, float]]:
+        """文本块ID -> (文本, 分数)"""
+        return [(text, float(score)) for text, score in zip(self.chunk_texts.get_many(ids), scores)]
+
+    def register_recall_leg(self, leg: RecallLeg):
+        """
+        注册一路召回（与已有召回路并发执行，融合时按 weights 中同名权重参与）
+        共享召回线程池按 async_workers × 召回路数 扩容，并发请求的各路不必排队等待线程
+        :param leg: 召回路，未设置超时时使用 recall_timeouts 中的配置
+        """
+        if leg.timeout is None:
+            leg.timeout = self.recall_timeouts.get(leg.name)
+        self.recall_legs[leg.name] = leg
+        get_recall_pool(self.async_workers * len(self.recall_legs))
+
+    def _recall(self, query: str, top_k: int, deadline: Optional[Deadline] = None,
+                query_vectors: Optional[Dict[str, np.ndarray]] = None) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], Dict[str, Dict]]:
+        """
+        多路召回（文本块ID形式，各路在共享线程池中并发执行）
+        有延迟预算时各路超时不超过剩余时间；预计向量路来不及完成时只执行BM25
+        BM25路是降级的兜底结果，只受其自身超时限制（预算耗尽时也照常执行，结果降级为 bm25_only）
+        :param query_vectors: 传入时记录向量路计算的查询向量
+        :return: ({召回路: (文本块ID数组, 分数数组)}, {召回路: 状态与耗时})，向量路分数为L2距离
+        """
+        legs, timeouts = self.recall_legs, None
+        if deadline is not None:
+            remaining = deadline.remaining()
+            vector_ms = self.latency_estimator.get("recall.vector")
+            if "bm25" in legs and vector_ms is not None and vector_ms > remaining * 1000:
+                legs = {"bm25": legs["bm25"]}
+            timeouts = {
+                name: remaining if leg.timeout is None else min(leg.timeout, remaining)
+                for name, leg in legs.items() if name != "bm25"
+            }
+
+        token = _recall_vectors.set(query_vectors)
+        try:
+            with stage("recall"):
+                hits, report = run_recall(legs, query, top_k, timeouts=timeouts)
+        finally:
+            _recall_vectors.reset(token)
+        for name, (ids, _) in hits.items():
+            record_count(f"recall.{name}", len(ids))
+        for name, item in report.items():
+            if item["status"] == "ok":
+                self.latency_estimator.update(f"recall.{name}", item["ms"])
+        for name in self.recall_legs.keys() - legs.keys():
+            report[name] = {"status": "skipped", "ms": 0.0}
+        return hits, report
+
+    def _recall_batch(self, queries: List[str], top_k: int,
+                      query_vectors: Optional[Dict[str, np.ndarray]] = None) -> Tuple[List[Dict[str, Tuple[np.ndarray, np.ndarray]]], Dict[str, Dict]]:
+        """批量多路召回（一次嵌入前向、一次多行FAISS检索、一次BM25稀疏矩阵乘，各路并发）"""
+        token = _recall_vectors.set(query_vectors)
+        try:
+            with stage("recall"):
+                leg_hits, report = run_recall_batch(self.recall_legs, queries, top_k)
+        finally:
+            _recall_vectors.reset(token)
+        for name, hits in leg_hits.items():
+            record_count(f"recall.{name}", sum(len(ids) for ids, _ in hits))
+        per_query = [{name: hits[i] for name, hits in leg_hits.items()} for i in range(len(queries))]
+        return per_query, report
+
     def multi_retrieval(self, query: str, top_k: int = 10) -> Dict[str, List[Tuple[str, float]]]:
         """
         多路召回检索
@@ -134,116 +684,492 @@ class RAGRetriever:
         :param top_k: 每路召回数量
         :return: 各路的检索结果字典
         """
-        results = {}
-        
-        # 向量检索
-        vector_results = self.vector_db.similarity_search_with_score(query, k=top_k)
-        results["vector"] = [(doc.page_content, score) for doc, score in vector_results]
-        
-        # BM25检索
-        tokenized_query = query.split()
-        bm25_scores = self.bm25_index.get_scores(tokenized_query)
-        bm25_indices = np.argsort(bm25_scores)[::-1][:top_k]
-        results["bm25"] = [(self.all_texts[i], bm25_scores[i]) for i in bm25_indices]
-        
-        logging.info(f"🔍 多路召回完成：向量召回 {len(results['vector'])} 条，BM25召回 {len(results['bm25'])} 条")
+        legs, _ = self._recall(query, top_k)
+        results = {method: self._to_texts(*hits) for method, hits in legs.items()}
+        summary = "，".join(f"{method} 召回 {len(hits)} 条" for method, hits in results.items())
+        logging.info(f"🔍 多路召回完成：{summary}")
         return results
 
+    def multi_retrieval_batch(self, queries: List[str], top_k: int = 10) -> List[Dict[str, List[Tuple[str, float]]]]:
+        """
+        批量多路召回
+        :param queries: 查询文本列表
+        :param top_k: 每路召回数量
+        :return: 与 multi_retrieval 相同格式的结果列表
+        """
+        results = [
+            {method: self._to_texts(*hits) for method, hits in legs.items()}
+            for legs in self._recall_batch(queries, top_k)[0]
+        ]
+        logging.info(f"🔍 批量多路召回完成：{len(queries)} 个查询")
+        return results
+
+    def _fuse(self, legs: Dict[str, Tuple[np.ndarray, np.ndarray]],
+              weights: Optional[Dict[str, float]] = None,
+              top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """按文本块ID融合多路召回结果"""
+        with stage("fusion"):
+            fused_ids, fused_scores = fuse(legs, weights, mode=self.fusion_mode, top_k=top_k, rrf_k=self.rrf_k)
+        logging.info(f"🧬 混合检索完成：融合 {len(fused_ids)} 条结果（{self.fusion_mode}）")
+        return fused_ids, fused_scores
+
     def hybrid_search(self, retrieval_results: Dict[str, List[Tuple[str, float]]], 
-                      weights: Dict[str, float] = None) -> List[Tuple[str, float]]:
+                      weights: Dict[str, float] = None,
+                      top_k: Optional[int] = None) -> List[Tuple[str, float]]:
         """
-        混合检索（加权融合）
+        混合检索（加权融合，文本形式接口；内部为候选文本分配临时ID后按ID融合）
         :param retrieval_results: 多路召回结果
         :param weights: 各检索方法的权重（默认：向量0.6，BM25 0.4）
+        :param top_k: 返回数量（None表示全部）
         :return: 融合后的结果列表
         """
-        # 设置默认权重
-        default_weights = {"vector": 0.6, "bm25": 0.4}
-        weights = weights or default_weights
-        
-        # 结果融合
-        fused_results = {}
+        local_ids: Dict[str, int] = {}
+        legs = {}
         for method, docs in retrieval_results.items():
-            for doc, score in docs:
-                # 分数归一化处理
-                norm_score = 1 / (1 + np.exp(-score)) if method == "vector" else score
-                fused_score = norm_score * weights.get(method, 0)
-                if doc in fused_results:
-                    fused_results[doc] += fused_score
+            ids = np.array([local_ids.setdefault(doc, len(local_ids)) for doc, _ in docs], dtype=np.int64)
+            legs[method] = (ids, np.array([score for _, score in docs], dtype=np.float64))
+        texts = list(local_ids)
+        fused_ids, fused_scores = self._fuse(legs, weights, top_k)
+        return [(texts[i], float(score)) for i, score in zip(fused_ids, fused_scores)]
+
+    def _encode_pairs(self, pairs: List[Tuple[str, str]], chunk_ids: Optional[List] = None) -> List[Dict[str, List[int]]]:
+        """
+        查询-文档对编码：语料文本块直接取预分词结果，只对查询（去重后）与语料外文档分词
+        :param pairs: (查询, 文档) 对列表
+        :param chunk_ids: 文档对应的文本块ID（None或非整数表示语料外文档）
+        :return: 每个对的模型输入特征（未填充）
+        """
+        tokenizer = self.rerank_tokenizer
+        chunk_ids = chunk_ids if chunk_ids is not None else [None] * len(pairs)
+        stored = [
+            self.chunk_tokens is not None and isinstance(chunk_id, (int, np.integer))
+            and 0 <= chunk_id < len(self.chunk_tokens)
+            for chunk_id in chunk_ids
+        ]
+        queries = list(dict.fromkeys(query for query, _ in pairs))
+        raw_docs = [i for i, flag in enumerate(stored) if not flag]
+
+        # 共享tokenizer需加锁
+        with self._rerank_entry.lock:
+            query_ids = dict(zip(queries, tokenizer(
+                queries, add_special_tokens=False, truncation=True, max_length=self.rerank_max_length
+            )["input_ids"]))
+            doc_ids = {}
+            if raw_docs:
+                encoded = tokenizer(
+                    [pairs[i][1] for i in raw_docs], add_special_tokens=False,
+                    truncation=True, max_length=self.rerank_max_length
+                )["input_ids"]
+                doc_ids = dict(zip(raw_docs, encoded))
+            budget = self.rerank_max_length - tokenizer.num_special_tokens_to_add(pair=True)
+            with_token_types = "token_type_ids" in tokenizer.model_input_names
+
+            features = []
+            for i, (query, _) in enumerate(pairs):
+                doc = self.chunk_tokens.get(int(chunk_ids[i])).tolist() if stored[i] else doc_ids[i]
+                query_part, doc_part = truncate_pair(query_ids[query], doc, budget)
+                input_ids = tokenizer.build_inputs_with_special_tokens(query_part, doc_part)
+                feature = {"input_ids": input_ids, "attention_mask": [1] * len(input_ids)}
+                if with_token_types:
+                    feature["token_type_ids"] = tokenizer.create_token_type_ids_from_sequences(query_part, doc_part)
+                features.append(feature)
+        return features
+
+    def _length_buckets(self, lengths: np.ndarray):
+        """按token长度排序后切分批次：每批不超过rerank_batch_size个对与rerank_max_batch_tokens个token"""
+        batch: List[int] = []
+        for i in np.argsort(lengths, kind="stable"):
+            # 长度升序，批内填充长度即当前序列长度
+            if batch and (len(batch) >= self.rerank_batch_size
+                          or (len(batch) + 1) * lengths[i] > self.rerank_max_batch_tokens):
+                yield batch
+                batch = []
+            batch.append(int(i))
+        if batch:
+            yield batch
+
+    def _score_pairs(self, pairs: List[Tuple[str, str]], chunk_ids: Optional[List] = None,
+                     deadline: Optional[Deadline] = None) -> np.ndarray:
+        """
+        交叉编码器打分：按token长度分桶组批，减少padding
+        :param pairs: (查询, 文档) 对列表
+        :param chunk_ids: 文档对应的文本块ID（用于取预分词结果）
+        :param deadline: 延迟预算，耗尽后不再计算剩余批次（抛出超时）
+        :return: 与输入顺序对应的得分数组
+        """
+        scores = np.empty(len(pairs), dtype=np.float32)
+        if not pairs:
+            return scores
+
+        features = self._encode_pairs(pairs, chunk_ids)
+        lengths = np.array([len(feature["input_ids"]) for feature in features])
+        for batch in self._length_buckets(lengths):
+            if deadline is not None and deadline.expired():
+                raise FutureTimeout("重排序超出延迟预算")
+            record_batch("rerank", len(batch))
+            record_count("rerank.padded_tokens", len(batch) * int(lengths[batch[-1]]))
+            with self._rerank_entry.lock:
+                inputs = self.rerank_tokenizer.pad(
+                    [features[i] for i in batch], return_tensors=self.rerank_model.tensor_type
+                )
+            # 前向计算可并发
+            scores[batch] = self.rerank_model.forward(inputs)
+        return scores
+
+    def _rerank_scores(self, pairs: List[Tuple[str, str]], doc_keys: Optional[List] = None,
+                       deadline: Optional[Deadline] = None) -> np.ndarray:
+        """
+        重排序打分：先查 (查询哈希, 文本块ID) 得分缓存，未命中的对再送入模型
+        （启用微批调度时与其他并发请求合批）
+        :param pairs: (查询, 文档) 对列表
+        :param doc_keys: 文档对应的文本块ID（缺省时以文档文本哈希代替）
+        :param deadline: 延迟预算，耗尽时抛出超时（微批调度中尚未计算的请求被取消）
+        :return: 与输入顺序对应的得分数组
+        """
+        scores = np.empty(len(pairs), dtype=np.float32)
+        if self.rerank_cache is not None:
+            if doc_keys is None:
+                doc_keys = [("text", hash(doc)) for _, doc in pairs]
+            keys = [(query_hash(query), doc_key) for (query, _), doc_key in zip(pairs, doc_keys)]
+            missing = []
+            for i, key in enumerate(keys):
+                cached = self.rerank_cache.get(key)
+                if cached is None:
+                    missing.append(i)
                 else:
-                    fused_results[doc] = fused_score
-        
-        # 排序并返回
-        sorted_results = sorted(fused_results.items(), key=lambda x: x[1], reverse=True)
-        logging.info(f"🧬 混合检索完成：融合 {len(sorted_results)} 条结果")
-        return sorted_results
+                    scores[i] = cached
+        else:
+            missing = list(range(len(pairs)))
+
+        if missing:
+            missing_pairs = [pairs[i] for i in missing]
+            missing_ids = [doc_keys[i] for i in missing] if doc_keys is not None else [None] * len(missing)
+            if self.rerank_batcher is not None:
+                future = self.rerank_batcher.submit(
+                    [(query, doc, chunk_id) for (query, doc), chunk_id in zip(missing_pairs, missing_ids)]
+                )
+                try:
+                    computed = future.result(timeout=None if deadline is None else deadline.remaining())
+                except FutureTimeout:
+                    future.cancel()
+                    raise
+            else:
+                computed = self._score_pairs(missing_pairs, missing_ids, deadline)
+            scores[missing] = computed
+            if self.rerank_cache is not None:
+                for i, score in zip(missing, computed):
+                    self.rerank_cache.put(keys[i], float(score))
+        return scores
+
+    def rerank_path_stats(self) -> Dict[str, float]:
+        """自适应重排序各路径（full/cascade/skipped）的命中统计"""
+        return self.rerank_policy.stats()
+
+    def _candidate_cosines(self, query: str, chunk_ids: np.ndarray,
+                           query_vector: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        查询向量与候选文本块向量的余弦（优先用原始向量，否则从FAISS索引重建，均不可用时返回None）
+        :param query_vector: 召回时已计算的查询向量（缺省时重新计算）
+        """
+        try:
+            if self.raw_vectors is not None:
+                vectors = np.asarray(self.raw_vectors[np.asarray(chunk_ids, dtype=np.int64)], dtype=np.float32)
+            else:
+                vectors = self.faiss_index.reconstruct_batch(np.asarray(chunk_ids, dtype=np.int64))
+        except Exception as e:
+            logging.warning(f"⚠️ 无法从索引重建向量，跳过余弦级联: {str(e)}")
+            return None
+        if query_vector is None:
+            query_vector = self._embed_query(query)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+        return (vectors @ query_vector) / np.maximum(norms, 1e-12)
+
+    def _plan_rerank(self, query: str, fused_ids: np.ndarray, fused_scores: np.ndarray, rerank_top_k: int,
+                     query_vector: Optional[np.ndarray] = None):
+        """按重排序策略生成计划"""
+        return self.rerank_policy.plan(
+            fused_scores, lambda: self._candidate_cosines(query, fused_ids, query_vector), keep_min=rerank_top_k
+        )
+
+    def _rerank_stage(self, query: str, result: Dict, fused_ids: np.ndarray, fused_scores: np.ndarray,
+                      rerank_top_k: int, deadline: Optional[Deadline] = None,
+                      query_vector: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        重排序阶段：按策略跳过、级联剪枝或完整重排序，路径记录于 result["rerank_path"]
+        跳过时直接返回融合分数排名前 rerank_top_k 的候选；
+        有延迟预算时按剩余时间缩小重排序集合或放弃重排序，降级级别记录于 result["degradation"]
+        """
+        candidates = result["hybrid_search"]
+        if result.get("degradation") == "bm25_only":
+            result["rerank_path"] = "skipped"
+            return candidates[:rerank_top_k]
+
+        plan = self._plan_rerank(query, fused_ids, fused_scores, rerank_top_k, query_vector)
+        result["rerank_path"] = plan.path
+        if plan.path == "skipped":
+            logging.info("⏭️ 融合结果置信度高，跳过重排序")
+            return candidates[:rerank_top_k]
+        if plan.path == "cascade":
+            logging.info(f"🪜 余弦级联剪掉 {plan.pruned} 个候选")
+
+        positions = plan.positions
+        if deadline is not None:
+            positions = self._fit_rerank_budget(positions, rerank_top_k, deadline, result)
+            if positions is None:
+                return candidates[:rerank_top_k]
+
+        args = (query, [candidates[i][0] for i in positions], rerank_top_k, fused_ids[positions].tolist())
+        if deadline is None:
+            return self._measured_rerank(*args)
+
+        # 在独立线程池中重排序，超出剩余预算时直接返回融合结果；
+        # 未开始的任务被取消，已开始的任务在预算耗尽后不再计算剩余批次
+        if self._rerank_executor is None:
+            self._rerank_executor = ThreadPoolExecutor(
+                max_workers=self.async_workers, thread_name_prefix="rerank-deadline"
+            )
+        future = self._rerank_executor.submit(
+            contextvars.copy_context().run, self._measured_rerank, *args, deadline=deadline
+        )
+        try:
+            return future.result(timeout=deadline.remaining())
+        except FutureTimeout:
+            future.cancel()
+            logging.warning("⏱️ 重排序超出延迟预算，返回融合结果")
+            result["degradation"] = worse(result["degradation"], "fused_only")
+            return candidates[:rerank_top_k]
+
+    def _fit_rerank_budget(self, positions: np.ndarray, rerank_top_k: int, deadline: Deadline,
+                           result: Dict) -> Optional[np.ndarray]:
+        """按每对平均重排序耗时估计剩余预算可处理的候选数；连 rerank_top_k 个都来不及时返回None"""
+        pair_ms = self.latency_estimator.get("rerank.pair")
+        if pair_ms is None or pair_ms <= 0:
+            return positions
+        max_pairs = int(deadline.remaining_ms() / pair_ms)
+        if max_pairs >= len(positions):
+            return positions
+        if max_pairs >= min(rerank_top_k, len(positions)):
+            logging.info(f"⏱️ 延迟预算不足，重排序候选缩减为 {max_pairs} 个")
+            result["degradation"] = worse(result["degradation"], "reduced_rerank")
+            return positions[:max_pairs]
+        logging.warning("⏱️ 延迟预算不足，跳过重排序")
+        result["degradation"] = worse(result["degradation"], "fused_only")
+        return None
+
+    def _measured_rerank(self, query: str, documents: List[str], top_k: int,
+                         chunk_ids: List[int], deadline: Optional[Deadline] = None) -> List[Tuple[str, float]]:
+        """重排序并更新每对平均耗时估计"""
+        record_count("rerank.pairs", len(documents))
+        started = time.perf_counter()
+        with stage("rerank"):
+            reranked = self.rerank(query, documents, top_k=top_k, chunk_ids=chunk_ids, deadline=deadline)
+        if documents:
+            self.latency_estimator.update("rerank.pair", (time.perf_counter() - started) * 1000 / len(documents))
+        return reranked
 
-    def rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Tuple[str, float]]:
+    def rerank_metrics(self) -> Dict[str, float]:
+        """重排序微批调度指标（批大小、排队等待时间等），未启用时为空"""
+        return self.rerank_batcher.metrics() if self.rerank_batcher is not None else {}
+
+    def rerank(self, query: str, documents: List[str], top_k: int = 5,
+               chunk_ids: Optional[List[int]] = None,
+               deadline: Optional[Deadline] = None) -> List[Tuple[str, float]]:
         """
         重排序
         :param query: 查询文本
         :param documents: 待排序文档列表
         :param top_k: 返回结果数量
+        :param chunk_ids: 文档对应的文本块ID（用于得分缓存，可选）
+        :param deadline: 延迟预算（耗尽时抛出超时，由调用方降级）
         :return: 重排序后的结果列表
         """
         try:
-            # 准备输入数据
-            pairs = [[query, doc] for doc in documents]
-            
-            # 模型推理
-            with torch.no_grad():
-                inputs = self.rerank_tokenizer(
-                    pairs,
-                    padding=True,
-                    truncation=True,
-                    return_tensors='pt',
-                    max_length=512
-                ).to(self.device)
-                
-                scores = self.rerank_model(**inputs).logits.view(-1).float().cpu().numpy()
+            scores = self._rerank_scores([(query, doc) for doc in documents], doc_keys=chunk_ids, deadline=deadline)
             
             # 组合结果并排序
             scored_docs = list(zip(documents, scores))
             sorted_results = sorted(scored_docs, key=lambda x: x[1], reverse=True)[:top_k]
             logging.info(f"📊 重排序完成：处理 {len(documents)} 条文档")
             return sorted_results
+        except FutureTimeout:
+            raise
         except Exception as e:
             logging.error(f"❌ 重排序失败: {str(e)}")
             return []
     
+    def _lookup_result(self, query: str, retrieval_top_k: int, rerank_top_k: int,
+                       weights: Optional[Dict[str, float]]) -> Tuple[Optional[str], Optional[Dict]]:
+        """查询检索结果缓存，返回 (缓存键, 缓存结果)"""
+        if self.result_cache is None:
+            return None, None
+        cache_key = self._result_key(query, retrieval_top_k, rerank_top_k, weights)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            logging.info("⚡ 命中检索结果缓存")
+        return cache_key, cached
+
+    def _fusion_stage(self, result: Dict, legs: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                      recall_report: Dict[str, Dict], weights: Optional[Dict[str, float]],
+                      rerank_top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """记录召回结果并按ID融合，只为进入重排序的候选取文本；返回候选 (文本块ID, 融合分数)"""
+        result["multi_retrieval"] = {method: self._to_texts(*hits) for method, hits in legs.items()}
+        result["recall_timings"] = recall_report
+        fused_ids, fused_scores = self._fuse(legs, weights, top_k=rerank_top_k*2)  # 取更多候选文档
+        result["hybrid_search"] = self._to_texts(fused_ids, fused_scores)
+        record_count("fused", len(fused_ids))
+        return fused_ids, fused_scores
+
+    def _finish_result(self, cache_key: Optional[str], query: str, result: Dict) -> Dict:
+        """组装返回结果并写入结果缓存"""
+        output = {
+            "status": "success",
+            "query": query,
+            "results": result
+        }
+        # 降级结果不写入缓存，避免预算紧张时的低质量结果被后续请求复用
+        if cache_key is not None and result.get("degradation", "none") == "none":
+            self.result_cache.set(cache_key, output, fingerprint=self.result_version)
+        return output
+
+    def _with_timings(self, output: Dict, timings, cache_hit: bool = False) -> Dict:
+        """附加本次请求的阶段耗时（不随结果缓存），并推送到指标汇聚"""
+        return {**output, "timings": self._report_timings(timings, cache_hit)}
+
+    def _report_timings(self, timings, cache_hit: bool = False, batch_size: Optional[int] = None) -> Dict:
+        """把阶段耗时推送到指标汇聚；批量检索整批上报一次（标签 mode=batch，耗时为整批的）"""
+        timings = {**timings.to_dict(), "cache_hit": cache_hit}
+        labels = {"collection": self.collection, "cache_hit": str(cache_hit).lower()}
+        if batch_size is not None:
+            timings["batch_size"] = batch_size
+            labels["mode"] = "batch"
+        try:
+            self.metrics_sink.observe_timings(timings, labels)
+        except Exception as e:
+            logging.warning(f"⚠️ 指标上报失败: {str(e)}")
+        return timings
+
+    def _batch_with_timings(self, outputs: List[Dict], timings, cache_hit: bool = False) -> List[Dict]:
+        """批量检索：整批阶段耗时上报一次，并附加到每个查询的结果"""
+        report = self._report_timings(timings, cache_hit, batch_size=len(outputs))
+        return [{**output, "timings": report} for output in outputs]
+
+    def _make_deadline(self, budget_ms: Optional[float]) -> Optional[Deadline]:
+        """按本次调用或默认的延迟预算创建截止时间"""
+        budget_ms = budget_ms if budget_ms is not None else self.latency_budget_ms
+        return Deadline(budget_ms) if budget_ms is not None else None
+
+    def _recall_degradation(self, legs: Dict, deadline: Optional[Deadline]) -> str:
+        """向量路因预算被跳过或超时时，结果降级为仅BM25"""
+        if deadline is not None and "vector" in self.recall_legs and "vector" not in legs:
+            return "bm25_only"
+        return "none"
+
     def full_retrieval(self, query: str, 
                        retrieval_top_k: int = 10,
                        rerank_top_k: int = 5,
-                       weights: Dict[str, float] = None) -> Dict:
+                       weights: Dict[str, float] = None,
+                       budget_ms: Optional[float] = None) -> Dict:
         """
         完整RAG检索流程（多路召回→混合检索→重排序）
         :param query: 查询文本
         :param retrieval_top_k: 每路召回数量
         :param rerank_top_k: 重排序返回数量
         :param weights: 混合检索权重
+        :param budget_ms: 延迟预算（毫秒，默认取 latency_budget_ms）；预算不足时依次降级为
+                          缩小重排序集合、融合结果不重排序、仅BM25结果，级别见 results["degradation"]
         :return: 包含各阶段结果的字典
         """
         try:
-            result = {}
-            
-            # 1. 多路召回
-            multi_results = self.multi_retrieval(query, top_k=retrieval_top_k)
-            result["multi_retrieval"] = multi_results
-            
-            # 2. 混合检索
-            fused_results = self.hybrid_search(multi_results, weights=weights)
-            result["hybrid_search"] = fused_results
-            
-            # 3. 重排序
-            candidate_docs = [doc for doc, _ in fused_results[:rerank_top_k*2]]  # 取更多候选文档
-            reranked = self.rerank(query, candidate_docs, top_k=rerank_top_k)
-            result["reranked"] = reranked
-            
+            with track_timings() as timings:
+                deadline = self._make_deadline(budget_ms)
+                cache_key, cached = self._lookup_result(query, retrieval_top_k, rerank_top_k, weights)
+                if cached is not None:
+                    return self._with_timings(cached, timings, cache_hit=True)
+
+                result = {}
+                
+                # 1. 多路召回
+                query_vectors = {}
+                legs, recall_report = self._recall(
+                    query, top_k=retrieval_top_k, deadline=deadline, query_vectors=query_vectors
+                )
+                result["degradation"] = self._recall_degradation(legs, deadline)
+                
+                # 2. 混合检索
+                fused_ids, fused_scores = self._fusion_stage(result, legs, recall_report, weights, rerank_top_k)
+                
+                # 3. 重排序（adaptive模式下可能跳过或级联剪枝，预算不足时降级）
+                result["reranked"] = self._rerank_stage(
+                    query, result, fused_ids, fused_scores, rerank_top_k, deadline, query_vectors.get(query)
+                )
+                
+                return self._with_timings(self._finish_result(cache_key, query, result), timings)
+        except Exception as e:
+            logging.error(f"❌ 完整检索流程失败: {str(e)}")
             return {
-                "status": "success",
-                "query": query,
-                "results": result
+                "status": "error",
+                "message": str(e)
             }
+
+    # ---------------------------- 异步接口 ----------------------------
+    async def _run_blocking(self, fn, *args, **kwargs):
+        """在专用线程池中执行阻塞的模型计算，不占用事件循环"""
+        if self._async_executor is None:
+            self._async_executor = ThreadPoolExecutor(
+                max_workers=self.async_workers, thread_name_prefix="rag-async"
+            )
+        loop = asyncio.get_running_loop()
+        # 携带当前任务的contextvars（阶段计时）进入执行器线程
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._async_executor, functools.partial(context.run, fn, *args, **kwargs)
+        )
+
+    async def amulti_retrieval(self, query: str, top_k: int = 10) -> Dict[str, List[Tuple[str, float]]]:
+        """multi_retrieval 的异步版本"""
+        return await self._run_blocking(self.multi_retrieval, query, top_k)
+
+    async def arerank(self, query: str, documents: List[str], top_k: int = 5,
+                      chunk_ids: Optional[List[int]] = None) -> List[Tuple[str, float]]:
+        """rerank 的异步版本"""
+        return await self._run_blocking(self.rerank, query, documents, top_k, chunk_ids)
+
+    async def afull_retrieval(self, query: str,
+                              retrieval_top_k: int = 10,
+                              rerank_top_k: int = 5,
+                              weights: Dict[str, float] = None,
+                              budget_ms: Optional[float] = None) -> Dict:
+        """
+        full_retrieval 的异步版本
+        各阶段分别提交到专用线程池，阶段之间检查取消：客户端断开导致任务取消时，
+        尚未开始的阶段（如重排序）不再执行
+        """
+        try:
+            with track_timings() as timings:
+                deadline = self._make_deadline(budget_ms)
+                cache_key, cached = await self._run_blocking(
+                    self._lookup_result, query, retrieval_top_k, rerank_top_k, weights
+                )
+                if cached is not None:
+                    return self._with_timings(cached, timings, cache_hit=True)
+
+                result = {}
+                query_vectors = {}
+                legs, recall_report = await self._run_blocking(
+                    self._recall, query, retrieval_top_k, deadline, query_vectors
+                )
+                result["degradation"] = self._recall_degradation(legs, deadline)
+                fused_ids, fused_scores = self._fusion_stage(result, legs, recall_report, weights, rerank_top_k)
+
+                result["reranked"] = await self._run_blocking(
+                    self._rerank_stage, query, result, fused_ids, fused_scores, rerank_top_k, deadline,
+                    query_vectors.get(query)
+                )
+                output = await self._run_blocking(self._finish_result, cache_key, query, result)
+                return self._with_timings(output, timings)
+        except asyncio.CancelledError:
+            logging.info("🛑 检索任务已取消")
+            raise
         except Exception as e:
             logging.error(f"❌ 完整检索流程失败: {str(e)}")
             return {
@@ -251,6 +1177,89 @@ class RAGRetriever:
                 "message": str(e)
             }
 
+    def full_retrieval_batch(self, queries: List[str],
+                             retrieval_top_k: int = 10,
+                             rerank_top_k: int = 5,
+                             weights: Dict[str, float] = None) -> List[Dict]:
+        """
+        批量完整RAG检索（用于全班错题分析、离线评测等批量场景）
+        所有查询一次嵌入、一次FAISS检索、一次BM25矩阵乘，全部查询-文档对合并为一次分桶重排序；
+        每个查询的结果与 full_retrieval 相同
+        :param queries: 查询文本列表
+        :param retrieval_top_k: 每路召回数量
+        :param rerank_top_k: 重排序返回数量
+        :param weights: 混合检索权重
+        :return: 与 full_retrieval 相同格式的结果列表（timings 为整批的阶段耗时，另含 batch_size）
+        """
+        try:
+            with track_timings() as timings:
+                outputs: List[Optional[Dict]] = [None] * len(queries)
+                cache_keys: List[Optional[str]] = [None] * len(queries)
+                if self.result_cache is not None:
+                    for i, query in enumerate(queries):
+                        cache_keys[i] = self._result_key(query, retrieval_top_k, rerank_top_k, weights)
+                        outputs[i] = self.result_cache.get(cache_keys[i])
+                pending = [i for i, output in enumerate(outputs) if output is None]
+                if not pending:
+                    return self._batch_with_timings(outputs, timings, cache_hit=True)
+                pending_queries = [queries[i] for i in pending]
+
+                # 1. 批量多路召回
+                query_vectors = {}
+                all_legs, recall_report = self._recall_batch(
+                    pending_queries, top_k=retrieval_top_k, query_vectors=query_vectors
+                )
+                multi_results = [
+                    {method: self._to_texts(*hits) for method, hits in legs.items()} for legs in all_legs
+                ]
+            
+                # 2. 混合检索
+                fused_hits = [self._fuse(legs, weights, top_k=rerank_top_k*2) for legs in all_legs]
+                fused_results = [self._to_texts(*hits) for hits in fused_hits]
+            
+                # 3. 按重排序策略选出各查询需重排序的候选，合并为一次重排序
+                plans = [
+                    self._plan_rerank(query, ids, scores, rerank_top_k, query_vectors.get(query))
+                    for query, (ids, scores) in zip(pending_queries, fused_hits)
+                ]
+                candidates = [
+                    [fused[p][0] for p in plan.positions] for fused, plan in zip(fused_results, plans)
+                ]
+                pairs = [(query, doc) for query, docs in zip(pending_queries, candidates) for doc in docs]
+                doc_keys = [int(ids[p]) for (ids, _), plan in zip(fused_hits, plans) for p in plan.positions]
+                record_count("fused", sum(len(ids) for ids, _ in fused_hits))
+                record_count("rerank.pairs", len(pairs))
+                with stage("rerank"):
+                    scores = self._rerank_scores(pairs, doc_keys=doc_keys)
+                logging.info(f"📊 批量重排序完成：处理 {len(pairs)} 个查询-文档对")
+            
+                offset = 0
+                for i, multi, fused, docs, plan in zip(pending, multi_results, fused_results, candidates, plans):
+                    if plan.path == "skipped":
+                        reranked = fused[:rerank_top_k]
+                    else:
+                        scored_docs = list(zip(docs, scores[offset:offset + len(docs)]))
+                        offset += len(docs)
+                        reranked = sorted(scored_docs, key=lambda x: x[1], reverse=True)[:rerank_top_k]
+                    outputs[i] = {
+                        "status": "success",
+                        "query": queries[i],
+                        "results": {
+                            "multi_retrieval": multi,
+                            "recall_timings": recall_report,
+                            "hybrid_search": fused,
+                            "rerank_path": plan.path,
+                            "degradation": "none",
+                            "reranked": reranked
+                        }
+                    }
+                    if cache_keys[i] is not None:
+                        self.result_cache.set(cache_keys[i], outputs[i], fingerprint=self.result_version)
+                return self._batch_with_timings(outputs, timings)
+        except Exception as e:
+            logging.error(f"❌ 批量检索流程失败: {str(e)}")
+            return [{"status": "error", "message": str(e)} for _ in queries]
+
 # ---------------------------- 测试代码 ----------------------------
 if __name__ == "__main__":
     # 测试配置
@@ -0,0 +1,151 @@
+# recall.py - 多路召回的并发执行（共享线程池、单路超时与降级）
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+Hits = Tuple[np.ndarray, np.ndarray]
+
+# 各召回路默认超时（秒，从该路实际开始执行时计起）
+DEFAULT_RECALL_TIMEOUTS = {"vector": 2.0, "bm25": 1.0}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def get_recall_pool(max_workers: Optional[int] = None) -> ThreadPoolExecutor:
+    """
+    进程内共享的召回线程池（首次调用时创建）
+    :param max_workers: 至少需要的线程数（并发请求数×召回路数），超过当前大小时换用更大的线程池；
+                        旧线程池不再被引用后其空闲线程自动退出，已提交的任务照常完成
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or (max_workers or 0) > _pool_size:
+            _pool_size = max(max_workers or 4, _pool_size)
+            _pool = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="recall")
+            logging.info(f"🧵 召回线程池大小: {_pool_size}")
+        return _pool
+
+
+@dataclass
+class RecallLeg:
+    """
+    一路召回
+    - search(query, top_k) -> (文本块ID数组, 分数数组)
+    - search_batch(queries, top_k) -> 每个查询的 (文本块ID数组, 分数数组)，缺省时逐条调用search
+    """
+    name: str
+    search: Callable[[str, int], Hits]
+    search_batch: Optional[Callable[[List[str], int], List[Hits]]] = None
+    timeout: Optional[float] = None
+
+
+class _LegCall:
+    """
+    一路召回的一次调用
+    - 携带调用方的contextvars（如当前请求的阶段计时）
+    - 记录实际开始执行的时刻，超时从开始执行时计起（不含排队时间）
+    - 被放弃（超时）后若仍在排队则不再执行
+    """
+
+    def __init__(self, fn, *args):
+        self._fn = fn
+        self._args = args
+        self._context = contextvars.copy_context()
+        self.started = threading.Event()
+        self.started_at: Optional[float] = None
+        self.abandoned = False
+
+    def __call__(self):
+        if self.abandoned:
+            raise CancelledError()
+        self.started_at = time.perf_counter()
+        self.started.set()
+        result = self._context.run(self._fn, *self._args)
+        return result, (time.perf_counter() - self.started_at) * 1000
+
+
+def _submit(pool: ThreadPoolExecutor, fn, *args) -> Tuple[_LegCall, Future]:
+    """提交到线程池"""
+    call = _LegCall(fn, *args)
+    return call, pool.submit(call)
+
+
+def _result(call: _LegCall, future: Future, timeout: Optional[float]):
+    """等待一路结果：排队等待与执行各自不超过timeout"""
+    if timeout is None:
+        return future.result()
+    if not call.started.wait(timeout):
+        raise FutureTimeout()
+    return future.result(timeout=max(timeout - (time.perf_counter() - call.started_at), 0))
+
+
+def _wait(calls: Dict[str, Tuple[_LegCall, Future]], legs: Dict[str, RecallLeg], started: float,
+          use_timeout: bool = True, timeouts: Optional[Dict[str, float]] = None) -> Tuple[Dict, Dict[str, Dict]]:
+    """等待各路结果，记录耗时与状态；超时或失败的召回路被跳过，超时的召回路被取消"""
+    results = {}
+    report: Dict[str, Dict] = {}
+    timeouts = timeouts or {}
+    try:
+        for name, (call, future) in calls.items():
+            timeout = timeouts.get(name, legs[name].timeout) if use_timeout else None
+            try:
+                results[name], elapsed = _result(call, future, timeout)
+                report[name] = {"status": "ok", "ms": elapsed}
+            except FutureTimeout:
+                call.abandoned = True
+                future.cancel()
+                report[name] = {"status": "timeout", "ms": (time.perf_counter() - started) * 1000}
+                logging.warning(f"⏱️ {name} 召回超时（{timeout}s），使用其他召回路结果")
+            except Exception as e:
+                report[name] = {"status": "error", "ms": (time.perf_counter() - started) * 1000, "error": str(e)}
+                logging.warning(f"⚠️ {name} 召回失败，使用其他召回路结果: {str(e)}")
+    finally:
+        # 调用方异常退出时不再执行仍在排队的召回路
+        for call, future in calls.values():
+            if not future.done():
+                call.abandoned = True
+                future.cancel()
+
+    if not results:
+        raise RuntimeError(f"所有召回路均失败: {report}")
+    return results, report
+
+
+def run_recall(legs: Dict[str, RecallLeg], query: str, top_k: int,
+               pool: Optional[ThreadPoolExecutor] = None,
+               timeouts: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, Hits], Dict[str, Dict]]:
+    """
+    并发执行各路召回
+    :param legs: 召回路
+    :param query: 查询文本
+    :param top_k: 每路召回数量
+    :param pool: 线程池（默认共享召回线程池）
+    :param timeouts: 本次调用的各路超时（覆盖召回路默认值，如按剩余延迟预算收紧；从该路开始执行时计起）
+    :return: ({召回路: 结果}, {召回路: {status, ms}})
+    """
+    pool = pool or get_recall_pool()
+    started = time.perf_counter()
+    calls = {name: _submit(pool, leg.search, query, top_k) for name, leg in legs.items()}
+    return _wait(calls, legs, started, timeouts=timeouts)
+
+
+def run_recall_batch(legs: Dict[str, RecallLeg], queries: List[str], top_k: int,
+                     pool: Optional[ThreadPoolExecutor] = None) -> Tuple[Dict[str, List[Hits]], Dict[str, Dict]]:
+    """并发执行各路批量召回（批量场景不设超时，失败时同样降级到其他召回路）"""
+    pool = pool or get_recall_pool()
+    started = time.perf_counter()
+    calls = {}
+    for name, leg in legs.items():
+        if leg.search_batch is not None:
+            calls[name] = _submit(pool, leg.search_batch, queries, top_k)
+        else:
+            calls[name] = _submit(pool, lambda qs, k, fn=leg.search: [fn(q, k) for q in qs], queries, top_k)
+    return _wait(calls, legs, started, use_timeout=False)
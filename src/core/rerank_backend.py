@@ -0,0 +1,191 @@
+# rerank_backend.py - 重排序模型推理后端（PyTorch / ONNX Runtime int8）
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from src.core.model_registry import pretrained_kwargs
+from src.core.onnx_utils import (
+    ONNX_DIRNAME, ONNX_FP32_FILENAME, ONNX_INT8_FILENAME, create_session, export_onnx_model, quantize_int8
+)
+
+RERANK_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# 导出int8模型后用于排序一致性检查的样例
+PARITY_QUERIES = ["什么是大数定律？", "古典概型如何计算概率？"]
+PARITY_DOCUMENTS = [
+    ["大数定律说明样本均值依概率收敛于期望", "古典概型要求样本点有限且等可能", "中心极限定理描述和的分布", "条件概率的定义"],
+    ["古典概型中事件概率等于有利样本点数除以样本点总数", "正态分布的密度函数", "贝叶斯公式用于求后验概率", "大数定律的几种形式"]
+]
+
+
+class TorchRerankBackend:
+    """PyTorch交叉编码器"""
+    tensor_type = "pt"
+
+    def __init__(self, model, device: str = "cpu"):
+        self.model = model
+        self.device = device
+
+    def forward(self, inputs) -> np.ndarray:
+        """输入tokenizer编码结果，返回每个查询-文档对的得分"""
+        with torch.no_grad():
+            inputs = inputs.to(self.device)
+            return self.model(**inputs).logits.view(-1).float().cpu().numpy()
+
+
+class OnnxRerankBackend:
+    """ONNX Runtime交叉编码器（CPU）"""
+    tensor_type = "np"
+
+    def __init__(self, onnx_path, intra_op_threads: int = 0):
+        """
+        :param onnx_path: ONNX模型路径
+        :param intra_op_threads: 算子内并行线程数（0表示由onnxruntime决定）
+        """
+        self.session = create_session(onnx_path, intra_op_threads)
+        self.input_names = [item.name for item in self.session.get_inputs()]
+
+    def forward(self, inputs) -> np.ndarray:
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0].reshape(-1).astype(np.float32)
+
+
+def export_onnx_reranker(model_path: str, quantize: bool = True, output_dir=None) -> Path:
+    """
+    导出重排序模型为ONNX，并可选做动态int8量化
+    :param model_path: 本地重排序模型路径
+    :param quantize: 是否生成int8量化模型
+    :param output_dir: 输出目录（默认 <model_path>/onnx）
+    :return: 输出目录
+    """
+    output_dir = Path(output_dir) if output_dir else Path(model_path) / ONNX_DIRNAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_dir / ONNX_FP32_FILENAME
+
+    if not fp32_path.exists():
+        logging.info(f"开始导出ONNX重排序模型: {model_path}")
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModelForSequenceClassification.from_pretrained(model_path, **pretrained_kwargs(model_path)).eval()
+        dummy = tokenizer(["查询"], ["文档"], return_tensors="pt", truncation=True, max_length=512)
+        export_onnx_model(model, dummy, fp32_path, "logits", {0: "batch"})
+        tokenizer.save_pretrained(str(output_dir))
+
+    int8_path = output_dir / ONNX_INT8_FILENAME
+    if quantize and not int8_path.exists():
+        quantize_int8(fp32_path, int8_path)
+
+        # 与fp32 PyTorch模型比较排序一致性并记录
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        reference = TorchRerankBackend(
+            AutoModelForSequenceClassification.from_pretrained(model_path, **pretrained_kwargs(model_path)).eval()
+        )
+        parity = check_rerank_parity(
+            tokenizer, reference, OnnxRerankBackend(int8_path), PARITY_QUERIES, PARITY_DOCUMENTS
+        )
+        with open(output_dir / "parity.json", "w", encoding="utf-8") as f:
+            json.dump(parity, f, ensure_ascii=False, indent=2)
+        logging.info(f"📏 int8与fp32排序一致性: {parity}")
+    return output_dir
+
+
+def load_rerank_backend(
+    model_path: str,
+    backend: str = "torch",
+    device: str = "cpu",
+    torch_dtype: torch.dtype = torch.float32,
+    intra_op_threads: int = 0,
+    fallback: bool = True
+):
+    """
+    加载重排序tokenizer与推理后端；ONNX路径不可用时回退到PyTorch
+    :param model_path: 本地重排序模型路径
+    :param backend: torch / onnx（fp32）/ onnx-int8
+    :param device: PyTorch计算设备
+    :param torch_dtype: PyTorch权重精度
+    :param intra_op_threads: onnxruntime算子内线程数
+    :param fallback: ONNX不可用时是否回退到PyTorch（否则抛出异常）
+    :return: (tokenizer, 推理后端)
+    """
+    if backend not in RERANK_BACKENDS:
+        raise ValueError(f"不支持的重排序后端: {backend}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    if backend != "torch":
+        try:
+            onnx_dir = export_onnx_reranker(model_path, quantize=(backend == "onnx-int8"))
+            filename = ONNX_INT8_FILENAME if backend == "onnx-int8" else ONNX_FP32_FILENAME
+            return tokenizer, OnnxRerankBackend(onnx_dir / filename, intra_op_threads)
+        except Exception as e:
+            if not fallback:
+                raise
+            logging.warning(f"⚠️ ONNX重排序后端不可用，回退到PyTorch: {str(e)}")
+
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_path, torch_dtype=torch_dtype, **pretrained_kwargs(model_path)
+    )
+    model.to(device)
+    model.eval()
+    return tokenizer, TorchRerankBackend(model, device)
+
+
+def check_rerank_parity(
+    tokenizer,
+    reference,
+    candidate,
+    queries: Sequence[str],
+    documents: Sequence[Sequence[str]],
+    top_k: int = 3
+) -> Dict[str, float]:
+    """
+    比较两个重排序后端的排序一致性
+    :param tokenizer: 重排序tokenizer
+    :param reference: 基准后端（通常为fp32 PyTorch）
+    :param candidate: 待评估后端（如ONNX int8）
+    :param queries: 查询列表
+    :param documents: 每个查询的候选文档
+    :param top_k: top-k重合率的k
+    :return: top1一致率、top-k重合率、平均Kendall tau、最大得分偏差
+    """
+    from scipy.stats import kendalltau
+
+    top1, overlap, taus, max_diff = [], [], [], 0.0
+    for query, docs in zip(queries, documents):
+        scores: List[np.ndarray] = []
+        for backend in (reference, candidate):
+            inputs = tokenizer(
+                [query] * len(docs), list(docs), padding=True, truncation=True,
+                max_length=512, return_tensors=backend.tensor_type
+            )
+            scores.append(backend.forward(inputs))
+        ref, cand = scores
+        ref_rank, cand_rank = np.argsort(-ref), np.argsort(-cand)
+        top1.append(ref_rank[0] == cand_rank[0])
+        overlap.append(len(set(ref_rank[:top_k]) & set(cand_rank[:top_k])) / min(top_k, len(docs)))
+        if len(docs) > 1:
+            tau = kendalltau(ref, cand).statistic
+            taus.append(0.0 if np.isnan(tau) else tau)
+        max_diff = max(max_diff, float(np.abs(ref - cand).max()))
+
+    return {
+        "queries": len(queries),
+        "top1_agreement": float(np.mean(top1)),
+        f"top{top_k}_overlap": float(np.mean(overlap)),
+        "kendall_tau": float(np.mean(taus)) if taus else 1.0,
+        "max_score_diff": max_diff
+    }
+
+
+# ---------------------------- 测试代码 ----------------------------
+if __name__ == "__main__":
+    model_path = "./model/reranker"
+
+    tokenizer, reference = load_rerank_backend(model_path, backend="torch")
+    _, candidate = load_rerank_backend(model_path, backend="onnx-int8")
+    print("\n=== ONNX int8 与 fp32 排序一致性 ===")
+    for name, value in check_rerank_parity(tokenizer, reference, candidate, PARITY_QUERIES, PARITY_DOCUMENTS).items():
+        print(f"{name}: {value}")
@@ -0,0 +1,95 @@
+# rerank_policy.py - 置信度感知的重排序策略（跳过/级联/完整重排序）
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+RERANK_MODES = ("always", "adaptive")
+RERANK_PATHS = ("full", "cascade", "skipped")
+
+
+@dataclass
+class RerankPlan:
+    """单个查询的重排序计划"""
+    path: str
+    # 需送入交叉编码器的候选位置（按融合排名）
+    positions: np.ndarray
+    pruned: int = 0
+
+
+class RerankPolicy:
+    """
+    重排序策略
+    - always：所有候选送入交叉编码器
+    - adaptive：融合分数第一名领先幅度超过阈值时跳过重排序；否则先用查询-文本块向量余弦
+      剪掉明显不相关的候选，只把剩余的候选送入交叉编码器
+    """
+
+    def __init__(self, mode: str = "always", skip_margin: float = 0.5, cosine_window: float = 0.15):
+        """
+        :param mode: always / adaptive
+        :param skip_margin: 跳过重排序的相对领先幅度阈值 (top1 - top2) / |top1|
+        :param cosine_window: 余弦级联的保留窗口（保留余弦不低于 最高余弦-窗口 的候选）
+        """
+        if mode not in RERANK_MODES:
+            raise ValueError(f"不支持的重排序模式: {mode}")
+        self.mode = mode
+        self.skip_margin = skip_margin
+        self.cosine_window = cosine_window
+        self._lock = threading.Lock()
+        self._paths = {path: 0 for path in RERANK_PATHS}
+        self._pairs = {"scored": 0, "pruned": 0}
+
+    @staticmethod
+    def margin(fused_scores: np.ndarray) -> float:
+        """融合分数第一名相对第二名的领先幅度"""
+        if len(fused_scores) < 2:
+            return np.inf
+        top1, top2 = float(fused_scores[0]), float(fused_scores[1])
+        return (top1 - top2) / abs(top1) if top1 != 0 else 0.0
+
+    def plan(self, fused_scores: np.ndarray, cosine_fn: Callable[[], Optional[np.ndarray]],
+             keep_min: int) -> RerankPlan:
+        """
+        生成重排序计划
+        :param fused_scores: 候选的融合分数（降序）
+        :param cosine_fn: 惰性计算候选与查询的向量余弦（不可用时返回None）
+        :param keep_min: 级联剪枝后至少保留的候选数
+        """
+        everything = np.arange(len(fused_scores))
+        if self.mode == "always" or len(fused_scores) == 0:
+            return self._record(RerankPlan("full", everything))
+
+        if self.margin(fused_scores) >= self.skip_margin:
+            return self._record(RerankPlan("skipped", everything[:0]))
+
+        cosines = cosine_fn()
+        if cosines is None:
+            return self._record(RerankPlan("full", everything))
+        keep = cosines >= cosines.max() - self.cosine_window
+        # 保证至少保留 keep_min 个候选（按余弦补足）
+        if keep.sum() < keep_min:
+            keep[np.argsort(-cosines, kind="stable")[:keep_min]] = True
+        positions = everything[keep]
+        if len(positions) == len(everything):
+            return self._record(RerankPlan("full", everything))
+        return self._record(RerankPlan("cascade", positions, pruned=len(everything) - len(positions)))
+
+    def _record(self, plan: RerankPlan) -> RerankPlan:
+        with self._lock:
+            self._paths[plan.path] += 1
+            self._pairs["scored"] += len(plan.positions)
+            self._pairs["pruned"] += plan.pruned
+        return plan
+
+    def stats(self) -> Dict[str, float]:
+        """各路径命中次数与比例、送入/剪掉的查询-文档对数"""
+        with self._lock:
+            total = sum(self._paths.values())
+            stats: Dict[str, float] = {"mode": self.mode, "queries": total, **self._paths, **{
+                f"pairs_{name}": count for name, count in self._pairs.items()
+            }}
+            for path, count in self._paths.items():
+                stats[f"{path}_rate"] = count / total if total else 0.0
+        return stats
@@ -0,0 +1,165 @@
+# rerank_scheduler.py - 重排序模型的动态微批调度器
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Tuple
+
+import numpy as np
+
+Pair = Tuple[str, str]
+
+
+@dataclass
+class _RerankRequest:
+    """单个调用方提交的打分请求"""
+    pairs: List[Pair]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class RerankBatcher:
+    """
+    重排序微批调度器
+    并发调用方提交的查询-文档对在队列中汇聚，达到最大批大小或最长等待时间后
+    合并为一次前向计算，再把得分按请求拆分回各自的Future。
+    调用方取消的Future（如超出延迟预算）在组批时被丢弃，不参与计算。
+    """
+
+    def __init__(
+        self,
+        score_fn: Callable[[List[Pair]], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        metrics_window: int = 1024,
+        name: str = "reranker"
+    ):
+        """
+        :param score_fn: 批量打分函数（输入查询-文档对列表，返回等长得分数组）
+        :param max_batch_size: 每批最多合并的查询-文档对数
+        :param max_wait_ms: 首个请求入队后最多等待的毫秒数
+        :param metrics_window: 指标统计的滑动窗口大小（批次数）
+        :param name: 调度器名称（用于日志与线程名）
+        """
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes: Deque[int] = deque(maxlen=metrics_window)
+        self._queue_waits: Deque[float] = deque(maxlen=metrics_window)
+        self._forward_times: Deque[float] = deque(maxlen=metrics_window)
+        self._totals = {"requests": 0, "pairs": 0, "batches": 0, "cancelled": 0}
+
+        self._worker = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, pairs: List[Pair]) -> Future:
+        """提交查询-文档对，返回得分数组的Future"""
+        if self._closed:
+            raise RuntimeError(f"{self.name} 调度器已关闭")
+        request = _RerankRequest(pairs=list(pairs))
+        if not request.pairs:
+            request.future.set_result(np.empty(0, dtype=np.float32))
+            return request.future
+        self._queue.put(request)
+        return request.future
+
+    def score(self, pairs: List[Pair]) -> np.ndarray:
+        """同步打分（阻塞直到所在批次完成）"""
+        return self.submit(pairs).result()
+
+    def _collect(self, first: _RerankRequest) -> List[_RerankRequest]:
+        """以首个请求为起点，在等待窗口内尽量凑满一批"""
+        batch = [first]
+        size = len(first.pairs)
+        deadline = first.enqueued_at + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # 关闭信号放回队列，处理完当前批次后退出
+                self._queue.put(None)
+                break
+            batch.append(request)
+            size += len(request.pairs)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            active = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if len(active) < len(batch):
+                with self._metrics_lock:
+                    self._totals["cancelled"] += len(batch) - len(active)
+            batch = active
+            if not batch:
+                continue
+            started = time.perf_counter()
+            pairs = [pair for request in batch for pair in request.pairs]
+
+            try:
+                scores = self.score_fn(pairs)
+            except Exception as e:
+                logging.error(f"❌ {self.name} 批量打分失败: {str(e)}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            offset = 0
+            for request in batch:
+                request.future.set_result(scores[offset:offset + len(request.pairs)])
+                offset += len(request.pairs)
+            self._record(batch, len(pairs), started, finished)
+
+    def _record(self, batch: List[_RerankRequest], num_pairs: int, started: float, finished: float):
+        with self._metrics_lock:
+            self._batch_sizes.append(num_pairs)
+            self._queue_waits.extend((started - request.enqueued_at) * 1000 for request in batch)
+            self._forward_times.append((finished - started) * 1000)
+            self._totals["requests"] += len(batch)
+            self._totals["pairs"] += num_pairs
+            self._totals["batches"] += 1
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        调度指标（滑动窗口内）：批大小、排队等待与前向耗时的均值/p50/p99
+        :return: 指标字典
+        """
+        with self._metrics_lock:
+            result: Dict[str, float] = dict(self._totals)
+            result["queue_depth"] = self._queue.qsize()
+            for name, values in (
+                ("batch_size", self._batch_sizes),
+                ("queue_wait_ms", self._queue_waits),
+                ("forward_ms", self._forward_times)
+            ):
+                if values:
+                    data = np.fromiter(values, dtype=np.float64)
+                    result[f"{name}_mean"] = float(data.mean())
+                    result[f"{name}_p50"] = float(np.percentile(data, 50))
+                    result[f"{name}_p99"] = float(np.percentile(data, 99))
+        return result
+
+    def close(self):
+        """停止调度线程（已入队的请求会处理完）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
@@ -0,0 +1,231 @@
+# result_cache.py - 检索结果缓存（内存LRU / SQLite跨进程共享）
+import copy
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from src.core.inference_cache import normalize_query
+
+RESULT_CACHE_FILENAME = "result_cache.sqlite"
+
+
+def make_result_key(query: str, fingerprint: Optional[str], **params: Any) -> str:
+    """
+    生成检索结果缓存键：归一化查询 + 检索参数 + 索引指纹
+    :param query: 查询文本
+    :param fingerprint: FAISS/BM25索引指纹
+    :param params: 影响检索结果的参数（top_k、权重等）
+    :return: 缓存键
+    """
+    payload = json.dumps(
+        {"query": normalize_query(query), "fingerprint": fingerprint, "params": params},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def result_cache_namespace(db_path) -> str:
+    """结果缓存命名空间：向量库目录的绝对路径（多个知识库共用一个缓存文件时互不清理）"""
+    return str(Path(db_path).resolve())
+
+
+class ResultCache(ABC):
+    """检索结果缓存接口"""
+
+    def __init__(self, ttl: float = 600.0, namespace: Optional[str] = None):
+        """
+        :param ttl: 缓存有效期（秒）
+        :param namespace: 命名空间（invalidate 只清理本命名空间写入的条目）
+        """
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict]:
+        """读取未过期的缓存结果，未命中返回None"""
+
+    @abstractmethod
+    def set(self, key: str, value: Dict, fingerprint: Optional[str] = None) -> None:
+        """写入缓存结果"""
+
+    @abstractmethod
+    def invalidate(self, keep_fingerprint: Optional[str] = None) -> int:
+        """
+        失效本命名空间的缓存
+        :param keep_fingerprint: 保留该索引指纹下的条目（None表示全部清空）
+        :return: 删除的条目数
+        """
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class MemoryResultCache(ResultCache):
+    """进程内LRU结果缓存（写入与读取时均深拷贝，调用方修改结果不会影响缓存）"""
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 1024, namespace: Optional[str] = None):
+        super().__init__(ttl, namespace)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[float, Optional[str], Dict]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            value = entry[2]
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict, fingerprint: Optional[str] = None) -> None:
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, fingerprint, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keep_fingerprint: Optional[str] = None) -> int:
+        with self._lock:
+            stale = [
+                key for key, (_, fingerprint, _) in self._data.items()
+                if keep_fingerprint is None or fingerprint != keep_fingerprint
+            ]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        result["entries"] = len(self._data)
+        return result
+
+
+class SQLiteResultCache(ResultCache):
+    """
+    SQLite结果缓存（WAL模式），同一节点的多个uvicorn worker共享
+    结果以JSON存储，读取后的 (文本, 分数) 元组变为列表；条目记录写入方的命名空间
+    """
+
+    def __init__(self, path, ttl: float = 600.0, purge_every: int = 256, namespace: Optional[str] = None):
+        """
+        :param path: SQLite文件路径
+        :param ttl: 缓存有效期（秒）
+        :param purge_every: 每写入多少次清理一次过期条目
+        :param namespace: 命名空间（通常为向量库目录）
+        """
+        super().__init__(ttl, namespace)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT, value TEXT NOT NULL, expires_at REAL NOT NULL, namespace TEXT)"
+        )
+        # 旧版缓存文件没有命名空间列
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+        if "namespace" not in columns:
+            conn.execute("ALTER TABLE results ADD COLUMN namespace TEXT")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0)
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM results WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ 结果缓存读取失败: {str(e)}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict, fingerprint: Optional[str] = None) -> None:
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, fingerprint, value, expires_at, namespace) VALUES (?, ?, ?, ?, ?)",
+                (
+                    key, fingerprint, json.dumps(value, ensure_ascii=False, default=float),
+                    time.time() + self.ttl, self.namespace
+                )
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                conn.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+            conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ 结果缓存写入失败: {str(e)}")
+
+    def invalidate(self, keep_fingerprint: Optional[str] = None) -> int:
+        conn = self._conn()
+        if keep_fingerprint is None:
+            cursor = conn.execute("DELETE FROM results WHERE namespace IS ?", (self.namespace,))
+        else:
+            cursor = conn.execute(
+                "DELETE FROM results WHERE namespace IS ? AND (fingerprint IS NULL OR fingerprint != ?)",
+                (self.namespace, keep_fingerprint)
+            )
+        conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        result["entries"] = self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        result["path"] = str(self.path)
+        return result
+
+
+def create_result_cache(backend: str, db_path, ttl: float = 600.0, path: Optional[str] = None) -> Optional[ResultCache]:
+    """
+    按配置创建结果缓存
+    :param backend: none/memory/sqlite
+    :param db_path: 向量库路径（sqlite默认存放于此）
+    :param ttl: 缓存有效期（秒）
+    :param path: sqlite文件路径（可选，多个知识库可共用，按向量库目录区分命名空间）
+    :return: 结果缓存实例，backend为none时返回None
+    """
+    if backend == "none":
+        return None
+    namespace = result_cache_namespace(db_path)
+    if backend == "memory":
+        return MemoryResultCache(ttl=ttl, namespace=namespace)
+    if backend == "sqlite":
+        return SQLiteResultCache(path or Path(db_path) / RESULT_CACHE_FILENAME, ttl=ttl, namespace=namespace)
+    raise ValueError(f"不支持的结果缓存类型: {backend}")
@@ -0,0 +1,122 @@
+# text_store.py - 文本块正文的偏移索引存储（UTF-8字节数组+偏移量，可mmap加载、多进程共享页缓存）
+import json
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from src.core.bm25_index import _file_checksum, _replace_file
+
+TEXT_STORE_VERSION = 1
+TEXT_STORE_DIRNAME = "chunk_texts"
+_ARRAY_FIELDS = ("offsets", "data")
+
+
+class TextStore:
+    """
+    文本块正文存储
+    第i个文本块为 data[offsets[i]:offsets[i+1]] 的UTF-8解码结果，文本块ID与FAISS向量位置一致。
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray, fingerprint: Optional[str] = None):
+        self.offsets = offsets
+        self.data = data
+        # 语料指纹（与BM25、预分词结果的过期判断共用）
+        self.fingerprint = fingerprint
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, chunk_id: int) -> str:
+        start, end = self.offsets[chunk_id], self.offsets[chunk_id + 1]
+        return bytes(self.data[start:end]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk_id in range(len(self)):
+            yield self[chunk_id]
+
+    def get_many(self, chunk_ids: Iterable[int]) -> List[str]:
+        return [self[int(chunk_id)] for chunk_id in chunk_ids]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.data.nbytes)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], fingerprint: Optional[str] = None) -> "TextStore":
+        """按文本块ID顺序编码为字节数组"""
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, data, fingerprint)
+
+    def save(self, store_dir) -> None:
+        """
+        持久化（数组存为.npy以便mmap加载，meta.json最后写入并记录校验和）
+        各文件先写临时文件再原子替换，检索进程mmap着的旧文件不受影响
+        """
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+
+        checksums = {}
+        for name in _ARRAY_FIELDS:
+            path = store_dir / f"{name}.npy"
+            array = np.ascontiguousarray(getattr(self, name))
+            _replace_file(path, lambda f: np.save(f, array))
+            checksums[path.name] = _file_checksum(path)
+
+        meta = {
+            "version": TEXT_STORE_VERSION,
+            "fingerprint": self.fingerprint,
+            "num_chunks": len(self),
+            "num_bytes": int(self.offsets[-1]),
+            "checksums": checksums
+        }
+        _replace_file(
+            store_dir / "meta.json", lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+        )
+
+    @classmethod
+    def load(cls, store_dir, num_chunks: Optional[int] = None, fingerprint: Optional[str] = None,
+             mmap: bool = True, verify: bool = False) -> Optional["TextStore"]:
+        """
+        加载持久化结果
+        :param store_dir: 存储目录
+        :param num_chunks: 期望的文本块数（与FAISS向量数不一致时视为过期）
+        :param fingerprint: 期望的语料指纹（取自向量库清单，不一致时视为过期）
+        :param mmap: 是否以内存映射方式加载
+        :param verify: 是否校验文件校验和（需完整读取文件，默认只在构建时校验）
+        :return: TextStore；缺失、过期或损坏时返回None
+        """
+        store_dir = Path(store_dir)
+        meta_path = store_dir / "meta.json"
+        if not meta_path.exists():
+            return None
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != TEXT_STORE_VERSION:
+                logging.warning(f"⚠️ 文本块存储版本不匹配（{meta.get('version')} != {TEXT_STORE_VERSION}）")
+                return None
+            if num_chunks is not None and meta.get("num_chunks") != num_chunks:
+                logging.warning("⚠️ 文本块存储与向量库不一致（已过期）")
+                return None
+            if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+                logging.warning("⚠️ 文本块存储与向量库清单的语料指纹不一致（已过期）")
+                return None
+            if verify:
+                for name, expected in meta["checksums"].items():
+                    if _file_checksum(store_dir / name) != expected:
+                        logging.warning(f"⚠️ 文本块存储文件校验失败: {name}")
+                        return None
+            arrays = {
+                name: np.load(store_dir / f"{name}.npy", mmap_mode="r" if mmap else None)
+                for name in _ARRAY_FIELDS
+            }
+        except Exception as e:
+            logging.warning(f"⚠️ 文本块存储读取失败: {str(e)}")
+            return None
+        return cls(fingerprint=meta.get("fingerprint"), **arrays)
@@ -0,0 +1,149 @@
+# token_store.py - 语料文本块的预分词结果（CSR存储，可持久化并mmap加载）
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.bm25_index import _file_checksum, _replace_file
+
+TOKEN_STORE_VERSION = 1
+TOKEN_STORE_DIRNAME = "rerank_tokens"
+_ARRAY_FIELDS = ("indptr", "ids")
+
+
+def tokenizer_fingerprint(tokenizer, max_length: int) -> str:
+    """
+    预分词签名（tokenizer类型+词表大小+样例编码+截断长度），tokenizer或max_length变化时持久化结果失效
+    :param max_length: 构建时每个文本块保留的最大token数
+    """
+    probe = tokenizer("概率论与数理统计 Probability 123", add_special_tokens=False)["input_ids"]
+    payload = f"{type(tokenizer).__name__}|{len(tokenizer)}|{probe}|{max_length}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def truncate_pair(query_ids: Sequence[int], doc_ids: Sequence[int], budget: int) -> Tuple[List[int], List[int]]:
+    """
+    按longest_first策略截断查询-文档对（与transformers的截断规则一致）
+    :param budget: 去除特殊token后的最大长度
+    """
+    query_ids, doc_ids = list(query_ids), list(doc_ids)
+    overflow = len(query_ids) + len(doc_ids) - budget
+    if overflow <= 0:
+        return query_ids, doc_ids
+
+    diff = abs(len(query_ids) - len(doc_ids))
+    first = min(overflow, diff)
+    second = overflow - first
+    if len(query_ids) > len(doc_ids):
+        query_remove, doc_remove = first + second // 2, second - second // 2
+    else:
+        query_remove, doc_remove = second // 2, first + second - second // 2
+    return query_ids[:len(query_ids) - query_remove], doc_ids[:len(doc_ids) - doc_remove]
+
+
+class TokenStore:
+    """
+    文本块token ID存储（不含特殊token）
+    第i个文本块的token为 ids[indptr[i]:indptr[i+1]]，文本块ID与FAISS向量位置一致。
+    """
+
+    def __init__(self, indptr: np.ndarray, ids: np.ndarray):
+        self.indptr = indptr
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def get(self, chunk_id: int) -> np.ndarray:
+        return self.ids[self.indptr[chunk_id]:self.indptr[chunk_id + 1]]
+
+    @classmethod
+    def build(cls, tokenizer, texts: List[str], max_length: int = 512, batch_size: int = 256) -> "TokenStore":
+        """
+        批量分词构建
+        :param tokenizer: 重排序tokenizer
+        :param texts: 按文本块ID排列的文本
+        :param max_length: 每个文本块最多保留的token数（超出部分打分时也会被截断）
+        :param batch_size: 每次调用tokenizer的文本数
+        """
+        lengths = np.zeros(len(texts), dtype=np.int64)
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            encoded = tokenizer(
+                texts[start:start + batch_size], add_special_tokens=False,
+                truncation=True, max_length=max_length
+            )["input_ids"]
+            for offset, ids in enumerate(encoded):
+                lengths[start + offset] = len(ids)
+                chunks.append(np.asarray(ids, dtype=np.int32))
+
+        indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        ids = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int32)
+        return cls(indptr, ids)
+
+    def save(self, store_dir, fingerprint: str, signature: str) -> None:
+        """
+        持久化（数组存为.npy以便mmap加载，meta.json最后写入并记录校验和）
+        各文件先写临时文件再原子替换，其他进程mmap着的旧文件不受影响
+        :param store_dir: 保存目录
+        :param fingerprint: 语料指纹
+        :param signature: 预分词签名（见 tokenizer_fingerprint）
+        """
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+
+        checksums = {}
+        for name in _ARRAY_FIELDS:
+            path = store_dir / f"{name}.npy"
+            array = np.ascontiguousarray(getattr(self, name))
+            _replace_file(path, lambda f: np.save(f, array))
+            checksums[path.name] = _file_checksum(path)
+
+        meta = {
+            "version": TOKEN_STORE_VERSION,
+            "tokenizer": signature,
+            "fingerprint": fingerprint,
+            "num_chunks": len(self),
+            "num_tokens": int(self.indptr[-1]),
+            "checksums": checksums
+        }
+        _replace_file(
+            store_dir / "meta.json", lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+        )
+
+    @classmethod
+    def load(cls, store_dir, fingerprint: str, signature: str, mmap: bool = True) -> Optional["TokenStore"]:
+        """
+        加载持久化结果
+        :return: TokenStore；缺失、过期（语料、tokenizer或max_length变化）或损坏时返回None
+        """
+        store_dir = Path(store_dir)
+        meta_path = store_dir / "meta.json"
+        if not meta_path.exists():
+            return None
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != TOKEN_STORE_VERSION or meta.get("tokenizer") != signature:
+                logging.warning("⚠️ 预分词结果的格式、tokenizer或截断长度已变化")
+                return None
+            if meta.get("fingerprint") != fingerprint:
+                logging.warning("⚠️ 预分词结果与向量库语料不一致（已过期）")
+                return None
+            for name, expected in meta["checksums"].items():
+                if _file_checksum(store_dir / name) != expected:
+                    logging.warning(f"⚠️ 预分词文件校验失败: {name}")
+                    return None
+            arrays = {
+                name: np.load(store_dir / f"{name}.npy", mmap_mode="r" if mmap else None)
+                for name in _ARRAY_FIELDS
+            }
+        except Exception as e:
+            logging.warning(f"⚠️ 预分词结果读取失败: {str(e)}")
+            return None
+        return cls(**arrays)
@@ -2,14 +2,77 @@
 import os
 os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'  # 优先使用镜像
 
+from contextlib import nullcontext
 from pathlib import Path
+import hashlib
+import json
 import logging
-from typing import List
+import pickle
+import time
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import numpy as np
 
 # 第三方库导入
-from langchain_huggingface import HuggingFaceEmbeddings
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from src.core.ann_index import (
+    VECTORS_FILENAME, build_index, index_memory_bytes, load_index_meta, make_id_mapped, save_index_meta,
+    supports_remove
+)
+
+from src.core.bm25_index import BM25Index, BM25_DIRNAME, _replace_file, corpus_fingerprint
+from src.core.embedding_backend import (
+    EMBEDDING_BACKENDS, SharedEmbeddings, acquire_embedding_backend, backend_label, embedding_fingerprint
+)
+from src.core.embedding_disk_cache import EMBEDDING_CACHE_DIRNAME, EmbeddingDiskCache
+from src.core.parallel_embedding import ParallelEmbedder, ThroughputMeter
+from src.core.model_registry import model_registry
+from src.core.result_cache import RESULT_CACHE_FILENAME, SQLiteResultCache, result_cache_namespace
+from src.core.text_store import TEXT_STORE_DIRNAME, TextStore
+
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+# 未指定来源文档时文本块的归属
+DEFAULT_DOC_ID = "corpus"
+# 已删除的空行超过该比例时，保存前压缩行号并重建索引
+COMPACT_RATIO = 0.2
+# 流式建库时，需训练的索引（IVF/量化）先缓冲该数量的向量用于训练
+STREAM_TRAIN_SIZE = 20000
+# 流式建库时向量写入的临时文件（mmap，保存后删除）
+BUILD_VECTORS_FILENAME = "vectors.build.npy"
+
+
+def chunk_key(doc_id: str, text: str) -> str:
+    """文本块稳定ID：来源文档+内容哈希（内容不变则ID不变，增量更新时无需重新嵌入）"""
+    return hashlib.sha1(f"{doc_id}\0{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def docstore_texts(store: FAISS) -> List[str]:
+    """按FAISS向量顺序取出文本块（文本块ID即向量在索引中的位置）"""
+    return [
+        store.docstore.search(store.index_to_docstore_id[i]).page_content
+        for i in range(store.index.ntotal)
+    ]
+
+
+def docstore_fingerprint(store: FAISS) -> str:
+    """向量库语料指纹（用于判断BM25等派生索引是否过期）"""
+    return corpus_fingerprint(store.index_to_docstore_id[i] for i in range(store.index.ntotal))
+
+
+def load_manifest(db_path) -> Optional[Dict]:
+    """读取向量库清单（旧版向量库没有清单时返回None）"""
+    manifest_path = Path(db_path) / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 
 class VectorDB:
     """向量数据库管理类"""
@@ -19,7 +82,17 @@ class VectorDB:
         model_path: str = "./model/embeddingmodel",
         device: str = "cpu",
         db_path: str = "./vector_db",
-        chunk_size: int = 32
+        chunk_size: int = 32,
+        backend: str = "torch",
+        dtype: str = "float32",
+        max_seq_length: Optional[int] = None,
+        onnx_threads: int = 0,
+        index_type: str = "flat",
+        index_params: Optional[Dict] = None,
+        embedding_cache: bool = True,
+        embedding_cache_dir: Optional[str] = None,
+        embedding_workers: int = 0,
+        worker_threads: Optional[int] = None
     ):
         """
         初始化向量数据库
@@ -27,23 +100,67 @@ class VectorDB:
         :param device: 计算设备 (cpu/cuda)
         :param db_path: 向量数据库存储路径
         :param chunk_size: 批处理大小
+        :param backend: 嵌入推理后端（torch/onnx/onnx-int8，检索时需使用相同后端）
+        :param dtype: PyTorch权重精度
+        :param max_seq_length: 最大序列长度（默认取模型配置）
+        :param onnx_threads: onnxruntime算子内线程数（0表示自动）
+        :param index_type: FAISS索引类型（flat精确检索 / hnsw / ivf / 压缩存储 sq8 / fp16 / ivfpq）
+        :param index_params: 索引参数（hnsw: M/efConstruction/efSearch；ivf: nlist/nprobe；ivfpq: nlist/m/nbits/nprobe）
+        :param embedding_cache: 是否使用入库向量磁盘缓存（重建时内容未变的文本块不再调用模型）
+        :param embedding_cache_dir: 向量缓存目录（默认 <db_path>/embedding_cache）
+        :param embedding_workers: 多进程流式嵌入的进程数（0表示在当前进程内嵌入）
+        :param worker_threads: 每个嵌入进程的计算线程数（默认 CPU核数 // 进程数）
         """
         self._setup_logging()
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"不支持的嵌入后端: {backend}")
         self.model_path = Path(model_path)
         self.db_path = Path(db_path)
         self.chunk_size = chunk_size
+        self.device = device
+        self.backend = backend
+        self.dtype = dtype
+        self.max_seq_length = max_seq_length
+        self.embedding_workers = embedding_workers
+        self.worker_threads = worker_threads
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        # 索引以文本块行号为ID；texts / row_ids / vectors 按行号排列，已删除的行为空
+        self.index: Optional[faiss.Index] = None
+        self.texts: List[str] = []
+        self.row_ids: List[Optional[str]] = []
+        # 原始float32向量（随索引保存为 vectors.npy，用于更换索引类型、精确重排与基准测试）
+        self.vectors: Optional[np.ndarray] = None
+        # 来源文档 -> 文本块稳定ID（持久化为 manifest.json）
+        self.docs: Dict[str, List[str]] = {}
+        # 来源文档 -> 源文件元数据（文件名、类型、大小、页数等，随清单持久化）
+        self.doc_meta: Dict[str, Dict] = {}
+        self._rows: Dict[str, int] = {}
+        # 全部文本块被删除后的向量维度（保存为空索引，覆盖旧索引文件）
+        self._empty_dim: Optional[int] = None
+        # 流式建库：索引创建前缓冲的 (行号, 向量)，以及向量mmap文件（容量可大于当前行数）
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._vector_buffer: Optional[np.ndarray] = None
+        self._embedding_entry = None
         
         try:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name=str(self.model_path.absolute()),
-                model_kwargs={'device': device},
-                encode_kwargs={
-                    'batch_size': chunk_size,
-                    'normalize_embeddings': False
-                }
+            self._embedding_entry = acquire_embedding_backend(
+                str(self.model_path.absolute()),
+                backend=backend,
+                device=device,
+                dtype=dtype,
+                max_seq_length=max_seq_length,
+                intra_op_threads=onnx_threads
             )
-            self.vector_db = None
-            logging.info("✅ 嵌入模型初始化成功")
+            self.embeddings = SharedEmbeddings(self._embedding_entry, batch_size=chunk_size)
+            logging.info(f"✅ 嵌入模型初始化成功（{type(self.embeddings.backend).__name__}）")
+            self.embedding_cache = None
+            if embedding_cache:
+                fingerprint = embedding_fingerprint(str(self.model_path.absolute()), self.embeddings.backend)
+                self.embedding_cache = EmbeddingDiskCache(
+                    embedding_cache_dir or self.db_path / EMBEDDING_CACHE_DIRNAME, fingerprint
+                )
+                logging.info(f"✅ 向量缓存已打开（{len(self.embedding_cache)}条，模型指纹 {fingerprint}）")
         except Exception as e:
             logging.error(f"❌ 模型加载失败: {str(e)}")
             raise
@@ -55,9 +172,31 @@ class VectorDB:
             format="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
         )
 
+    def close(self):
+        """释放对共享嵌入模型的引用"""
+        if self._embedding_entry is not None:
+            model_registry.release(self._embedding_entry)
+            self._embedding_entry = None
+
+    @property
+    def num_chunks(self) -> int:
+        """有效文本块数（不含已删除的行）"""
+        return len(self._rows)
+
+    def fingerprint(self) -> str:
+        """语料指纹（按行号顺序的文本块ID，用于判断BM25等派生索引是否过期）"""
+        return corpus_fingerprint(key or "" for key in self.row_ids)
+
+    def _reset(self):
+        self.index = None
+        self.texts, self.row_ids, self.vectors = [], [], None
+        self.docs, self.doc_meta, self._rows = {}, {}, {}
+        self._pending, self._vector_buffer = [], None
+        self._empty_dim = None
+
     def process_chunks(self, chunks: List[str]) -> bool:
         """
-        处理文本块生成向量索引
+        处理文本块生成向量索引（全量重建，文本块归属默认文档）
         :param chunks: 文本块列表
         :return: 处理结果
         """
@@ -66,51 +205,506 @@ class VectorDB:
                 logging.warning("⚠️ 接收到空文本列表")
                 return False
 
-            # 创建或更新向量数据库
-            self.vector_db = FAISS.from_texts(
-                texts=chunks,
-                embedding=self.embeddings
-            )
-            logging.info(f"🎯 成功生成 {len(chunks)} 个向量")
+            self._reset()
+            self.sync_documents({DEFAULT_DOC_ID: chunks})
+            logging.info(f"🎯 成功生成 {self.num_chunks} 个向量（索引类型 {self.index_type}）")
+            self._log_index_memory()
             return True
             
         except Exception as e:
             logging.error(f"❌ 向量生成失败: {str(e)}")
             return False
 
+    def upsert(self, chunks: List[str], doc_id: str = DEFAULT_DOC_ID) -> Dict[str, int]:
+        """
+        新增或更新一个文档的文本块：内容未变的文本块保留原向量，新文本块嵌入后追加，
+        该文档中不再出现的旧文本块被删除
+        :param chunks: 文档的全部文本块
+        :param doc_id: 来源文档ID（如相对文件路径）
+        :return: 新增/删除/未变化的文本块数
+        """
+        return self.sync_documents({doc_id: chunks})
+
+    def delete(self, doc_id: str) -> int:
+        """删除一个文档的全部文本块，返回删除数"""
+        removed = self._remove_chunks(self._drop_document(doc_id))
+        if removed:
+            logging.info(f"🗑️ 已删除文档 {doc_id} 的 {removed} 个文本块")
+        return removed
+
+    def sync_documents(self, documents: Dict[str, List[str]], remove_missing: bool = False) -> Dict[str, int]:
+        """
+        按文档增量同步（只嵌入新增或内容变化的文本块）
+        :param documents: {文档ID: 文本块列表}
+        :param remove_missing: 是否删除不在documents中的已有文档（同步整个语料目录时使用）
+        :return: 新增/删除/未变化的文本块数
+        """
+        stale, new_keys, new_texts = [], [], []
+        planned: Dict[str, List[str]] = {}
+        for doc_id, chunks in documents.items():
+            planned[doc_id], doc_stale, new = self._plan_document(doc_id, chunks)
+            stale.extend(doc_stale)
+            for key, text in new:
+                new_keys.append(key)
+                new_texts.append(text)
+        if remove_missing:
+            for doc_id in set(self.docs) - set(documents):
+                stale.extend(self._drop_document(doc_id))
+
+        removed = self._remove_chunks(sorted(stale, key=self._rows.get))
+        if new_texts and self.embedding_workers > 0:
+            self._add_chunks_streaming(new_keys, new_texts)
+        elif new_texts:
+            self._add_chunks(new_keys, new_texts, self._encode(new_texts))
+        for doc_id, keys in planned.items():
+            self._set_document(doc_id, keys)
+
+        stats = {"added": len(new_keys), "removed": removed, "unchanged": self.num_chunks - len(new_keys)}
+        logging.info(f"🔄 文本块同步完成：新增 {stats['added']}，删除 {stats['removed']}，未变化 {stats['unchanged']}")
+        return stats
+
+    def sync_stream(self, documents: Iterable[Tuple], batch_size: Optional[int] = None,
+                    remove_missing: bool = False) -> Dict[str, int]:
+        """
+        流式增量同步：逐个文档对比文本块，新文本块攒够一批即嵌入并写入索引
+        原始向量写入mmap文件，内存中只保留一批待嵌入的文本块，峰值内存由批大小决定而不是语料规模
+        :param documents: 逐个产出 (文档ID, 文本块列表) 或 (文档ID, 文本块列表, 源文件元数据) 的可迭代对象（如生成器）
+        :param batch_size: 每批嵌入的文本块数（默认 chunk_size×8，多进程嵌入时再乘以进程数）
+        :param remove_missing: 是否删除未出现在documents中的已有文档
+        :return: 新增/删除/未变化的文本块数
+        """
+        started = time.perf_counter()
+        batch_size = batch_size or self.chunk_size * 8 * max(1, self.embedding_workers)
+        seen, stale = set(), []
+        batch_keys, batch_texts = [], []
+        added = 0
+        embedder = self._parallel_embedder() if self.embedding_workers > 0 else None
+        with embedder if embedder is not None else nullcontext():
+            for doc_id, chunks, *metadata in documents:
+                # 同一文档重复出现时以后一次为准；已在待嵌入批次中的文本块不重复登记
+                keys, doc_stale, new = self._plan_document(doc_id, chunks, pending=batch_keys)
+                seen.add(doc_id)
+                stale.extend(doc_stale)
+                self._set_document(doc_id, keys, metadata[0] if metadata else None)
+                for key, text in new:
+                    batch_keys.append(key)
+                    batch_texts.append(text)
+                if len(batch_keys) >= batch_size:
+                    self._ingest(batch_keys, batch_texts, embedder)
+                    added += len(batch_keys)
+                    batch_keys, batch_texts = [], []
+            if batch_keys:
+                self._ingest(batch_keys, batch_texts, embedder)
+                added += len(batch_keys)
+        self._flush_pending()
+        if remove_missing:
+            for doc_id in set(self.docs) - seen:
+                stale.extend(self._drop_document(doc_id))
+        # 同一文档重复出现时，前一次判为过期的文本块可能被后一次重新引用
+        live = {key for keys in self.docs.values() for key in keys}
+        stale = {key for key in stale if key not in live}
+        # 删除放在最后统一执行（HNSW删除需压缩重建，只做一次）
+        removed = self._remove_chunks(sorted(stale, key=self._rows.get))
+
+        stats = {"added": added, "removed": removed, "unchanged": self.num_chunks - added}
+        logging.info(
+            f"🔄 流式同步完成：{len(seen)} 个文档，新增 {stats['added']}，删除 {stats['removed']}，"
+            f"未变化 {stats['unchanged']}，耗时 {time.perf_counter() - started:.1f} 秒"
+        )
+        return stats
+
+    def _plan_document(self, doc_id: str, chunks: List[str],
+                       pending: Iterable[str] = ()) -> Tuple[List[str], List[str], List[Tuple[str, str]]]:
+        """
+        对比一个文档的新旧文本块
+        :param pending: 已登记待嵌入、尚未写入索引的文本块ID（不再作为新文本块返回）
+        :return: (该文档的文本块ID, 需删除的旧文本块ID, 需嵌入的新文本块 (ID, 文本))
+        """
+        entries: Dict[str, str] = {}
+        for text in chunks:
+            entries.setdefault(chunk_key(doc_id, text), text)
+        stale = list(set(self.docs.get(doc_id, [])) - set(entries))
+        pending = set(pending)
+        new = [(key, text) for key, text in entries.items() if key not in self._rows and key not in pending]
+        return list(entries), stale, new
+
+    def _set_document(self, doc_id: str, keys: List[str], metadata: Optional[Dict] = None):
+        if not keys:
+            self._drop_document(doc_id)
+            return
+        self.docs[doc_id] = keys
+        if metadata is not None:
+            self.doc_meta[doc_id] = metadata
+
+    def _drop_document(self, doc_id: str) -> List[str]:
+        """移除文档记录，返回其文本块ID"""
+        self.doc_meta.pop(doc_id, None)
+        return self.docs.pop(doc_id, [])
+
+    def chunk_sources(self) -> List[Optional[Dict]]:
+        """
+        按行号排列的文本块来源（已删除的行为None）
+        :return: [{"doc_id": 文档ID, "chunk_index": 文档内序号, **源文件元数据}, ...]
+        """
+        sources: List[Optional[Dict]] = [None] * len(self.row_ids)
+        for doc_id, keys in self.docs.items():
+            metadata = self.doc_meta.get(doc_id, {})
+            for chunk_index, key in enumerate(keys):
+                sources[self._rows[key]] = {"doc_id": doc_id, "chunk_index": chunk_index, **metadata}
+        return sources
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """文本块编码（先查磁盘向量缓存，只对未命中的文本调用模型）"""
+        if self.embedding_cache is None:
+            return self.embeddings.encode(texts)
+        before = self.embedding_cache.stats()
+        vectors = self.embedding_cache.encode(texts, self.embeddings.encode)
+        after = self.embedding_cache.stats()
+        logging.info(
+            f"🗃️ 向量缓存命中 {after['hits'] - before['hits']}，未命中 {after['misses'] - before['misses']}"
+            f"（累计命中率 {after['hit_rate']:.1%}，{after['entries']}条）"
+        )
+        return vectors
+
+    def _new_index(self, train_vectors: np.ndarray) -> faiss.Index:
+        """按配置的索引类型创建空索引（IVF/量化类型用给定向量训练）"""
+        index, self.index_params = build_index(train_vectors, self.index_type, self.index_params)
+        return make_id_mapped(index, self.index_type)
+
+    def _add_chunks(self, keys: List[str], texts: List[str], vectors: np.ndarray):
+        """以新行号追加文本块"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        rows = np.arange(len(self.row_ids), len(self.row_ids) + len(keys), dtype=np.int64)
+        if self.index is None:
+            self.index = self._new_index(vectors)
+        self.index.add_with_ids(vectors, rows)
+        self.vectors = vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+        self.texts.extend(texts)
+        self.row_ids.extend(keys)
+        self._rows.update(zip(keys, rows.tolist()))
+
+    def _parallel_embedder(self) -> ParallelEmbedder:
+        """多进程嵌入器（工作进程在首次嵌入时才启动）"""
+        return ParallelEmbedder(
+            str(self.model_path.absolute()), self.embedding_workers, self.worker_threads,
+            backend=self.backend, device=self.device, dtype=self.dtype,
+            max_seq_length=self.max_seq_length, batch_size=self.chunk_size
+        )
+
+    def _add_chunks_streaming(self, keys: List[str], texts: List[str]):
+        """
+        多进程流式嵌入并逐批写入索引
+        需训练的索引（IVF/量化）先缓冲前 STREAM_TRAIN_SIZE 个向量训练，之后逐批添加。
+        失败时抛出异常，内存中的状态不再可用（不要保存）。
+        """
+        with self._parallel_embedder() as embedder:
+            self._ingest(keys, texts, embedder, train_size=min(STREAM_TRAIN_SIZE, len(keys)))
+        self._flush_pending()
+
+    def _ingest(self, keys: List[str], texts: List[str], embedder: Optional[ParallelEmbedder],
+                train_size: int = STREAM_TRAIN_SIZE):
+        """
+        以新行号登记文本块，嵌入后逐批写入mmap向量文件与索引
+        行号按文本顺序预先分配（与多进程结果的到达顺序无关）；embedder为None时在当前进程内编码
+        """
+        base = len(self.row_ids)
+        total_rows = base + len(keys)
+        self.texts.extend(texts)
+        self.row_ids.extend(keys)
+        self._rows.update(zip(keys, range(base, total_rows)))
+        for offsets, vectors in self._iter_embeddings(texts, embedder):
+            rows = base + offsets
+            self._ensure_vector_rows(total_rows, vectors.shape[1])
+            self.vectors[rows] = vectors
+            self._index_vectors(rows, vectors, train_size)
+
+    def _iter_embeddings(self, texts: List[str],
+                         embedder: Optional[ParallelEmbedder]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """逐批产出 (在texts中的位置, 向量)：多进程时先读磁盘缓存命中，未命中的按完成顺序返回"""
+        if embedder is None:
+            yield np.arange(len(texts)), np.ascontiguousarray(self._encode(texts), dtype=np.float32)
+            return
+
+        offsets = np.arange(len(texts))
+        if self.embedding_cache is not None:
+            cached_rows = self.embedding_cache.lookup(texts)
+            hits = np.flatnonzero(cached_rows >= 0)
+            for start in range(0, len(hits), self.chunk_size * 32):
+                batch = hits[start:start + self.chunk_size * 32]
+                yield batch, self.embedding_cache.read(cached_rows[batch])
+            offsets = np.flatnonzero(cached_rows < 0)
+            logging.info(f"🗃️ 向量缓存命中 {len(hits)}，未命中 {len(offsets)}")
+
+        missing_texts = [texts[i] for i in offsets]
+        if not missing_texts:
+            return
+        meter = ThroughputMeter(len(missing_texts))
+        for start, vectors in embedder.stream(missing_texts):
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(missing_texts[start:start + len(vectors)], vectors)
+            meter.update(len(vectors))
+            yield offsets[start:start + len(vectors)], vectors
+        summary = meter.summary()
+        logging.info(
+            f"⚡ 流式嵌入完成：{summary['chunks']} 条，{summary['seconds']:.1f} 秒，"
+            f"{summary['chunks_per_s']:.1f} 条/秒（{self.embedding_workers} 进程）"
+        )
+
+    def _index_vectors(self, rows: np.ndarray, vectors: np.ndarray, train_size: int):
+        """向量加入索引；索引尚未创建时先缓冲，攒够 train_size 个再创建（需训练的类型用这些向量训练）"""
+        if self.index is not None:
+            self.index.add_with_ids(vectors, rows)
+            return
+        self._pending.append((rows, vectors))
+        if sum(len(item[0]) for item in self._pending) >= train_size:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        """用缓冲的向量创建索引并加入"""
+        if not self._pending:
+            return
+        self.index = self._new_index(np.vstack([item[1] for item in self._pending]))
+        for rows, vectors in self._pending:
+            self.index.add_with_ids(vectors, rows)
+        self._pending = []
+
+    def _ensure_vector_rows(self, total_rows: int, dim: int):
+        """
+        保证向量矩阵有 total_rows 行且存放在mmap文件中（内存占用不随语料增长）
+        文件容量按倍数扩展、已有行拷贝过去，逐批追加时总拷贝量与行数成线性
+        """
+        buffer = self._vector_buffer
+        if buffer is not None and self.vectors is not None and self.vectors.base is buffer \
+                and len(buffer) >= total_rows:
+            self.vectors = buffer[:total_rows]
+            return
+        existing = 0 if self.vectors is None else len(self.vectors)
+        self.db_path.mkdir(parents=True, exist_ok=True)
+        path = self.db_path / BUILD_VECTORS_FILENAME
+        staging = path.with_name(path.name + ".new")
+        grown = np.lib.format.open_memmap(
+            staging, mode="w+", dtype=np.float32, shape=(max(total_rows, 2 * existing), dim)
+        )
+        for start in range(0, existing, 65536):
+            end = min(start + 65536, existing)
+            grown[start:end] = self.vectors[start:end]
+        # 替换文件名不影响仍映射着旧文件的数组
+        os.replace(staging, path)
+        self._vector_buffer = grown
+        self.vectors = grown[:total_rows]
+
+    def _remove_chunks(self, keys: Iterable[str]) -> int:
+        """删除文本块（行置空；HNSW不支持按ID删除，改为压缩后重建）"""
+        rows = [self._rows.pop(key) for key in keys if key in self._rows]
+        if not rows:
+            return 0
+        for row in rows:
+            self.texts[row] = ""
+            self.row_ids[row] = None
+        if supports_remove(self.index_type):
+            self.index.remove_ids(np.asarray(rows, dtype=np.int64))
+        else:
+            self._compact()
+        return len(rows)
+
+    def _compact(self):
+        """去掉已删除的行、重新编号，并用原始向量重建索引（无需重新嵌入）"""
+        live = sorted(self._rows.values())
+        self.texts = [self.texts[row] for row in live]
+        self.row_ids = [self.row_ids[row] for row in live]
+        self._rows = {key: row for row, key in enumerate(self.row_ids)}
+        self.vectors = np.ascontiguousarray(self.vectors[live], dtype=np.float32) if live else None
+        if not live and self.index is not None:
+            self._empty_dim = self.index.d
+        self.index = None
+        if live:
+            self.index = self._new_index(self.vectors)
+            self.index.add_with_ids(self.vectors, np.arange(len(live), dtype=np.int64))
+
     def save_index(self) -> bool:
-        """保存向量索引到本地"""
-        if not self.vector_db:
+        """
+        保存向量索引到本地（同时写入清单、文本块存储、BM25索引与LangChain兼容的docstore）
+        全部文本块被删除后保存为空的flat索引，覆盖旧索引文件（不再召回已删除的文本块）
+        """
+        if self.index is None and self._empty_dim is None:
             logging.error("❌ 请先执行 process_chunks 生成索引")
             return False
             
         try:
+            if self.index is not None and len(self.row_ids) - self.num_chunks > COMPACT_RATIO * len(self.row_ids):
+                self._compact()
+            if self.index is not None:
+                index, index_type, index_params, vectors = self.index, self.index_type, self.index_params, self.vectors
+            else:
+                index = make_id_mapped(faiss.IndexFlatL2(self._empty_dim), "flat")
+                index_type, index_params = "flat", {}
+                vectors = np.empty((0, self._empty_dim), dtype=np.float32)
             self.db_path.mkdir(parents=True, exist_ok=True)
-            self.vector_db.save_local(self.db_path)
+            # 先写临时文件再替换：检索进程mmap打开的旧文件不受影响
+            index_tmp = self.db_path / "index.faiss.tmp"
+            faiss.write_index(index, str(index_tmp))
+            os.replace(index_tmp, self.db_path / "index.faiss")
+            self.save_langchain_docstore()
+            save_index_meta(
+                self.db_path, index_type, index_params,
+                dim=index.d, ntotal=index.ntotal,
+                memory_bytes=index_memory_bytes(index), num_rows=len(self.row_ids),
+                embedding_backend=backend_label(self.embeddings.backend)
+            )
+            vectors_tmp = self.db_path / f"{VECTORS_FILENAME}.tmp"
+            with open(vectors_tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+            os.replace(vectors_tmp, self.db_path / VECTORS_FILENAME)
+            build_vectors = self.db_path / BUILD_VECTORS_FILENAME
+            if build_vectors.exists():
+                self.vectors = np.load(self.db_path / VECTORS_FILENAME, mmap_mode="r")
+                self._vector_buffer = None
+                build_vectors.unlink()
+            self.save_manifest()
             logging.info(f"💾 索引已保存至 {self.db_path}")
+            self.save_text_store()
+            self.save_bm25_index()
+            self._invalidate_result_cache()
             return True
         except Exception as e:
             logging.error(f"❌ 保存失败: {str(e)}")
             return False
 
+    def save_manifest(self):
+        """保存行号 -> 文本块ID、文档 -> 文本块ID 与文档源文件元数据的清单"""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "fingerprint": self.fingerprint(),
+            # 每次保存生成新的构建ID：检索结果缓存键包含它，语料相同的重建（换索引类型、嵌入后端等）也不会命中旧结果
+            "build_id": uuid.uuid4().hex,
+            "num_chunks": self.num_chunks,
+            "rows": self.row_ids,
+            "docs": self.docs,
+            "doc_meta": self.doc_meta
+        }
+        _replace_file(
+            self.db_path / MANIFEST_FILENAME, lambda f: f.write(json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+        )
+
+    def save_langchain_docstore(self):
+        """
+        保存LangChain FAISS.load_local 可读取的 index.pkl（docstore与 行号 -> 文本块ID 映射）
+        供仍直接用LangChain加载向量库的脚本使用；检索器读取文本块存储，不依赖该文件
+        """
+        documents, index_to_docstore_id = {}, {}
+        for row, (key, source) in enumerate(zip(self.row_ids, self.chunk_sources())):
+            if key is not None:
+                documents[key] = Document(page_content=self.texts[row], metadata=source)
+                index_to_docstore_id[row] = key
+        _replace_file(
+            self.db_path / "index.pkl", lambda f: pickle.dump((InMemoryDocstore(documents), index_to_docstore_id), f)
+        )
+
+    def rebuild_index(self, index_type: str, index_params: Optional[Dict] = None) -> bool:
+        """
+        以已有向量重建为另一种索引类型（无需重新嵌入），之后调用 save_index 持久化
+        :param index_type: flat / hnsw / ivf / sq8 / fp16 / ivfpq
+        :param index_params: 索引参数
+        """
+        if self.index is None:
+            logging.error("❌ 请先生成或加载索引")
+            return False
+        try:
+            self.index_type, self.index_params = index_type, index_params or {}
+            self._compact()
+            logging.info(f"🔁 索引已重建为 {index_type}（{self.index_params}）")
+            self._log_index_memory()
+            return True
+        except Exception as e:
+            logging.error(f"❌ 索引重建失败: {str(e)}")
+            return False
+
+    def _log_index_memory(self):
+        """记录索引内存与原始float32向量的对比（压缩存储的收益）"""
+        index_mb = index_memory_bytes(self.index) / 2 ** 20
+        raw_mb = self.index.ntotal * self.index.d * 4 / 2 ** 20
+        logging.info(f"📦 索引内存 {index_mb:.1f}MB（原始向量 {raw_mb:.1f}MB，压缩比 {raw_mb / max(index_mb, 1e-9):.1f}x）")
+
+    def save_text_store(self):
+        """保存按行号排列的文本块正文（检索器mmap加载）"""
+        text_store = TextStore.build(self.texts, self.fingerprint())
+        text_store.save(self.db_path / TEXT_STORE_DIRNAME)
+        logging.info(f"💾 文本块存储已保存（{text_store.nbytes / 2 ** 20:.1f}MB）")
+
+    def save_bm25_index(self):
+        """构建并保存与向量库对应的BM25索引（已删除的空行不含词项，不会被召回）"""
+        bm25_index = BM25Index.build(self.texts)
+        bm25_index.save(self.db_path / BM25_DIRNAME, self.fingerprint())
+        logging.info(f"💾 BM25索引已保存（{len(bm25_index.vocab)}个词项）")
+
+    def _invalidate_result_cache(self):
+        """
+        索引重建后清空该向量库目录下共享的检索结果缓存（只清理本向量库的条目）
+        其他位置的缓存文件无需清理：缓存键包含清单的构建ID，重建后旧条目不再命中，检索器启动时删除
+        """
+        cache_path = self.db_path / RESULT_CACHE_FILENAME
+        if cache_path.exists():
+            removed = SQLiteResultCache(cache_path, namespace=result_cache_namespace(self.db_path)).invalidate()
+            logging.info(f"🧹 已清空检索结果缓存（{removed}条）")
+
     def load_existing_index(self) -> bool:
-        """加载已有向量索引"""
+        """加载已有向量索引（用于增量更新；旧版LangChain格式的向量库会转换为按行号寻址的索引）"""
         try:
             if not (self.db_path / "index.faiss").exists():
                 logging.warning("⚠️ 未找到已有索引")
                 return False
-                
-            self.vector_db = FAISS.load_local(
-                folder_path=self.db_path,
-                embeddings=self.embeddings,
-                allow_dangerous_deserialization=True  # 允许加载未经验证的文件
-            )
-            logging.info("🔍 成功加载已有索引")
+
+            meta = load_index_meta(self.db_path)
+            manifest = load_manifest(self.db_path)
+            if manifest is not None:
+                text_store = TextStore.load(
+                    self.db_path / TEXT_STORE_DIRNAME, num_chunks=len(manifest["rows"]),
+                    fingerprint=manifest.get("fingerprint")
+                )
+                if manifest.get("version") != MANIFEST_VERSION or text_store is None:
+                    raise ValueError("清单与文本块存储不一致")
+                self.index = faiss.read_index(str(self.db_path / "index.faiss"))
+                if self.index.ntotal == 0 and not manifest["rows"]:
+                    # 全部删除后保存的空索引：之后新增的文本块按配置的索引类型重新建索引
+                    self._empty_dim, self.index = self.index.d, None
+                else:
+                    self.index_type, self.index_params = meta["index_type"], meta["params"]
+                self.texts = list(text_store)
+                self.row_ids = manifest["rows"]
+                self.docs = manifest["docs"]
+                self.doc_meta = manifest.get("doc_meta", {})
+                self._rows = {key: row for row, key in enumerate(self.row_ids) if key is not None}
+                self.vectors = np.load(self.db_path / VECTORS_FILENAME, mmap_mode="r")
+            else:
+                self.index_type, self.index_params = meta["index_type"], meta["params"]
+                self._load_legacy()
+            logging.info(f"🔍 成功加载已有索引（{self.index_type}，{self.num_chunks}个文本块，{len(self.docs)}个文档）")
             return True
         except Exception as e:
             logging.error(f"❌ 索引加载失败: {str(e)}")
             return False
 
+    def _load_legacy(self):
+        """旧版向量库：从docstore读取文本，全部归属默认文档，按行号重建索引"""
+        store = FAISS.load_local(
+            folder_path=self.db_path,
+            embeddings=self.embeddings,
+            allow_dangerous_deserialization=True  # 允许加载未经验证的文件
+        )
+        texts = docstore_texts(store)
+        vectors_path = self.db_path / VECTORS_FILENAME
+        vectors = np.load(vectors_path) if vectors_path.exists() else store.index.reconstruct_n(0, store.index.ntotal)
+
+        first: Dict[str, int] = {}
+        for position, text in enumerate(texts):
+            first.setdefault(chunk_key(DEFAULT_DOC_ID, text), position)
+        self.texts = [texts[position] for position in first.values()]
+        self.row_ids = list(first)
+        self.docs = {DEFAULT_DOC_ID: list(first)}
+        self._rows = {key: row for row, key in enumerate(self.row_ids)}
+        self.vectors = np.asarray(vectors)[list(first.values())]
+        self._compact()
+
 # ---------------------------- 测试代码 ----------------------------
 if __name__ == "__main__":
     # 测试配置
@@ -139,9 +733,11 @@ if __name__ == "__main__":
                 print(f"向量维度: {len(sample_vector)}")
                 print(f"首向量前5维: {np.round(sample_vector[:5], 4)}")
                 
-                # 验证索引加载
+                # 验证索引加载与增量更新
                 if vdb.load_existing_index():
-                    print(f"索引文档数: {vdb.vector_db.index.ntotal}")
+                    print(f"索引文档数: {vdb.index.ntotal}")
+                    print(f"增量更新: {vdb.upsert(test_chunks[:3] + ['图神经网络用于推荐系统'])}")
+                    print(f"删除文档: {vdb.delete('corpus')}")
                 
     except Exception as e:
         print(f"❗ 测试过程中发生严重错误: {str(e)}")
@@ -1,8 +1,21 @@
+import asyncio
 import logging
-from typing import Dict, List, Optional, Generator, Any
+from typing import AsyncGenerator, Dict, Iterable, List, Optional, Generator, Any
 from dataclasses import dataclass
 from .llm_core import LLMClient, LLMConfig, RAGConfig
 
+
+async def iterate_in_thread(chunks: Iterable[str]) -> AsyncGenerator[str, None]:
+    """逐块在线程中读取同步生成器（LLM流式响应等阻塞IO），等待期间不占用事件循环"""
+    iterator = iter(chunks)
+    done = object()
+    while True:
+        chunk = await asyncio.to_thread(next, iterator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
 class DynamicPromptEngine:
     """动态提示工程主类"""
     
@@ -39,6 +52,15 @@ class DynamicPromptEngine:
         self.current_enhanced_prompt: Optional[str] = None
         self.is_first_query: bool = True
     
+    def warmup(self) -> None:
+        """预热知识库与提示模板检索器（服务就绪前调用）"""
+        self.retriever.warmup()
+        self.prompt_retriever.warmup()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.retriever.is_ready and self.prompt_retriever.is_ready
+
     def rewrite_query(self, original_query: str) -> Generator[str, None, None]:
         """LLM1: 流式查询改写"""
         prompt = f"""请将以下用户查询改写为更适合信息检索的形式，保持原意但更明确具体：
@@ -80,28 +102,52 @@ class DynamicPromptEngine:
             logging.error(f"检索提示模板失败: {str(e)}")
             return ""
         
-    def retrieve_knowledge(self, query: str) -> str:
-        """从RAG检索相关知识"""
+    def retrieve_knowledge(self, query: str, budget_ms: Optional[float] = None) -> str:
+        """
+        从RAG检索相关知识
+        :param budget_ms: 检索延迟预算（毫秒，默认取知识库配置），预算不足时检索结果降级而非等待
+        """
         try:
             result = self.retriever.full_retrieval(
                 query, 
                 retrieval_top_k=5,  # 知识库可以取更多结果
-                rerank_top_k=3       # 最终保留3个最相关片段
+                rerank_top_k=3,      # 最终保留3个最相关片段
+                budget_ms=budget_ms
             )
             
-            if result["status"] == "success":
-                # 格式化检索结果
-                knowledge_snippets = [
-                    f"【知识片段 {i+1}】\n{doc}"
-                    for i, (doc, score) in enumerate(result["results"]["reranked"][:3])
-                ]
-                return "\n\n".join(knowledge_snippets)
-            else:
-                logging.warning(f"知识检索失败: {result['message']}")
-                return ""
+            return self._format_knowledge(result)
         except Exception as e:
             logging.error(f"知识检索过程中发生异常: {str(e)}")
             return ""
+
+    async def aretrieve_knowledge(self, query: str, budget_ms: Optional[float] = None) -> str:
+        """retrieve_knowledge 的异步版本（模型计算在检索器的专用线程池中执行）"""
+        try:
+            result = await self.retriever.afull_retrieval(
+                query,
+                retrieval_top_k=5,
+                rerank_top_k=3,
+                budget_ms=budget_ms
+            )
+            return self._format_knowledge(result)
+        except Exception as e:
+            logging.error(f"知识检索过程中发生异常: {str(e)}")
+            return ""
+
+    @staticmethod
+    def _format_knowledge(result: Dict) -> str:
+        """格式化知识检索结果"""
+        if result["status"] == "success":
+            degradation = result["results"].get("degradation", "none")
+            if degradation != "none":
+                logging.info(f"知识检索已降级: {degradation}")
+            knowledge_snippets = [
+                f"【知识片段 {i+1}】\n{doc}"
+                for i, (doc, score) in enumerate(result["results"]["reranked"][:3])
+            ]
+            return "\n\n".join(knowledge_snippets)
+        logging.warning(f"知识检索失败: {result['message']}")
+        return ""
         
     def generate_enhanced_prompt(self, original_query: str, retrieved_template: str) -> Generator[str, None, None]:
         """LLM2: 流式生成增强提示词"""
@@ -134,9 +180,10 @@ class DynamicPromptEngine:
         self,
         original_query: str,
         enhanced_prompt: str,
-        knowledge: str
+        knowledge: str,
+        history: Optional[List[Dict[str, str]]] = None
     ) -> Generator[str, None, None]:
-        """LLM3: 流式生成最终回复"""
+        """LLM3: 流式生成最终回复（history 默认为当前对话历史）"""
         try:
             # 构建系统提示（核心提示工程）
             system_prompt = enhanced_prompt
@@ -144,7 +191,7 @@ class DynamicPromptEngine:
             # 构建完整的消息历史
             messages = [
                 {"role": "system", "content": system_prompt},
-                *self.conversation_history
+                *(self.conversation_history if history is None else history)
             ]
             
             # 调用LLM生成响应
@@ -298,6 +345,51 @@ class DynamicPromptEngine:
         #     for i, msg in enumerate(self.conversation_history):
         #         print(f"[{i}] {msg['role']}: {msg['content'][:1000]}...")
 
+    async def astart_conversation(
+        self,
+        original_query: str,
+        verbose: bool = False
+    ) -> AsyncGenerator[str, None]:
+        """
+        start_conversation 的异步版本（服务端请求路径）
+        LLM流式响应在线程中逐块读取，知识检索走 aretrieve_knowledge，均不阻塞事件循环，
+        同一worker可同时服务多个流式请求；客户端断开导致任务取消时检索随之取消。
+        本次问答在回复完成后才写入对话历史，并发请求之间不会互相插入消息。
+        """
+        if verbose:
+            logging.info("开始对话流程...")
+
+        # 改写查询用于知识检索
+        rewritten_query_chunks = []
+        async for chunk in iterate_in_thread(self.rewrite_query(original_query)):
+            rewritten_query_chunks.append(chunk)
+        rewritten_query = "".join(rewritten_query_chunks)
+
+        # 步骤4: 检索相关知识
+        if verbose:
+            logging.info("检索相关知识...")
+        knowledge = await self.aretrieve_knowledge(rewritten_query)
+        user_message = {"role": "user", "content": f"""用户查询: {original_query}
+        相关背景知识:
+        {knowledge}"""}
+        if verbose:
+            logging.info(f"检索到的知识: {knowledge[:100]}...")
+
+        # 步骤5: 生成并流式输出最终回复
+        if verbose:
+            logging.info("生成最终回复...")
+        full_response = []
+        response_generator = self.generate_response(
+            original_query, self.current_enhanced_prompt, knowledge,
+            history=[*self.conversation_history, user_message]
+        )
+        async for chunk in iterate_in_thread(response_generator):
+            full_response.append(chunk)
+            yield chunk
+
+        # 更新对话历史
+        self.conversation_history.extend([user_message, {"role": "assistant", "content": "".join(full_response)}])
+
     def process_query(
         self,
         original_query: str,
@@ -326,6 +418,11 @@ class DynamicPromptEngine:
         for chunk in conversation_generator:
             yield chunk
     
+    def close(self):
+        """释放检索器持有的共享模型引用"""
+        self.retriever.close()
+        self.prompt_retriever.close()
+
     def reset_conversation(self):
         """重置对话历史"""
         self.conversation_history = []
@@ -341,7 +438,8 @@ def get_default_configs() -> tuple:
     rag_config = RAGConfig(
         vector_db_path="data/vector_db",  # 直接相对路径
         embedding_model_path="model/embeddingmodel",
-        rerank_model_name="model/reranker"
+        rerank_model_name="model/reranker",
+        collection="knowledge"
     )
     
     # 提示模板RAG配置
@@ -362,7 +460,8 @@ def get_knowledge_configs() -> tuple:
     knowledge_rag_config = RAGConfig(
         vector_db_path="data/vector_db",  # 直接相对路径
         embedding_model_path="model/embeddingmodel",
-        rerank_model_name="model/reranker"
+        rerank_model_name="model/reranker",
+        collection="knowledge"
     )
     
     # 提示模板RAG配置
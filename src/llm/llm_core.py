@@ -31,6 +31,38 @@ class RAGConfig:
     rerank_model_name: str
     device: str = "cpu"
     download_mirror: str = "https://hf-mirror.com"
+    dtype: str = "float32"
+    bm25_pruning: bool = True
+    rerank_batch_size: int = 32
+    rerank_batching: bool = False
+    rerank_max_batch_size: int = 64
+    rerank_max_wait_ms: float = 5.0
+    embedding_cache_mb: float = 64.0
+    rerank_cache_mb: float = 16.0
+    result_cache: str = "memory"
+    result_cache_ttl: float = 600.0
+    result_cache_path: Optional[str] = None
+    fusion_mode: str = "minmax"
+    rrf_k: int = 60
+    recall_timeouts: Optional[Dict[str, float]] = None
+    async_workers: int = 4
+    rerank_backend: str = "torch"
+    onnx_threads: int = 0
+    embedding_backend: str = "torch"
+    embedding_batch_size: int = 32
+    embedding_max_seq_length: Optional[int] = None
+    rerank_max_length: int = 512
+    rerank_max_batch_tokens: int = 8192
+    rerank_pretokenize: bool = True
+    rerank_mode: str = "always"
+    rerank_skip_margin: float = 0.5
+    rerank_cosine_window: float = 0.15
+    latency_budget_ms: Optional[float] = None
+    parallel_load: bool = True
+    collection: Optional[str] = None
+    search_params: Optional[Dict[str, int]] = None
+    exact_refine: bool = False
+    refine_factor: int = 4
 
 class LLMClient:
     """LLM客户端封装类"""
@@ -32,13 +32,13 @@ def test_health_check():
         "status": "healthy",
         "version": "2.0.0",  # 需与app.version一致
         "system": "available",  # 根据实际情况调整
-        "process_pool": "running"
+        "ready": True
     }
     
     # 验证字段类型
     assert isinstance(data["version"], str)
     assert data["system"] in ["available", "unavailable"]
-    assert data["process_pool"] in ["running", "shutdown"]
+    assert isinstance(data["ready"], bool)
 
 
 def test_full_analysis_sync(test_user_id):
@@ -0,0 +1,120 @@
+"""
+测试共用的模型替身
+VectorDB / RAGRetriever 经真实构造函数创建，只替换模型注册表调用的加载函数（嵌入后端、重排序tokenizer与模型）
+"""
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+DIM = 8
+
+
+class FakeEmbeddingBackend:
+    """按文本哈希生成确定性向量的嵌入后端替身（onnx_path 只用于记录后端名称，delay 模拟推理耗时）"""
+
+    def __init__(self, model_dir: Path):
+        self.onnx_path = model_dir / "model.onnx"
+        self.delay = 0.0
+
+    def encode(self, texts, batch_size=32, lock=None):
+        time.sleep(self.delay)
+        return np.stack([
+            np.random.default_rng(zlib.crc32(text.encode("utf-8"))).random(DIM, dtype=np.float32)
+            for text in texts
+        ])
+
+
+class FakeRerankTokenizer:
+    """按字符编码的tokenizer替身（只实现重排序打分用到的接口）"""
+    model_input_names = ["input_ids", "attention_mask"]
+
+    def __call__(self, texts, add_special_tokens=False, truncation=True, max_length=512):
+        return {"input_ids": [[ord(char) for char in text][:max_length] for text in texts]}
+
+    def num_special_tokens_to_add(self, pair=False):
+        return 3 if pair else 2
+
+    def build_inputs_with_special_tokens(self, first, second=None):
+        return [0, *first, 1, *(second or []), 1]
+
+    def pad(self, features, return_tensors=None):
+        return features
+
+
+class FakeRerankModel:
+    """重排序模型替身：得分为批内序号，delay 模拟每批前向耗时"""
+    tensor_type = "np"
+
+    def __init__(self):
+        self.delay = 0.0
+
+    def forward(self, inputs):
+        time.sleep(self.delay)
+        return np.arange(len(inputs), dtype=np.float32)
+
+
+@pytest.fixture
+def fake_models(monkeypatch, tmp_path):
+    """替换嵌入与重排序模型的加载（模型目录按测试隔离，注册表中不会与其他测试共享条目）"""
+    embedding_backend = pytest.importorskip("src.core.embedding_backend")
+    rag_retriever = pytest.importorskip("src.core.rag_retriever")
+
+    models = SimpleNamespace(embedding_dir=tmp_path / "embedding", rerank_dir=tmp_path / "reranker")
+    models.embedding_dir.mkdir()
+    models.rerank_dir.mkdir()
+    models.embedding = FakeEmbeddingBackend(models.embedding_dir)
+    models.reranker = FakeRerankModel()
+    tokenizer = FakeRerankTokenizer()
+
+    monkeypatch.setattr(embedding_backend, "load_embedding_backend", lambda *args, **kwargs: models.embedding)
+    monkeypatch.setattr(rag_retriever, "load_rerank_backend", lambda *args, **kwargs: (tokenizer, models.reranker))
+    return models
+
+
+@pytest.fixture
+def open_vector_db(fake_models):
+    """以替身嵌入模型打开VectorDB的工厂（测试结束时释放模型引用）"""
+    from src.core.vector_db import VectorDB
+
+    opened = []
+
+    def open_db(db_path, **kwargs):
+        db = VectorDB(
+            model_path=str(fake_models.embedding_dir), db_path=str(db_path), embedding_cache=False, **kwargs
+        )
+        opened.append(db)
+        return db
+
+    yield open_db
+    for db in opened:
+        db.close()
+
+
+@pytest.fixture
+def make_retriever(fake_models, open_vector_db, tmp_path):
+    """以给定文本块建库后，经真实构造函数创建RAGRetriever的工厂（测试结束时释放模型引用）"""
+    from src.core.rag_retriever import RAGRetriever
+
+    created = []
+
+    def make(texts, **kwargs):
+        db_path = tmp_path / "vector_db"
+        db = open_vector_db(db_path)
+        db.upsert(list(texts), doc_id="docs")
+        assert db.save_index()
+        retriever = RAGRetriever(
+            str(db_path),
+            embedding_model_path=str(fake_models.embedding_dir),
+            rerank_model_name=str(fake_models.rerank_dir),
+            **{"rerank_pretokenize": False, "parallel_load": False, **kwargs}
+        )
+        created.append(retriever)
+        return retriever
+
+    yield make
+    for retriever in created:
+        retriever.close()
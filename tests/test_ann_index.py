@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("jieba")
+pytest.importorskip("scipy")
+
+from src.core.ann_index import INDEX_META_FILENAME, load_index_meta, save_index_meta
+
+
+def test_save_index_meta_replaces_file(tmp_path):
+    save_index_meta(tmp_path, "flat", {}, dim=8, ntotal=3)
+    save_index_meta(tmp_path, "hnsw", {"M": 16}, dim=8, ntotal=5, num_rows=6, embedding_backend="onnx")
+    meta = load_index_meta(tmp_path)
+    assert (meta["index_type"], meta["params"], meta["ntotal"], meta["num_rows"]) == ("hnsw", {"M": 16}, 5, 6)
+    assert meta["embedding_backend"] == "onnx"
+    assert [path.name for path in tmp_path.iterdir()] == [INDEX_META_FILENAME]
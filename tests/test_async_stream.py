@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+
+
+def test_iterate_in_thread_keeps_event_loop_free():
+    pytest.importorskip("requests")
+    pytest.importorskip("dotenv")
+    from src.llm.dynamic import iterate_in_thread
+
+    release = threading.Event()
+
+    def blocking_chunks():
+        # 模拟阻塞的LLM流式响应：在事件循环放行前不产出下一块
+        yield "a"
+        assert release.wait(5)
+        yield "b"
+
+    async def main():
+        chunks = []
+
+        async def consume():
+            async for chunk in iterate_in_thread(blocking_chunks()):
+                chunks.append(chunk)
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        # 读取阻塞在线程中，事件循环仍可调度其他任务
+        assert chunks == ["a"]
+        release.set()
+        await task
+        return chunks
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+
+class _Request:
+    """只实现 is_disconnected 的请求替身，第 n 次检查起报告断开"""
+
+    def __init__(self, disconnect_after):
+        self.checks = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.checks += 1
+        return self.checks > self.disconnect_after
+
+
+def test_until_disconnected_closes_upstream():
+    pytest.importorskip("fastapi")
+    from severwarmup import until_disconnected
+
+    closed = []
+
+    async def pipeline():
+        try:
+            for chunk in ["a", "b", "c", "d"]:
+                yield chunk
+        finally:
+            closed.append(True)
+
+    async def main():
+        chunks = [chunk async for chunk in until_disconnected(_Request(disconnect_after=2), pipeline())]
+        # 断开后立即关闭上游，而非等到事件循环结束时才回收
+        return chunks, list(closed)
+
+    assert asyncio.run(main()) == (["a", "b"], [True])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("jieba")
+pytest.importorskip("scipy")
+
+from src.core.bm25_index import BM25Index, corpus_fingerprint
+
+CORPUS = [
+    "大数定律说明样本均值依概率收敛于期望",
+    "古典概型要求样本点有限且等可能",
+    "中心极限定理描述独立随机变量和的极限分布",
+    "贝叶斯公式用于由先验概率求后验概率",
+    "随机变量的期望与方差是最常用的数字特征",
+]
+QUERIES = ["样本均值的期望", "贝叶斯 先验概率", "随机变量 方差", "极限分布"]
+
+
+def _assert_same_results(left, right):
+    for query in QUERIES:
+        left_ids, left_scores = left.search(query, top_k=3)
+        right_ids, right_scores = right.search(query, top_k=3)
+        np.testing.assert_array_equal(left_ids, right_ids)
+        np.testing.assert_allclose(left_scores, right_scores, rtol=1e-6)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_parity(tmp_path, mmap):
+    index = BM25Index.build(CORPUS)
+    fingerprint = corpus_fingerprint(range(len(CORPUS)))
+    index.save(tmp_path, fingerprint)
+
+    loaded = BM25Index.load(tmp_path, fingerprint, mmap=mmap)
+    assert loaded is not None
+    assert loaded.num_docs == index.num_docs
+    assert loaded.vocab == index.vocab
+    _assert_same_results(index, loaded)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_load_rejects_stale_fingerprint(tmp_path):
+    BM25Index.build(CORPUS).save(tmp_path, "old")
+    assert BM25Index.load(tmp_path, "new") is None
+
+
+def test_resave_keeps_mapped_readers_valid(tmp_path):
+    old = BM25Index.build(CORPUS)
+    old.save(tmp_path, "v1")
+    reader = BM25Index.load(tmp_path, "v1", mmap=True)
+
+    # 检索进程仍映射着旧文件时重建（语料更大，数组更长）
+    new = BM25Index.build(CORPUS * 3 + ["新增的文本块：条件概率与全概率公式"])
+    new.save(tmp_path, "v2")
+
+    _assert_same_results(old, reader)
+    reloaded = BM25Index.load(tmp_path, "v2", mmap=True)
+    assert reloaded.num_docs == new.num_docs
+    _assert_same_results(new, reloaded)
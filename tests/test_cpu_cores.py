@@ -0,0 +1,33 @@
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+threadpoolctl = pytest.importorskip("threadpoolctl")
+
+from src.core.cpu_cores import available_core_ids, available_cores, limit_compute_threads
+
+
+def _init_worker(threads):
+    """与入库工作进程相同：导入模块时numpy已加载BLAS线程池，之后才限制线程数"""
+    np.dot(np.ones(2), np.ones(2))
+    limit_compute_threads(threads)
+
+
+def _blas_threads():
+    return {info["num_threads"] for info in threadpoolctl.threadpool_info() if info["user_api"] == "blas"}
+
+
+def test_available_cores_match_core_ids():
+    assert available_cores() == len(available_core_ids()) >= 1
+
+
+@pytest.mark.parametrize("threads", [1, 2])
+def test_worker_limits_loaded_blas_pool(threads):
+    executor = ProcessPoolExecutor(
+        max_workers=1, mp_context=mp.get_context("spawn"),
+        initializer=_init_worker, initargs=(threads,)
+    )
+    with executor:
+        assert executor.submit(_blas_threads).result(timeout=60) == {threads}
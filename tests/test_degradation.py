@@ -0,0 +1,101 @@
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("jieba")
+pytest.importorskip("scipy")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("huggingface_hub")
+pytest.importorskip("langchain_community")
+
+from src.core.deadline import Deadline
+from src.core.metrics import MetricsSink
+
+# 每个文本块都含“查询”，BM25召回路对测试查询总有命中
+TEXTS = [f"查询文本块{i}" for i in range(10)]
+# 关闭各级缓存，替身模型的耗时在每次调用时生效
+OPTIONS = dict(collection="test", async_workers=2, embedding_cache_mb=0, rerank_cache_mb=0, result_cache="none")
+
+
+@pytest.fixture
+def retriever(make_retriever):
+    return make_retriever(TEXTS, **OPTIONS)
+
+
+def _fused_result(num):
+    return {"degradation": "none", "hybrid_search": [(TEXTS[i], 1.0 - i / 10) for i in range(num)]}
+
+
+def test_zero_budget_recall_falls_back_to_bm25(retriever, fake_models):
+    fake_models.embedding.delay = 0.2
+    deadline = Deadline(0)
+    legs, report = retriever._recall("查询", 5, deadline=deadline)
+    assert set(legs) == {"bm25"}
+    assert report["vector"]["status"] == "timeout"
+    assert retriever._recall_degradation(legs, deadline) == "bm25_only"
+
+
+def test_slow_vector_estimate_skips_vector_leg(retriever):
+    retriever.latency_estimator.update("recall.vector", 500.0)
+    deadline = Deadline(100)
+    legs, report = retriever._recall("查询", 5, deadline=deadline)
+    assert set(legs) == {"bm25"}
+    assert report["vector"]["status"] == "skipped"
+    assert retriever._recall_degradation(legs, deadline) == "bm25_only"
+
+
+@pytest.mark.parametrize("budget_ms, level, kept", [
+    (1000, "none", 10),
+    (50, "reduced_rerank", 4),
+    (15, "fused_only", None),
+])
+def test_rerank_budget_levels(retriever, budget_ms, level, kept):
+    retriever.latency_estimator.update("rerank.pair", 10.0)
+    result = _fused_result(10)
+    positions = retriever._fit_rerank_budget(np.arange(10), 3, Deadline(budget_ms), result)
+    assert result["degradation"] == level
+    assert (positions is None) if kept is None else (len(positions) == kept)
+
+
+def test_zero_budget_rerank_returns_fused_results(retriever, fake_models):
+    fake_models.reranker.delay = 0.3
+    result = _fused_result(6)
+    started = time.perf_counter()
+    reranked = retriever._rerank_stage(
+        "查询", result, np.arange(6), np.linspace(1.0, 0.5, 6), 3, deadline=Deadline(0)
+    )
+    assert time.perf_counter() - started < 0.2
+    assert reranked == result["hybrid_search"][:3]
+    assert result["degradation"] == "fused_only"
+
+
+def test_zero_budget_full_retrieval_degrades_instead_of_failing(retriever, fake_models):
+    fake_models.embedding.delay = fake_models.reranker.delay = 0.2
+    output = retriever.full_retrieval("查询", retrieval_top_k=5, rerank_top_k=3, budget_ms=0)
+    assert output["status"] == "success"
+    assert output["results"]["degradation"] == "bm25_only"
+    assert len(output["results"]["reranked"]) == 3
+
+
+class _RecordingSink(MetricsSink):
+    def __init__(self):
+        self.observed = []
+
+    def observe(self, name, value, labels=None):
+        self.observed.append((name, value, labels or {}))
+
+
+def test_batch_retrieval_reports_stage_timings(make_retriever):
+    sink = _RecordingSink()
+    retriever = make_retriever(TEXTS, metrics_sink=sink, **OPTIONS)
+    outputs = retriever.full_retrieval_batch(["查询一", "查询二"], retrieval_top_k=5, rerank_top_k=3)
+    assert [output["status"] for output in outputs] == ["success", "success"]
+    timings = outputs[0]["timings"]
+    assert outputs[1]["timings"] == timings
+    assert {"recall", "fusion", "rerank"} <= set(timings["stages_ms"])
+    assert timings["batch_size"] == 2 and timings["counts"]["rerank.pairs"] > 0
+    requests = [labels for name, _, labels in sink.observed if name == "rag_request_ms"]
+    assert requests == [{"collection": "test", "cache_hit": "false", "mode": "batch"}]
@@ -0,0 +1,38 @@
+import numpy as np
+
+from src.core.embedding_disk_cache import EmbeddingDiskCache
+
+DIM = 4
+
+
+def _vectors(texts):
+    return np.stack([np.full(DIM, float(text.split("-")[1]), dtype=np.float32) for text in texts])
+
+
+def test_incremental_puts_keep_index_sorted(tmp_path):
+    cache = EmbeddingDiskCache(tmp_path, "model")
+    rng = np.random.default_rng(0)
+    texts = [f"text-{i}" for i in rng.permutation(200)]
+    for start in range(0, len(texts), 7):
+        batch = texts[start:start + 7]
+        cache.put(batch, _vectors(batch))
+    assert len(cache) == len(texts)
+    assert (cache._sorted_keys[:-1] <= cache._sorted_keys[1:]).all()
+
+    rows = cache.lookup(texts)
+    assert (rows >= 0).all()
+    assert np.array_equal(cache.read(rows), _vectors(texts))
+
+
+def test_reopen_reads_appended_vectors(tmp_path):
+    cache = EmbeddingDiskCache(tmp_path, "model")
+    cache.put(["text-1", "text-2"], _vectors(["text-1", "text-2"]))
+    cache.put(["text-3", "text-1"], _vectors(["text-3", "text-1"]))
+    assert len(cache) == 3
+
+    reopened = EmbeddingDiskCache(tmp_path, "model")
+    texts = ["text-3", "text-2", "text-9", "text-1"]
+    output = reopened.encode(texts, _vectors)
+    assert np.array_equal(output, _vectors(texts))
+    assert reopened.stats()["hits"] == 3
+    assert len(reopened) == 4
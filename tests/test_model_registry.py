@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("langchain_core")
+
+from src.core import embedding_backend
+from src.core.model_registry import model_registry
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """替换真实加载：ONNX是否可用由 onnx_ok 控制，记录每次加载的后端"""
+    state = {"onnx_ok": False, "loaded": []}
+
+    def load(model_path, backend, device, dtype, max_seq_length, intra_op_threads, fallback=True):
+        if backend != "torch" and not state["onnx_ok"]:
+            raise RuntimeError("onnxruntime不可用")
+        state["loaded"].append(backend)
+        return f"{backend}-model"
+
+    monkeypatch.setattr(embedding_backend, "load_embedding_backend", load)
+    return state
+
+
+def test_fallback_is_registered_under_torch_key(loads):
+    entry = embedding_backend.acquire_embedding_backend("model", "onnx", dtype="float16")
+    try:
+        assert entry.model == "torch-model"
+        assert entry.key[3] == "float16"
+        assert not any("onnx" in key for key in model_registry.stats())
+
+        # ONNX恢复可用后，请求ONNX的调用方拿到ONNX模型而不是先前回退得到的PyTorch模型
+        loads["onnx_ok"] = True
+        onnx_entry = embedding_backend.acquire_embedding_backend("model", "onnx", dtype="float16")
+        try:
+            assert onnx_entry.model == "onnx-model"
+        finally:
+            model_registry.release(onnx_entry)
+    finally:
+        model_registry.release(entry)
+    assert loads["loaded"] == ["torch", "onnx"]
+
+
+def test_torch_callers_share_fallback_model(loads):
+    first = embedding_backend.acquire_embedding_backend("model", "onnx-int8")
+    second = embedding_backend.acquire_embedding_backend("model", "torch")
+    try:
+        assert first is second
+        assert loads["loaded"] == ["torch"]
+    finally:
+        model_registry.release(first)
+        model_registry.release(second)
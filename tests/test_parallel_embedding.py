@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from src.core.parallel_embedding import ParallelEmbedder
+
+
+@pytest.fixture
+def affinity(monkeypatch):
+    """模拟taskset/容器绑核：可用核编号不从0开始且不连续"""
+    cores = {2, 3, 8, 9, 12}
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(cores), raising=False)
+    return cores
+
+
+def test_threads_follow_affinity(affinity):
+    embedder = ParallelEmbedder("model", num_workers=2)
+    assert embedder.threads_per_worker == len(affinity) // 2
+
+
+def test_pinning_uses_affinity_cores(affinity):
+    embedder = ParallelEmbedder("model", num_workers=2)
+    assert embedder.worker_cores(0) == {2, 3}
+    assert embedder.worker_cores(1) == {8, 9}
+
+
+def test_oversubscribed_workers_are_not_pinned(affinity):
+    embedder = ParallelEmbedder("model", num_workers=2, threads_per_worker=3)
+    assert not embedder.pin_cores
+    assert embedder.worker_cores(0) is None
@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.core.recall import RecallLeg, run_recall
+
+
+def _leg(name, delay, timeout=None, ran=None):
+    def search(query, top_k):
+        if ran is not None:
+            ran.append(name)
+        time.sleep(delay)
+        return np.arange(top_k, dtype=np.int64), np.ones(top_k)
+    return RecallLeg(name, search, timeout=timeout)
+
+
+def test_slow_leg_falls_back_to_other_legs():
+    legs = {"vector": _leg("vector", 0.5, timeout=0.1), "bm25": _leg("bm25", 0.0, timeout=1.0)}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        hits, report = run_recall(legs, "q", 3, pool=pool)
+    assert set(hits) == {"bm25"}
+    assert report["vector"]["status"] == "timeout"
+    assert report["bm25"]["status"] == "ok"
+
+
+def test_call_timeouts_override_leg_defaults():
+    legs = {"vector": _leg("vector", 0.3, timeout=1.0), "bm25": _leg("bm25", 0.0, timeout=1.0)}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        hits, report = run_recall(legs, "q", 3, pool=pool, timeouts={"vector": 0.05})
+    assert set(hits) == {"bm25"}
+    assert report["vector"]["status"] == "timeout"
+
+
+def test_timeout_counts_from_leg_start():
+    # 单线程池：bm25排队等待vector完成，排队时间不计入其超时
+    legs = {"vector": _leg("vector", 0.25, timeout=0.4), "bm25": _leg("bm25", 0.2, timeout=0.4)}
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        hits, report = run_recall(legs, "q", 3, pool=pool)
+    assert set(hits) == {"vector", "bm25"}
+    assert all(item["status"] == "ok" for item in report.values())
+
+
+def test_abandoned_queued_leg_does_not_run():
+    ran = []
+    legs = {"vector": _leg("vector", 0.4, timeout=0.05, ran=ran), "bm25": _leg("bm25", 0.0, timeout=0.05, ran=ran)}
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with pytest.raises(RuntimeError, match="所有召回路均失败"):
+            run_recall(legs, "q", 3, pool=pool)
+    assert ran == ["vector"]
+
+
+def test_failed_leg_reports_error():
+    def broken(query, top_k):
+        raise ValueError("boom")
+    legs = {"vector": RecallLeg("vector", broken), "bm25": _leg("bm25", 0.0)}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        hits, report = run_recall(legs, "q", 3, pool=pool)
+    assert set(hits) == {"bm25"}
+    assert report["vector"]["status"] == "error"
+    assert report["vector"]["error"] == "boom"
@@ -0,0 +1,39 @@
+import threading
+
+import numpy as np
+
+from src.core.rerank_scheduler import RerankBatcher
+
+
+def test_scores_are_split_back_per_request():
+    batcher = RerankBatcher(lambda pairs: np.arange(len(pairs), dtype=np.float32), max_wait_ms=20)
+    try:
+        first = batcher.submit([("q1", "a"), ("q1", "b")])
+        second = batcher.submit([("q2", "c")])
+        assert len(first.result(timeout=1)) == 2
+        assert len(second.result(timeout=1)) == 1
+    finally:
+        batcher.close()
+
+
+def test_cancelled_requests_are_not_scored():
+    release = threading.Event()
+    scored = []
+
+    def score(pairs):
+        release.wait(1)
+        scored.append(list(pairs))
+        return np.zeros(len(pairs), dtype=np.float32)
+
+    batcher = RerankBatcher(score, max_batch_size=1, max_wait_ms=0)
+    try:
+        blocking = batcher.submit([("q", "running")])
+        abandoned = batcher.submit([("q", "abandoned")])
+        assert abandoned.cancel()
+        release.set()
+        blocking.result(timeout=1)
+        batcher.submit([("q", "after")]).result(timeout=1)
+    finally:
+        batcher.close()
+    assert [pair for pairs in scored for pair in pairs] == [("q", "running"), ("q", "after")]
+    assert batcher.metrics()["cancelled"] == 1
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("jieba")
+pytest.importorskip("scipy")
+
+from src.core.bm25_index import corpus_fingerprint
+from src.core.text_store import TextStore
+
+TEXTS = ["条件概率", "", "全概率公式与贝叶斯公式", "Probability 与 Statistics"]
+KEYS = ["a1", None, "b1", "b2"]
+
+
+def _fingerprint(keys):
+    return corpus_fingerprint(key or "" for key in keys)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_roundtrip(tmp_path, mmap):
+    TextStore.build(TEXTS, _fingerprint(KEYS)).save(tmp_path)
+    loaded = TextStore.load(tmp_path, num_chunks=len(TEXTS), fingerprint=_fingerprint(KEYS), mmap=mmap, verify=True)
+    assert list(loaded) == TEXTS
+    assert loaded.get_many([3, 0]) == [TEXTS[3], TEXTS[0]]
+    assert loaded.fingerprint == _fingerprint(KEYS)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_load_rejects_row_count_mismatch(tmp_path):
+    TextStore.build(TEXTS, _fingerprint(KEYS)).save(tmp_path)
+    assert TextStore.load(tmp_path, num_chunks=len(TEXTS) + 1) is None
+
+
+def test_load_rejects_manifest_fingerprint_mismatch(tmp_path):
+    # 行数相同但语料不同（如文本块被替换）：只比较行数无法发现
+    TextStore.build(TEXTS, _fingerprint(KEYS)).save(tmp_path)
+    other = _fingerprint(["a1", None, "b1", "c9"])
+    assert TextStore.load(tmp_path, num_chunks=len(TEXTS), fingerprint=other) is None
+
+
+def test_resave_keeps_mapped_readers_valid(tmp_path):
+    TextStore.build(TEXTS, "v1").save(tmp_path)
+    reader = TextStore.load(tmp_path, mmap=True)
+
+    new_texts = TEXTS * 50 + ["新增文本块"]
+    TextStore.build(new_texts, "v2").save(tmp_path)
+
+    assert list(reader) == TEXTS
+    reloaded = TextStore.load(tmp_path, fingerprint="v2")
+    assert list(reloaded) == new_texts
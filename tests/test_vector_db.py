@@ -0,0 +1,143 @@
+import json
+import pickle
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("jieba")
+pytest.importorskip("scipy")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("langchain_community")
+
+import faiss
+
+from src.core.bm25_index import BM25_DIRNAME, BM25Index
+from src.core.text_store import TEXT_STORE_DIRNAME, TextStore
+from src.core.vector_db import MANIFEST_FILENAME
+
+
+@pytest.fixture
+def open_db(open_vector_db):
+    """以替身嵌入模型打开的VectorDB（小批量，覆盖多批嵌入）"""
+    return lambda db_path, index_type="flat": open_vector_db(db_path, chunk_size=4, index_type=index_type)
+
+
+@pytest.fixture
+def reload_db(open_db):
+    def reload(db_path, index_type="flat"):
+        db = open_db(db_path, index_type)
+        assert db.load_existing_index()
+        return db
+    return reload
+
+
+def _live_texts(db):
+    return sorted(db.texts[row] for row in db._rows.values())
+
+
+def _assert_consistent(db_path):
+    """磁盘上的索引、清单、文本块存储、BM25与LangChain docstore互相一致"""
+    db_path = Path(db_path)
+    with open(db_path / MANIFEST_FILENAME, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    live = {row: key for row, key in enumerate(manifest["rows"]) if key is not None}
+    text_store = TextStore.load(
+        db_path / TEXT_STORE_DIRNAME, num_chunks=len(manifest["rows"]), fingerprint=manifest["fingerprint"]
+    )
+    assert text_store is not None
+    assert BM25Index.load(db_path / BM25_DIRNAME, manifest["fingerprint"]) is not None
+    assert faiss.read_index(str(db_path / "index.faiss")).ntotal == len(live)
+    with open(db_path / "index.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    assert index_to_docstore_id == live
+    for row, key in live.items():
+        assert docstore.search(key).page_content == text_store[row]
+    return manifest
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_upsert_persists_across_reload(tmp_path, index_type, open_db, reload_db):
+    db = open_db(tmp_path, index_type)
+    db.upsert(["x", "y"], doc_id="a")
+    db.upsert(["u"], doc_id="b")
+    assert db.save_index()
+
+    db = reload_db(tmp_path, index_type)
+    assert _live_texts(db) == ["u", "x", "y"]
+    stats = db.upsert(["x", "z"], doc_id="a")
+    assert stats == {"added": 1, "removed": 1, "unchanged": 2}
+    assert db.save_index()
+
+    db = reload_db(tmp_path, index_type)
+    assert _live_texts(db) == ["u", "x", "z"]
+    assert _assert_consistent(tmp_path)["docs"].keys() == {"a", "b"}
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_delete_persists_across_reload(tmp_path, index_type, open_db, reload_db):
+    db = open_db(tmp_path, index_type)
+    db.upsert(["x", "y"], doc_id="a")
+    db.upsert(["u"], doc_id="b")
+    assert db.save_index()
+
+    db = reload_db(tmp_path, index_type)
+    assert db.delete("a") == 2
+    assert db.save_index()
+
+    db = reload_db(tmp_path, index_type)
+    assert _live_texts(db) == ["u"]
+    assert set(_assert_consistent(tmp_path)["docs"]) == {"b"}
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_delete_all_persists_empty_index(tmp_path, index_type, open_db, reload_db):
+    db = open_db(tmp_path, index_type)
+    db.upsert(["x", "y"], doc_id="a")
+    db.upsert(["u"], doc_id="b")
+    assert db.save_index()
+
+    db = reload_db(tmp_path, index_type)
+    db.delete("a")
+    db.delete("b")
+    assert db.save_index()
+
+    db = reload_db(tmp_path, index_type)
+    assert db.num_chunks == 0
+    assert _assert_consistent(tmp_path)["docs"] == {}
+
+    # 清空后重新入库，仍按配置的索引类型建索引
+    db.upsert(["v"], doc_id="c")
+    assert db.index_type == index_type
+    assert db.save_index()
+    db = reload_db(tmp_path, index_type)
+    assert _live_texts(db) == ["v"]
+    _assert_consistent(tmp_path)
+
+
+def test_sync_stream_merges_repeated_document(tmp_path, open_db):
+    db = open_db(tmp_path)
+    stats = db.sync_stream([("a", ["x", "y"]), ("a", ["x", "y", "z"])])
+    assert stats == {"added": 3, "removed": 0, "unchanged": 0}
+    assert db.index.ntotal == 3
+    assert len(db.row_ids) == 3
+
+    stats = db.sync_stream([("a", ["x", "y"]), ("a", ["z"])])
+    assert stats == {"added": 0, "removed": 2, "unchanged": 1}
+    assert db.num_chunks == 1
+    assert _live_texts(db) == ["z"]
+    assert db.index.ntotal == 1
+
+
+def test_resave_changes_build_id(tmp_path, open_db, reload_db):
+    # 语料不变的重建也须使检索结果缓存失效（缓存键包含构建ID，与缓存文件位置无关）
+    db = open_db(tmp_path)
+    db.upsert(["x", "y"], doc_id="a")
+    assert db.save_index()
+    first = _assert_consistent(tmp_path)
+    db = reload_db(tmp_path)
+    assert db.rebuild_index("hnsw")
+    assert db.save_index()
+    second = _assert_consistent(tmp_path)
+    assert first["fingerprint"] == second["fingerprint"]
+    assert first["build_id"] != second["build_id"]